@@ -1,52 +1,85 @@
 
 import streamlit as st
 import pandas as pd
-import os
-import openai
-import seaborn as sns
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
-from dotenv import load_dotenv
-from statsmodels.tsa.arima.model import ARIMA
 
+import func_cache
 import func_common
-
-def preprocessing_data(data):
-    # Data preprocessing
-    data['travel_date'] = pd.to_datetime(data['travel_date'])
-    data['year'] = data['travel_date'].dt.year
-    return data
+import func_context
+import func_figure
+import func_llm
+import func_llmpool
+import func_dataset
+import func_downsample
+import func_rollup
+
+# Loaded on first use, the figure only when it is not cached
+plt = func_common.lazy_import('matplotlib.pyplot')
+func_chart = func_common.lazy_import('func_chart')
 
 def chat_with_openai(user_input,data):
-    prompt = f"You are an assistant that can analyze the following data:\n{data}\nUser: {user_input}\nAssistant:"
-    response = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": prompt}
-        ]
-    )
-    return response['choices'][0]['message']['content']
+    # Token-budgeted summary of the data instead of the DataFrame repr
+    context = func_context.build_context(data, question=user_input)
+    prompt = f"You are an assistant that can analyze the following data:\n{context}\nUser: {user_input}\nAssistant:"
+    # Answers are cached per prompt and dataset (func_llm)
+    return func_llm.chat_openai([
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": prompt}
+    ], dataset=data)
+
+# Streamed answer to the prompt, with LLM_HEDGE=1 from the first of OpenAI
+# and Gemini to answer (func_llm)
+def stream_answer(prompt, data):
+    try:
+        if func_llm.LLM_HEDGE:
+            yield from func_llm.stream_first(prompt, dataset=data, max_tokens=200, temperature=0.7)
+        else:
+            yield from func_llm.stream_openai([{"role": "user", "content": prompt}], dataset=data,
+                                              max_tokens=200, n=1, stop=None, temperature=0.7)
+    except Exception as e:
+        yield f"An error occurred: {str(e)}"
+
+# Tourists and revenue by region and yearly totals, from the rollup cube when
+# data is the tourism store
+@func_cache.memoize
+def basic_statistics(data):
+    cube = func_rollup.as_rollup(data)
+    if cube is not None:
+        region_totals = cube.region_totals(['no_tourist_all', 'revenue_all'])
+        tourists_by_region = pd.Series(region_totals[0], index=cube.regions.rename('region_eng'), name='no_tourist_all')
+        revenue_by_region = pd.Series(region_totals[1], index=cube.regions.rename('region_eng'), name='revenue_all')
+        yearly_data = cube.sum_by_year(['no_tourist_all', 'revenue_all']).set_index('year')
+    else:
+        data = func_dataset.as_dataset(data).frame(['year', 'region_eng', 'no_tourist_all', 'revenue_all'])
+        tourists_by_region = data.groupby('region_eng', observed=True)['no_tourist_all'].sum()
+        revenue_by_region = data.groupby('region_eng', observed=True)['revenue_all'].sum()
+        yearly_data = data.groupby('year').agg({'no_tourist_all': 'sum', 'revenue_all': 'sum'})
+    return tourists_by_region, revenue_by_region, yearly_data
+
+# Long series are downsampled to the width of the figure (func_downsample)
+def draw_yearly_tourists(yearly_data, x_range=None):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    func_chart.line_chart(ax, yearly_data.reset_index(), yearly_data.index.name, 'no_tourist_all', unit='million', x_range=x_range)
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Number of Tourists (M:Million)')
+    ax.set_title('Yearly Tourist Numbers')
+    return fig
 
 def integrate_openai(data):
 
-    # Load environment variables from .env file
-    load_dotenv()
-
-    # Set up OpenAI API key
-    openai.api_key = os.getenv("OPENAI_API_KEY")
+    # .env and the API keys are loaded once per process (func_llmpool)
+    func_llmpool.configure()
 
     # AI-powered insights
     st.header('OpenAI Integration')
     st.write("Integrate to openai api to anlyze insights the Thailand domestic tourism data set.")
 
-    data = preprocessing_data(data)
-    st.dataframe(data)
+    # The table is a new frame over the shared dataset (wide view of the store)
+    # with the parsed date and the year, the caller's data is not modified.
+    tourists_by_region, revenue_by_region, yearly_data = basic_statistics(data)
+    st.dataframe(func_dataset.as_dataset(data).frame(derived=['year']))
     
     # Basic statistics
     st.header('Basic Statistics')
-    tourists_by_region = data.groupby('region_eng')['no_tourist_all'].sum()
-    revenue_by_region = data.groupby('region_eng')['revenue_all'].sum()
 
     col1, col2 = st.columns(2)
 
@@ -59,42 +92,26 @@ def integrate_openai(data):
 
     # Time series analysis
     st.header('Time Series Analysis')
-    yearly_data = data.groupby('year').agg({'no_tourist_all': 'sum', 'revenue_all': 'sum'})
     st.write(yearly_data)
 
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.plot(yearly_data.index, yearly_data['no_tourist_all'], marker='o')
-    ax.set_xlabel('Year')
-    ax.set_ylabel('Number of Tourists (M:Million)')
-    ax.set_title('Yearly Tourist Numbers')
-    ax.yaxis.set_major_formatter(ticker.FuncFormatter(func_common.millions_formatter))
-    st.pyplot(fig)
+    x_range = func_downsample.zoom_range("Years", yearly_data.index, key='openai_trend_range')
+    func_figure.show(draw_yearly_tourists, yearly_data, x_range=x_range)
 
     # AI-powered insights
     st.header('AI-Powered Insights')
 
+    # Regions, yearly trend, recovery, rankings and outliers within the token
+    # budget of func_context
     prompt = f"""
     Analyze the following tourism data and provide insights:
-    Total tourists by region: {tourists_by_region.to_dict()}
-    Total revenue by region: {revenue_by_region.to_dict()}
-    Yearly tourist numbers: {yearly_data['no_tourist_all'].to_dict()}
+    {func_context.build_context(data)}
 
     Provide 3-5 key insights about the tourism trends in Thailand based on this data.
     """
 
-    response = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "user", "content": prompt}
-        ],
-        max_tokens=200,
-        n=1,
-        stop=None,
-        temperature=0.7,
-    )
-
-    # Accessing the content correctly
-    st.write(response.choices[0].message['content'].strip())
+    # The insights only depend on the dataset, reruns are answered from the
+    # response cache (func_llm). New answers are shown as they stream in.
+    st.write_stream(stream_answer(prompt, data))
 
     # User input for specific analysis
     st.header('Tourist Analysis')
@@ -102,18 +119,7 @@ def integrate_openai(data):
 
     if user_question:
         # ai_prompt = f"Based on the Thailand tourism data provided earlier, answer the following question: {user_question}"
-        prompt = f"You are an assistant that can analyze the following data:\n{data}\nUser: {user_question}\nAssistant:"
+        context = func_context.build_context(data, question=user_question)
+        prompt = f"You are an assistant that can analyze the following data:\n{context}\nUser: {user_question}\nAssistant:"
     
-        response = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo",
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=200,
-            n=1,
-            stop=None,
-            temperature=0.7,
-        )
-
-        # Accessing the content correctly
-        st.write(response.choices[0].message['content'].strip())
\ No newline at end of file
+        st.write_stream(stream_answer(prompt, data))
\ No newline at end of file
@@ -1,19 +1,27 @@
 import pandas as pd
 import streamlit as st
 import plotly.express as px
-import google.generativeai as genai
-from dotenv import load_dotenv
 import os
-import threading
+
+import func_context
+import func_dataset
+import func_export
+import func_llm
+import func_llmpool
+
+# HTML export of the charts: 'shared' (one file per chart) or 'report' (one
+# file with every chart), with EXPORT_COMPRESS=1 also gzip compressed copies
+EXPORT_DIR = os.getenv('EXPORT_DIR', 'export')
+EXPORT_MODE = os.getenv('EXPORT_MODE', 'shared')
+EXPORT_COMPRESS = os.getenv('EXPORT_COMPRESS', '0') == '1'
 
 # Load CSV data into a DataFrame
 def load_csv(file_path):
     return pd.read_csv(file_path)
 
 def clean_data(data):
-    # Convert travel_date to datetime
-    data['travel_date'] = pd.to_datetime(data['travel_date'])
-    return data
+    # Frame with travel_date converted to datetime, data itself is not modified
+    return func_dataset.as_dataset(data).frame()
 
 def get_summary(data):
 
@@ -67,11 +75,14 @@ def display_streamlit_app(summary,region_summary,top_provinces_tourists,top_prov
 
     fig_region,fig_revenue,fig_top_tourists,fig_top_revenue = create_visualize(region_summary,top_provinces_tourists,top_provinces_revenue)
 
-    # Export figures to HTML for visualization
-    fig_region.write_html("region_tourists.html")
-    fig_revenue.write_html("region_revenue.html")
-    fig_top_tourists.write_html("top_provinces_tourists.html")
-    fig_top_revenue.write_html("top_provinces_revenue.html")
+    # Export figures to HTML for visualization, sharing one plotly.js file.
+    # Charts whose spec is unchanged are not written again.
+    func_export.export_figures({
+        "region_tourists": fig_region,
+        "region_revenue": fig_revenue,
+        "top_provinces_tourists": fig_top_tourists,
+        "top_provinces_revenue": fig_top_revenue,
+    }, directory=EXPORT_DIR, mode=EXPORT_MODE, compress=EXPORT_COMPRESS)
 
 def create_visualize(region_summary,top_provinces_tourists,top_provinces_revenue):
     fig_region = px.bar(region_summary, x='region_eng', y='no_tourist_all', title='Total Tourists by Region', labels={'no_tourist_all': 'Number of Tourists', 'region_eng': 'Region'})
@@ -91,58 +102,34 @@ def create_visualize(region_summary,top_provinces_tourists,top_provinces_revenue
 
     return fig_region,fig_revenue,fig_top_tourists,fig_top_revenue
 
-# Function to interact with Gemini API
-def chat_with_gemini(prompt, result_container):
-    model = genai.GenerativeModel('gemini-1.5-flash')
-    chat = model.start_chat(history=[])
-
+# Function to interact with Gemini API, the answer is streamed in chunks and
+# cached per prompt and dataset (func_llm). With LLM_HEDGE=1 OpenAI is asked
+# too when Gemini is slow to answer.
+def chat_with_gemini(prompt, dataset=None):
     try:
-        response = chat.send_message(prompt)
-        result_container.append(response.text)
+        if func_llm.LLM_HEDGE:
+            yield from func_llm.stream_first(prompt, providers=('gemini', 'openai'), dataset=dataset)
+        else:
+            yield from func_llm.stream_gemini(prompt, dataset=dataset)
     except Exception as e:
-        result_container.append(f"An error occurred: {str(e)}")
+        yield f"An error occurred: {str(e)}"
 
-def integrate_gemini(summary,region_summary,top_provinces_tourists,top_provinces_revenue):
+def integrate_gemini(data):
     
-    # Load environment variables from .env file
-    load_dotenv()
+    # .env and the API keys are loaded once per process (func_llmpool)
+    func_llmpool.configure()
 
-    GOOGLE_API_KEY = os.getenv("GEMINI_API_KEY")
-    genai.configure(api_key=GOOGLE_API_KEY)
-
-    # Prepare the prompt for Gemini AI
+    # Prepare the prompt for Gemini AI, the data is summarised within the
+    # token budget of func_context
     prompt = f"""
     Analyze the following tourism data and provide key insights:
 
-    Overall Summary:
-    {summary}
-
-    Regional Insights:
-    {region_summary.to_string()}
-
-    Top Provinces by Tourists:
-    {top_provinces_tourists.to_string()}
-
-    Top Provinces by Revenue:
-    {top_provinces_revenue.to_string()}
+    {func_context.build_context(data)}
     """
 
-    # Generate insights using Gemini AI
-    result_container = []
-
-    # Start a thread to handle the API call
-    thread = threading.Thread(target=chat_with_gemini, args=(prompt, result_container))
-    thread.start()
-
-    # Wait for the thread to complete with a timeout
-    thread.join(timeout=1000)  # Set your desired timeout here
-
-    if thread.is_alive():
-        st.write("The request is taking too long. Please try again later.")
-        thread.join()  # Optionally wait for the thread to finish if needed
-    else:
-        st.write("Gemini API Response:")
-        st.write(result_container[0])
+    # Generate insights using Gemini AI, shown as the answer streams in
+    st.write("Gemini API Response:")
+    st.write_stream(chat_with_gemini(prompt, data))
 
 # Main function to run the analysis and get insights from Gemini API
 def main():
@@ -169,7 +156,7 @@ def main():
     display_streamlit_app(summary,region_summary,top_provinces_tourists,top_provinces_revenue)
 
     ### Integrate the analysis results with Gemini AI API
-    integrate_gemini(summary,region_summary,top_provinces_tourists,top_provinces_revenue)
+    integrate_gemini(data)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,105 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Import and cold start benchmark of the Streamlit app.
+#
+# Every run is a fresh interpreter with -X importtime, so the numbers are what
+# a new worker pays before it can serve its first page. For each target the
+# median wall time of the runs is reported together with the modules that
+# take the most time (median over the runs, in milliseconds).
+#
+#   python benchmark/bench_startup.py                 # main and every page
+#   python benchmark/bench_startup.py main --runs 10
+#   python benchmark/bench_startup.py main:run        # import and render the Dataset page
+#
+# A target is a module name, "<module>:run" also calls its main() (Streamlit
+# runs in bare mode, without a server).
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_TARGETS = ['main', 'main:run', 'exploratory', 'insights', 'forecast', 'aiintegration']
+
+def target_code(target):
+    module, _, action = target.partition(':')
+    if action == 'run':
+        return f"import {module}; {module}.main()"
+    return f"import {module}"
+
+# Parse "import time: self [us] | cumulative | imported package" lines
+def parse_importtime(stderr):
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return modules
+
+def run_once(target):
+    env = dict(os.environ, PYTHONWARNINGS='ignore')
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', target_code(target)],
+                            cwd=ROOT_DIR, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"{target} failed:\n{result.stderr[-2000:]}")
+    return wall, parse_importtime(result.stderr)
+
+def bench(target, runs, top):
+    walls, self_times, cumulative_times, depths = [], {}, {}, {}
+    for _ in range(runs):
+        wall, modules = run_once(target)
+        walls.append(wall)
+        for name, (self_us, cumulative_us, depth) in modules.items():
+            self_times.setdefault(name, []).append(self_us)
+            cumulative_times.setdefault(name, []).append(cumulative_us)
+            depths[name] = depth
+
+    def median_ms(values):
+        return round(statistics.median(values) / 1000, 1)
+
+    # Top level imports are the ones the target pulls in directly
+    top_level = sorted((name for name in depths if depths[name] <= 1), key=lambda name: -statistics.median(cumulative_times[name]))
+    heaviest = sorted(self_times, key=lambda name: -statistics.median(self_times[name]))
+    return {
+        'target': target,
+        'runs': runs,
+        'wall_ms': round(statistics.median(walls) * 1000, 1),
+        'wall_min_ms': round(min(walls) * 1000, 1),
+        'modules': len(depths),
+        'top_level_cumulative_ms': {name: median_ms(cumulative_times[name]) for name in top_level[:top]},
+        'self_ms': {name: median_ms(self_times[name]) for name in heaviest[:top]},
+    }
+
+def print_report(report):
+    print(f"{report['target']}: {report['wall_ms']} ms median wall ({report['wall_min_ms']} ms min, "
+          f"{report['runs']} runs, {report['modules']} modules)")
+    print("  cumulative import time of direct imports:")
+    for name, ms in report['top_level_cumulative_ms'].items():
+        print(f"    {ms:9.1f} ms  {name}")
+    print("  heaviest modules (self time):")
+    for name, ms in report['self_ms'].items():
+        print(f"    {ms:9.1f} ms  {name}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Import and cold start benchmark of the Streamlit app")
+    parser.add_argument('targets', nargs='*', default=DEFAULT_TARGETS)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--json', help="also write the reports to this file")
+    args = parser.parse_args()
+
+    reports = [bench(target, args.runs, args.top) for target in args.targets]
+    for report in reports:
+        print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, indent=1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from aiohttp import web
+
+# Local stand-in for the OpenAI and Gemini APIs, to try the AI pages and
+# func_llmclient without keys or network. Answers are canned, the delay,
+# failure rate and hang rate are set on the command line. tests/test_llmclient.py
+# runs the client against it.
+#
+#   python example/llm_standin.py --port 8808 --delay 0.2 --fail-rate 0.3 --hang-rate 0.1
+#   OPENAI_API_BASE=http://localhost:8808/v1 GEMINI_API_ENDPOINT=http://localhost:8808 \
+#   OPENAI_API_KEY=test GEMINI_API_KEY=test streamlit run main.py
+
+ANSWER = "Stand-in answer: tourism in Thailand recovered strongly after 2021."
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI and Gemini APIs")
+    parser.add_argument('--port', type=int, default=8808)
+    parser.add_argument('--delay', type=float, default=0.1, help="seconds before every answer")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument('--hang-rate', type=float, default=0.0, help="share of requests that never answer")
+    parser.add_argument('--fail-first', type=int, default=0, help="number of first requests answered with 503")
+    return parser.parse_args()
+
+# Delay, failure or hang of one request, None when it should be answered
+async def misbehave(request):
+    settings = request.app['settings']
+    request.app['requests'] += 1
+    if request.app['requests'] <= settings.fail_first:
+        return web.json_response({'error': {'message': "Stand-in warming up", 'type': 'server_error', 'code': 503}}, status=503)
+    if random.random() < settings.hang_rate:
+        await asyncio.sleep(3600)
+    await asyncio.sleep(settings.delay)
+    if random.random() < settings.fail_rate:
+        return web.json_response({'error': {'message': "Stand-in overloaded", 'type': 'server_error', 'code': 503}}, status=503)
+    return None
+
+async def chat_completions(request):
+    body = await request.json()
+    failure = await misbehave(request)
+    if failure is not None:
+        return failure
+
+    if not body.get('stream'):
+        return web.json_response({
+            'id': 'chatcmpl-standin', 'object': 'chat.completion', 'created': int(time.time()), 'model': body['model'],
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ANSWER}, 'finish_reason': 'stop'}],
+        })
+
+    response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+    await response.prepare(request)
+    for word in ANSWER.split(' '):
+        chunk = {'id': 'chatcmpl-standin', 'object': 'chat.completion.chunk', 'model': body['model'],
+                 'choices': [{'index': 0, 'delta': {'content': word + ' '}, 'finish_reason': None}]}
+        await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await asyncio.sleep(0.02)
+    await response.write(b"data: [DONE]\n\n")
+    return response
+
+def gemini_candidate(text, finish_reason=None):
+    candidate = {'content': {'role': 'model', 'parts': [{'text': text}]}, 'index': 0}
+    if finish_reason:
+        candidate['finishReason'] = finish_reason
+    return {'candidates': [candidate]}
+
+async def generate_content(request):
+    failure = await misbehave(request)
+    if failure is not None:
+        return failure
+    return web.json_response(gemini_candidate(ANSWER, 'STOP'))
+
+# The REST client streams with alt=json, a JSON array written chunk by chunk
+async def stream_generate_content(request):
+    failure = await misbehave(request)
+    if failure is not None:
+        return failure
+
+    response = web.StreamResponse(headers={'Content-Type': 'application/json'})
+    await response.prepare(request)
+    words = ANSWER.split(' ')
+    for i, word in enumerate(words):
+        last = i == len(words) - 1
+        chunk = json.dumps(gemini_candidate(word + ('' if last else ' '), 'STOP' if last else None))
+        await response.write((('[' if i == 0 else ',') + chunk + (']' if last else '')).encode())
+        await asyncio.sleep(0.02)
+    return response
+
+# Number of requests so far, for tests
+async def stats(request):
+    return web.json_response({'requests': request.app['requests']})
+
+def make_app(settings):
+    app = web.Application()
+    app['settings'] = settings
+    app['requests'] = 0
+    app.router.add_post('/v1/chat/completions', chat_completions)
+    app.router.add_post('/v1beta/models/{model}:generateContent', generate_content)
+    app.router.add_post('/v1beta/models/{model}:streamGenerateContent', stream_generate_content)
+    app.router.add_get('/standin/stats', stats)
+    return app
+
+if __name__ == '__main__':
+    args = parse_args()
+    web.run_app(make_app(args), port=args.port)
@@ -1,5 +1,7 @@
 import func_common
+import func_labels
 import func_preprocessing
+import func_ranking
 import func_visualization
 
 import streamlit as st
@@ -8,11 +10,8 @@ from annotated_text import annotated_text
 def visualize_region(data):
     # Regional Analysis
 
-    ## Aggregated Regional Data By No of Tourists
-    sum_by_tourist_regional_data = func_preprocessing.sum_by_region_tourist(data)
-
-    ## Aggregated Regional Data By Revenue
-    sum_by_revenue_regional_data = func_preprocessing.sum_by_region_revenue(data)
+    ## Aggregated Regional Data By No of Tourists and By Revenue, in one pass
+    sum_by_tourist_regional_data, sum_by_revenue_regional_data = func_preprocessing.sum_by_region_tourist_revenue(data)
 
     col_tourist,col_revenue = st.columns(2)
     col_tourist.write(sum_by_tourist_regional_data)
@@ -41,8 +40,31 @@ def visualize_top_province(data):
     ## Plot function for tourists and revenue distribution by province
     func_visualization.plot_province_distribution(sum_by_tourist_province_data,sum_by_revenue_province_data)
 
+    ## Rolling leaderboard needs the ranking engine of the tourism store
+    ranking = func_ranking.as_ranking(data)
+    if ranking is not None:
+        visualize_leaderboard(ranking, TOP_PROVINCE)
+
     # Insights
     st.subheader("Insight")
     annotated_text(
         ("Bangkok Dominance: ","Top Performing Province"), 
         "The capital city is the primary driver of Thailand's domestic tourism, leading in both tourist numbers and revenue generation.")
+
+# Rolling leaderboard over any metric, including derived ones like revenue per
+# tourist, answered by the ranking engine of the tourism store
+def visualize_leaderboard(ranking, top):
+    st.subheader("Rolling 12-Month Leaderboard")
+
+    metrics = ['no_tourist_all', 'revenue_all'] + list(func_ranking.DERIVED_METRICS)
+    months = [str(month) for month in ranking.index.dates.to_period('M').unique()[11:]]
+    if not months:
+        return
+
+    col_metric, col_month = st.columns(2)
+    metric = col_metric.selectbox("Metric", metrics, format_func=func_labels.METRIC_LABELS.get)
+    end = col_month.select_slider("12 months ending", options=months, value=months[-1])
+
+    leaderboard = ranking.rolling_top_k(metric, top, 12, end).reset_index(drop=True)
+    leaderboard.index = leaderboard.index + 1
+    st.write(leaderboard.rename(columns={metric: func_labels.METRIC_LABELS.get(metric)}))
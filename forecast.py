@@ -1,15 +1,59 @@
 
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
 
+import func_cache
 import func_common
+import func_figure
+import func_dataset
+import func_downsample
+import func_rollup
+
+# Loaded on the first forecast or figure that is not cached
+holtwinters = func_common.lazy_import('statsmodels.tsa.holtwinters')
+plt = func_common.lazy_import('matplotlib.pyplot')
+func_chart = func_common.lazy_import('func_chart')
+
+# Total tourists and revenue per year, from the rollup cube when data is the
+# tourism store
+@func_cache.memoize
+def sum_by_year(data):
+    cube = func_rollup.as_rollup(data)
+    if cube is not None:
+        return cube.sum_by_year(['no_tourist_all', 'revenue_all'])
+
+    data = func_dataset.as_dataset(data).frame(['year', 'no_tourist_all', 'revenue_all'])
+    return data.groupby('year').agg({'no_tourist_all': 'sum', 'revenue_all': 'sum'}).reset_index()
+
+# Forecast tourists and revenue for the given years using Exponential Smoothing
+@func_cache.memoize
+def forecast_annual(annual_data, forecast_years):
+    model_tourists = holtwinters.ExponentialSmoothing(annual_data['no_tourist_all'], trend='add', seasonal=None).fit()
+    model_revenue = holtwinters.ExponentialSmoothing(annual_data['revenue_all'], trend='add', seasonal=None).fit()
 
-def preprocessing_data(data):
-    data['travel_date'] = pd.to_datetime(data['travel_date'])
-    return data
+    forecast_tourists = model_tourists.forecast(len(forecast_years))
+    forecast_revenue = model_revenue.forecast(len(forecast_years))
+
+    # Combine results into a DataFrame
+    forecast_data = pd.DataFrame({
+        'year': forecast_years,
+        'forecast_tourists': forecast_tourists,
+        'forecast_revenue': forecast_revenue
+    })
+    return forecast_data
+
+# Historical and forecast values of one column, rendered through the figure
+# cache (func_figure), long histories are downsampled (func_downsample)
+def draw_forecast(annual_data, forecast_data, column, forecast_column, name, title, ylabel, unit, x_range=None):
+    fig, ax = plt.subplots(figsize=(10, 5))
+    func_chart.line_chart(ax, annual_data, 'year', column, unit=unit, label=f'Historical {name}')
+    func_chart.line_chart(ax, forecast_data, 'year', forecast_column, unit=unit, label=f'Forecast {name}', x_range=x_range)
+    ax.set_title(title)
+    ax.set_xlabel('Year')
+    ax.set_ylabel(ylabel)
+    ax.legend()
+    ax.grid()
+    return fig
 
 def forecast_covid(data):
 
@@ -17,27 +61,11 @@ def forecast_covid(data):
     st.title("Covid Recovery: Tourism Trends and Forecast")
     st.write("This application analyzes historical tourism data from 2019 to 2023 and forecasts trends for 2024–2026.")
 
-    data = preprocessing_data(data)
-
     # Group by year and calculate total tourists and revenue
-    data['year'] = data['travel_date'].dt.year
-    annual_data = data.groupby('year').agg({'no_tourist_all': 'sum', 'revenue_all': 'sum'}).reset_index()
-
-    # Forecasting using Exponential Smoothing
-    model_tourists = ExponentialSmoothing(annual_data['no_tourist_all'], trend='add', seasonal=None).fit()
-    model_revenue = ExponentialSmoothing(annual_data['revenue_all'], trend='add', seasonal=None).fit()
+    annual_data = sum_by_year(data)
 
     # Forecast for the next 3 years (2024-2026)
-    forecast_years = [2024, 2025, 2026]
-    forecast_tourists = model_tourists.forecast(len(forecast_years))
-    forecast_revenue = model_revenue.forecast(len(forecast_years))
-
-    # Combine results into a DataFrame
-    forecast_data = pd.DataFrame({
-        'year': forecast_years,
-        'forecast_tourists': forecast_tourists,
-        'forecast_revenue': forecast_revenue
-    })
+    forecast_data = forecast_annual(annual_data, [2024, 2025, 2026])
 
     # Display Historical Data
     st.subheader("Historical Data (2019–2023)")
@@ -47,31 +75,18 @@ def forecast_covid(data):
     st.subheader("Forecast Data (2024–2026)")
     st.write(forecast_data)
 
+    # Zoom into a range of a long history (no slider for a few years)
+    x_range = func_downsample.zoom_range("Years", pd.concat([annual_data['year'], forecast_data['year']]), key='forecast_range')
+
     # Plot Tourist Numbers Forecast
     st.subheader("Tourist Numbers Forecast")
-    fig1, ax1 = plt.subplots(figsize=(10, 5))
-    ax1.plot(annual_data['year'], annual_data['no_tourist_all'], label='Historical Tourists', marker='o')
-    ax1.plot(forecast_data['year'], forecast_data['forecast_tourists'], label='Forecast Tourists', marker='o')
-    ax1.set_title('Tourist Numbers Forecast')
-    ax1.set_xlabel('Year')
-    ax1.set_ylabel('Number of Tourists')
-    ax1.legend()
-    ax1.grid()
-    ax1.yaxis.set_major_formatter(ticker.FuncFormatter(func_common.millions_formatter))
-    st.pyplot(fig1)
+    func_figure.show(draw_forecast, annual_data, forecast_data, column='no_tourist_all', forecast_column='forecast_tourists',
+                     name='Tourists', title='Tourist Numbers Forecast', ylabel='Number of Tourists', unit='million', x_range=x_range)
 
     # Plot Revenue Forecast
     st.subheader("Revenue Forecast")
-    fig2, ax2 = plt.subplots(figsize=(10, 5))
-    ax2.plot(annual_data['year'], annual_data['revenue_all'], label='Historical Revenue', marker='o')
-    ax2.plot(forecast_data['year'], forecast_data['forecast_revenue'], label='Forecast Revenue', marker='o')
-    ax2.set_title('Revenue Forecast')
-    ax2.set_xlabel('Year')
-    ax2.set_ylabel('Revenue (in Baht)')
-    ax2.legend()
-    ax2.grid()
-    ax2.yaxis.set_major_formatter(ticker.FuncFormatter(func_common.billions_formatter))
-    st.pyplot(fig2)
+    func_figure.show(draw_forecast, annual_data, forecast_data, column='revenue_all', forecast_column='forecast_revenue',
+                     name='Revenue', title='Revenue Forecast', ylabel='Revenue (in Baht)', unit='billion', x_range=x_range)
 
     st.header("AI Integration")
     st.write("Uses Exponential Smoothing for accurate time-series forecasting.")
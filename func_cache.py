@@ -0,0 +1,376 @@
+import functools
+import hashlib
+import importlib.util
+import inspect
+import os
+import pickle
+import threading
+import time
+import types
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import func_common
+import func_dataset
+import func_rollup
+import func_store
+
+# Result cache for the page computations.
+#
+# memoize() wraps an aggregation or modelling function so a call with the same
+# data and arguments returns the stored result. The key is the function plus
+# a fingerprint of every argument: the content hash of a DataFrame, tourism
+# store or rollup cube, the repr of plain values. The function part covers its
+# bytecode, constants and defaults, the module constants it reads and the
+# code of the functions of this repository it calls, so editing any of them
+# (or an environment setting read into a constant) misses the disk cache.
+# Dependencies it cannot see, e.g. on classes, are covered by bumping the
+# module's CACHE_VERSION. Results
+# live in an in-process LRU with a byte budget and, when RESULT_CACHE_DIR is
+# set, in pickle files there that survive server restarts.
+#
+# Cached frames are shared by every session, callers get a shallow copy that
+# copy on write keeps from changing the cached one.
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Content hash of a DataFrame, the hash is kept per frame object
+def frame_fingerprint(data):
+    def build(frame):
+        digest = hashlib.sha256()
+        digest.update(repr(list(frame.columns)).encode())
+        digest.update(repr([str(dtype) for dtype in frame.dtypes]).encode())
+        digest.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+        return digest.hexdigest()
+    return func_dataset.cached_per_frame(_FINGERPRINTS, data, build)
+
+def array_digest(digest, *arrays):
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(str(array.dtype).encode())
+        digest.update(repr(array.shape).encode())
+        digest.update(array.tobytes())
+
+def store_fingerprint(store):
+    def build(store):
+        digest = hashlib.sha256()
+        digest.update(repr(store.metrics).encode())
+        digest.update(frame_fingerprint(store.provinces).encode())
+        array_digest(digest, store.dates.asi8, store.values)
+        return digest.hexdigest()
+    return store.derived('fingerprint', build)
+
+# A cube can still be added to, so its small aggregate arrays are hashed on
+# every call
+def cube_fingerprint(cube):
+    digest = hashlib.sha256()
+    digest.update(repr(cube.metrics).encode())
+    digest.update(repr(list(cube.months.astype(str))).encode())
+    digest.update(frame_fingerprint(cube.provinces).encode())
+    array_digest(digest, cube.sums, cube.counts)
+    return digest.hexdigest()
+
+_FINGERPRINTS = {}
+
+# Fingerprint of one argument, None when it cannot be fingerprinted
+def fingerprint(value):
+    if isinstance(value, func_store.TourismStore):
+        return 'store:' + store_fingerprint(value)
+    if isinstance(value, func_rollup.RollupCube):
+        return 'cube:' + cube_fingerprint(value)
+    if isinstance(value, pd.DataFrame):
+        return 'frame:' + frame_fingerprint(value)
+    if isinstance(value, pd.Series):
+        return 'series:' + frame_fingerprint(value.to_frame())
+    if value is None or isinstance(value, (bool, int, float, str, np.integer, np.floating, pd.Timestamp, pd.Period)):
+        return repr(value)
+    if isinstance(value, (list, tuple)):
+        parts = [fingerprint(item) for item in value]
+        return None if None in parts else f"{type(value).__name__}({','.join(parts)})"
+    return None
+
+# Approximate memory held by a result
+def result_size(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(result_size(item) for item in value)
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+# Copy of a result that can be handed to a caller
+def share(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    if isinstance(value, tuple):
+        return tuple(share(item) for item in value)
+    if isinstance(value, list):
+        return [share(item) for item in value]
+    return value
+
+# Byte-budgeted LRU with an optional pickle directory. With ttl (seconds)
+# entries older than that are dropped from both tiers.
+class ResultCache:
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, directory=None, ttl=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+        self.bypasses = 0
+        self.expirations = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'disk_hits': self.disk_hits,
+                'bypasses': self.bypasses,
+                'expirations': self.expirations,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+            }
+
+    def _expired(self, stored_at):
+        return self.ttl is not None and time.time() - stored_at > self.ttl
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    # Return (True, value) for a cached key, (False, None) otherwise
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self._expired(entry[2]):
+                self.bytes -= self.entries.pop(key)[1]
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[0]
+
+        found, value, stored_at = self._read_disk(key)
+        with self.lock:
+            if found:
+                self.disk_hits += 1
+                self._put_memory(key, value, stored_at)
+            else:
+                self.misses += 1
+        return found, value
+
+    def put(self, key, value):
+        with self.lock:
+            self._put_memory(key, value)
+        self._write_disk(key, value)
+
+    # Drop a key from both tiers
+    def delete(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.bytes -= entry[1]
+        if self.directory is not None:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _put_memory(self, key, value, stored_at=None):
+        size = result_size(value)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.bytes -= self.entries.pop(key)[1]
+        self.entries[key] = (value, size, time.time() if stored_at is None else stored_at)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self.entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.pkl')
+
+    # (found, value, time it was written)
+    def _read_disk(self, key):
+        if self.directory is None:
+            return False, None, None
+        path = self._path(key)
+        try:
+            stored_at = os.path.getmtime(path)
+            if self._expired(stored_at):
+                os.remove(path)
+                with self.lock:
+                    self.expirations += 1
+                return False, None, None
+            with open(path, 'rb') as f:
+                return True, pickle.load(f), stored_at
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return False, None, None
+
+    def _write_disk(self, key, value):
+        if self.directory is None:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Write to a temp file first so readers never see a half written file
+            tmp_path = f'{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except (OSError, pickle.PicklingError, TypeError, AttributeError):
+            pass
+
+RESULT_CACHE = ResultCache(
+    max_bytes=int(os.getenv('RESULT_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)),
+    directory=os.getenv('RESULT_CACHE_DIR') or None,
+)
+
+REPOSITORY_DIR = os.path.dirname(os.path.abspath(__file__))
+_CODE_FINGERPRINTS = weakref.WeakKeyDictionary()
+_CODE_LOCK = threading.RLock()
+_PLAIN_TYPES = (type(None), bool, int, float, complex, str, bytes)
+
+# Fingerprint of what the result of func depends on besides its arguments,
+# computed once per function object
+def code_fingerprint(func):
+    with _CODE_LOCK:
+        key = _CODE_FINGERPRINTS.get(func)
+        if key is None:
+            digest = hashlib.sha256()
+            _hash_function(func, digest, set())
+            key = _CODE_FINGERPRINTS[func] = digest.hexdigest()
+        return key
+
+def in_repository(path):
+    return path is not None and os.path.dirname(os.path.abspath(path)) == REPOSITORY_DIR
+
+def _code_objects(code):
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            yield from _code_objects(const)
+
+def _hash_function(func, digest, seen):
+    func = inspect.unwrap(func)
+    digest.update(f'{func.__module__}.{func.__qualname__}'.encode())
+    if id(func) in seen or not in_repository(func.__globals__.get('__file__')):
+        return
+    seen.add(id(func))
+    digest.update(repr(func.__globals__.get('CACHE_VERSION')).encode())
+    _hash_value(func.__defaults__, digest, seen)
+    _hash_value(func.__kwdefaults__, digest, seen)
+    names = []
+    for code in _code_objects(func.__code__):
+        digest.update(code.co_code)
+        digest.update(repr(code.co_names).encode())
+        digest.update(repr([const for const in code.co_consts if not isinstance(const, types.CodeType)]).encode())
+        names += code.co_names
+    # Globals read by the function, and attributes of the modules it uses
+    # (func_rollup.as_rollup) that are functions of this repository
+    modules = []
+    for name in dict.fromkeys(names):
+        if name in func.__globals__:
+            value = func.__globals__[name]
+            digest.update(name.encode())
+            _hash_value(value, digest, seen)
+            module = _repository_module(value)
+            if module is not None:
+                modules.append(module)
+    for module in modules:
+        for name in dict.fromkeys(names):
+            value = getattr(module, name, None)
+            if isinstance(value, types.FunctionType):
+                _hash_function(value, digest, seen)
+
+# The module of value when it is (or lazily imports) a module of this
+# repository, None otherwise
+def _repository_module(value):
+    if isinstance(value, func_common.lazy_import):
+        # Modules of this repository are top level, finding the spec of a
+        # submodule would import its package
+        name = object.__getattribute__(value, '_name')
+        spec = None if '.' in name else importlib.util.find_spec(name)
+        return value._load() if spec is not None and in_repository(spec.origin) else None
+    if isinstance(value, types.ModuleType) and in_repository(getattr(value, '__file__', None)):
+        return value
+    return None
+
+def _hash_value(value, digest, seen):
+    if isinstance(value, _PLAIN_TYPES):
+        digest.update(repr(value).encode())
+    elif isinstance(value, (tuple, list)):
+        digest.update(f'{type(value).__name__}{len(value)}'.encode())
+        for item in value:
+            _hash_value(item, digest, seen)
+    elif isinstance(value, (set, frozenset)):
+        digest.update(repr(sorted(map(repr, value))).encode())
+    elif isinstance(value, dict):
+        digest.update(f'dict{len(value)}'.encode())
+        for name, item in value.items():
+            _hash_value(name, digest, seen)
+            _hash_value(item, digest, seen)
+    elif isinstance(value, func_common.lazy_import):
+        digest.update(f"module {object.__getattribute__(value, '_name')}".encode())
+    elif isinstance(value, types.ModuleType):
+        digest.update(f'module {value.__name__}'.encode())
+    elif isinstance(value, types.FunctionType):
+        _hash_function(value, digest, seen)
+    else:
+        # Classes and other objects by type only
+        digest.update(f'{type(value).__module__}.{type(value).__qualname__}'.encode())
+
+# Key of a call, None when an argument cannot be fingerprinted
+def call_key(func, args, kwargs):
+    names = [''] * len(args) + [f'{name}=' for name in sorted(kwargs)]
+    parts = [fingerprint(value) for value in list(args) + [kwargs[name] for name in sorted(kwargs)]]
+    if None in parts:
+        return None
+    parts = [name + part for name, part in zip(names, parts)]
+    digest = hashlib.sha256()
+    digest.update(f'{func.__module__}.{func.__qualname__}'.encode())
+    digest.update(code_fingerprint(func).encode())
+    digest.update(repr(parts).encode())
+    return digest.hexdigest()
+
+# Decorator that caches the results of a function in cache
+def memoize(func=None, cache=None):
+    if func is None:
+        return lambda func: memoize(func, cache)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        result_cache = RESULT_CACHE if cache is None else cache
+        key = call_key(func, args, kwargs)
+        if key is None:
+            with result_cache.lock:
+                result_cache.bypasses += 1
+            return func(*args, **kwargs)
+
+        found, value = result_cache.get(key)
+        if not found:
+            value = func(*args, **kwargs)
+            result_cache.put(key, value)
+        return share(value)
+    return wrapper
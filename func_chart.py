@@ -0,0 +1,204 @@
+import colorsys
+
+import numpy as np
+import pandas as pd
+
+import func_common
+import func_downsample
+
+# Shared chart builder of the bar and line charts.
+#
+# Bars are drawn with one ax.bar call per hue group and labelled with one
+# ax.bar_label call per group, the label and tick texts come from vectorised
+# formatting of all values at once. The charts look like the seaborn ones
+# they replace (category order, bar widths, desaturated palette, legend and
+# axis labels) without creating a text artist per bar in Python. Above
+# MAX_BAR_LABELS bars the labels are left out, above MAX_BAR_PATCHES the bars
+# are one polygon collection instead of a rectangle per bar and at most
+# MAX_TICK_LABELS categories are named on the x axis, so charts with
+# thousands of bars draw in bounded time.
+
+matplotlib = func_common.lazy_import('matplotlib')
+collections = func_common.lazy_import('matplotlib.collections')
+ticker = func_common.lazy_import('matplotlib.ticker')
+sns = func_common.lazy_import('seaborn')
+
+# unit: (divisor, suffix, thousands separator)
+SCALES = {
+    'thousand': (1e3, 'k', False),
+    'million': (1e6, 'M', False),
+    'billion': (1e9, 'B', True),
+}
+
+MAX_BAR_LABELS = 200
+MAX_BAR_PATCHES = 500
+MAX_TICK_LABELS = 50
+BAR_WIDTH = 0.8
+# seaborn draws bars with desaturated colors
+SATURATION = 0.75
+
+# "1,234" for every non negative integer, built one group of three digits at
+# a time
+def group_digits(ints):
+    text = np.full(len(ints), '', dtype=object)
+    group_count = 1
+    while (ints >= 1000 ** group_count).any():
+        group_count += 1
+    for k in range(group_count - 1, -1, -1):
+        group = (ints // 1000 ** k % 1000).astype(str)
+        present = (ints >= 1000 ** k) | (k == 0)
+        leading = ints < 1000 ** (k + 1)
+        group = np.where(leading, group, np.char.zfill(group, 3))
+        text = np.where(present, np.where(text == '', group, text + ',' + group.astype(object)), text)
+    return text.astype(str)
+
+# Labels like "12M" or "1,234B" for an array of values, the value is cut
+# towards zero like int()
+def scaled_labels(values, unit):
+    divisor, suffix, grouped = SCALES[unit]
+    numbers = np.trunc(np.asarray(values, dtype=np.float64) / divisor)
+    finite = np.isfinite(numbers)
+    ints = np.where(finite, numbers, 0).astype(np.int64)
+    magnitude = np.abs(ints)
+    text = group_digits(magnitude) if grouped else magnitude.astype(str)
+    text = np.where(ints < 0, np.char.add('-', text), text)
+    return np.where(finite, np.char.add(text, suffix), '')
+
+def scaled_formatter(unit):
+    return _formatter_class()(unit)
+
+_FORMATTER_CLASS = []
+
+# The Formatter subclass is created on first use, so importing this module
+# does not load matplotlib
+def _formatter_class():
+    if not _FORMATTER_CLASS:
+        class ScaledFormatter(ticker.Formatter):
+
+            def __init__(self, unit):
+                self.unit = unit
+
+            def __call__(self, x, pos=None):
+                return str(scaled_labels([x], self.unit)[0])
+
+            # All ticks of an axis in one call
+            def format_ticks(self, values):
+                return scaled_labels(values, self.unit).tolist()
+
+        _FORMATTER_CLASS.append(ScaledFormatter)
+    return _FORMATTER_CLASS[0]
+
+def set_unit(axis, unit):
+    axis.set_major_formatter(scaled_formatter(unit))
+
+def desaturate(color, saturation=SATURATION):
+    h, l, s = colorsys.rgb_to_hls(*matplotlib.colors.to_rgb(color))
+    return colorsys.hls_to_rgb(h, l, s * saturation)
+
+# n colors of a named palette, matplotlib colormaps first so seaborn is only
+# loaded for its own palettes (e.g. "pastel")
+def palette_colors(palette, n):
+    if palette is None:
+        colors = matplotlib.rcParams['axes.prop_cycle'].by_key()['color']
+    elif isinstance(palette, (list, tuple)):
+        colors = list(palette)
+    elif palette in matplotlib.colormaps and hasattr(matplotlib.colormaps[palette], 'colors'):
+        colors = list(matplotlib.colormaps[palette].colors)
+    else:
+        colors = list(sns.color_palette(palette, n))
+    return [colors[i % len(colors)] for i in range(n)]
+
+# Categories in the order seaborn places them: order of appearance
+def category_order(values):
+    return pd.unique(np.asarray(values.astype(str), dtype=object)).tolist()
+
+# Bar chart of y by x, with one group of side by side bars per hue value.
+# data has one row per bar (rows of the same bar are averaged, like
+# seaborn's estimator). With a unit the y axis ticks and the bar labels are
+# scaled (e.g. "12M"), label_bars=False leaves the labels out.
+# Returns the bar containers.
+def bar_chart(ax, data, x, y, hue=None, palette=None, color=None, unit=None,
+              label_bars=True, max_labels=MAX_BAR_LABELS, fontsize=7):
+    x_values = data[x].astype(str)
+    categories = category_order(x_values)
+    positions = pd.Index(categories)
+
+    if hue is None:
+        groups = [(None, data[y].groupby(x_values.to_numpy(), sort=False).mean())]
+    else:
+        hue_values = data[hue].astype(str)
+        groups = []
+        for level in category_order(hue_values):
+            selected = (hue_values == level).to_numpy()
+            groups.append((level, data.loc[selected, y].groupby(x_values[selected].to_numpy(), sort=False).mean()))
+
+    if hue is None:
+        colors = [desaturate(color if color is not None else palette_colors(palette, 1)[0])]
+    else:
+        colors = [desaturate(c) for c in palette_colors(palette, len(groups))]
+
+    width = BAR_WIDTH / len(groups)
+    containers = []
+    for i, ((level, heights), bar_color) in enumerate(zip(groups, colors)):
+        offset = -BAR_WIDTH / 2 + width * (i + 0.5) if hue is not None else 0
+        bar_x = positions.get_indexer(heights.index) + offset
+        containers.append(draw_bars(ax, bar_x, heights.to_numpy(), width, bar_color, level))
+
+    # Every category is named up to MAX_TICK_LABELS, then every step-th one
+    step = -(-len(categories) // MAX_TICK_LABELS)
+    ax.set_xticks(range(0, len(categories), step))
+    ax.set_xticklabels(categories[::step])
+    ax.set_xlim(-0.5, len(categories) - 0.5)
+    ax.xaxis.grid(False)
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+    if hue is not None:
+        ax.legend(title=hue)
+
+    if unit is not None:
+        set_unit(ax.yaxis, unit)
+        if label_bars:
+            bar_labels(ax, containers, unit, max_labels=max_labels, fontsize=fontsize)
+    return containers
+
+# Bars centred on x, a BarContainer or, for many bars, one PolyCollection
+def draw_bars(ax, x, heights, width, color, label):
+    if len(x) <= MAX_BAR_PATCHES:
+        return ax.bar(x, heights, width=width, color=color, label=label)
+
+    left, right = x - width / 2, x + width / 2
+    bottom = np.zeros(len(x))
+    heights = np.nan_to_num(heights.astype(np.float64))
+    vertices = np.stack([
+        np.column_stack([left, bottom]), np.column_stack([left, heights]),
+        np.column_stack([right, heights]), np.column_stack([right, bottom]),
+    ], axis=1)
+    bars = collections.PolyCollection(vertices, facecolors=color, edgecolors='none', label=label)
+    ax.add_collection(bars)
+    ax.update_datalim(np.column_stack([np.concatenate([left, right]), np.concatenate([bottom, heights])]))
+    ax.autoscale_view()
+    return bars
+
+def bar_count(bars):
+    return len(bars.get_paths()) if isinstance(bars, collections.PolyCollection) else len(bars)
+
+# Scaled labels on top of the bars, one bar_label call per container
+def bar_labels(ax, containers, unit, max_labels=MAX_BAR_LABELS, fontsize=7):
+    if sum(bar_count(bars) for bars in containers) > max_labels:
+        return
+    for container in containers:
+        ax.bar_label(container, labels=scaled_labels(container.datavalues, unit), fontsize=fontsize)
+
+# Line chart of y by x with point markers, like seaborn's lineplot. Long
+# series are downsampled to the pixel width of the axes (func_downsample),
+# x_range zooms into a part of the series and re-samples it.
+def line_chart(ax, data, x, y, unit=None, marker='o', label=None, x_range=None,
+               method=func_downsample.DOWNSAMPLE_METHOD):
+    line = func_downsample.plot_line(ax, data[x].to_numpy(), data[y].to_numpy(), method=method, marker=marker, label=label)
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+    if unit is not None:
+        set_unit(ax.yaxis, unit)
+    if x_range is not None:
+        ax.set_xlim(x_range)
+    return line
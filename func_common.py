@@ -1,22 +1,144 @@
+import hashlib
+import importlib
+import json
+import os
+
+import numpy as np
 import pandas as pd
 
+import func_snapshot
+
 CSV_FILE_PATH_TH_DOMESTIC_TOUR = 'data/thailand_domestic_tourism.csv'
 CSV_FILE_PATH_TH_DOMESTIC_TOUR_ORG = 'data/thailand_domestic_tourism_original.csv'
 
+# Module that is imported on first attribute access, for heavy dependencies
+# (seaborn, statsmodels, openai, ...) that only some pages or code paths need,
+# e.g. sns = lazy_import('seaborn') at module level
+class lazy_import:
+
+    def __init__(self, name):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_module', None)
+
+    def _load(self):
+        module = object.__getattribute__(self, '_module')
+        if module is None:
+            module = importlib.import_module(object.__getattribute__(self, '_name'))
+            object.__setattr__(self, '_module', module)
+        return module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+# Execution backend of func_preprocessing: 'pandas' (default) or 'sql' for the
+# embedded SQLite backend in func_sql
+PREPROCESSING_BACKEND = os.getenv('PREPROCESSING_BACKEND', 'pandas')
+
+# Declared column types of the tourism CSV files
+# Names and metric variables are categoricals, tourist counts fit in int32 but
+# revenue reaches 1e11 Baht so it needs int64. The long file keeps value as
+# float64 because it mixes ratios with revenue.
+SCHEMA_TH_DOMESTIC_TOUR = {
+    'id': 'int32',
+    'travel_date': 'datetime64[ns]',
+    'province_thai': 'category',
+    'province_eng': 'category',
+    'region_thai': 'category',
+    'region_eng': 'category',
+    'no_tourist_all': 'int32',
+    'no_tourist_foreign': 'int32',
+    'no_tourist_stay': 'int32',
+    'no_tourist_thai': 'int32',
+    'ratio_tourist_stay': 'float32',
+    'revenue_all': 'int64',
+    'revenue_foreign': 'int64',
+    'revenue_thai': 'int64',
+}
+
+SCHEMA_TH_DOMESTIC_TOUR_ORG = {
+    'date': 'datetime64[ns]',
+    'province_thai': 'category',
+    'province_eng': 'category',
+    'region_thai': 'category',
+    'region_eng': 'category',
+    'variable': 'category',
+    'value': 'float64',
+}
+
+# Strip stray whitespace (e.g. "Lopburi ") from a categorical column.
+# Only the categories are touched so the cost depends on the number of
+# distinct names, not on the number of rows.
+def normalise_category(values):
+    values = values.astype('category')
+    stripped = values.cat.categories.str.strip()
+    categories = pd.Index(stripped.unique()).sort_values()
+
+    # Append -1 so missing values (code -1) stay missing after the take
+    codes = np.append(categories.get_indexer(stripped), -1)[values.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codes, categories), index=values.index, name=values.name)
+
+# Cast the columns of a DataFrame to a declared schema
+def apply_schema(data, schema):
+    missing = [name for name in schema if name not in data.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {missing}")
+
+    columns = {}
+    for name, dtype in schema.items():
+        values = data[name]
+        if dtype == 'category':
+            values = normalise_category(values)
+        elif dtype.startswith('datetime64'):
+            values = pd.to_datetime(values, format='ISO8601').astype(dtype)
+        elif dtype.startswith('int') or dtype.startswith('uint'):
+            if values.isna().any():
+                raise ValueError(f"Column {name} has missing values")
+            cast = values.astype(dtype)
+            # Reject fractions and values out of range of the declared type
+            if not np.array_equal(cast.to_numpy(), values.to_numpy()):
+                raise ValueError(f"Column {name} does not fit {dtype}")
+            values = cast
+        else:
+            values = values.astype(dtype)
+        columns[name] = values
+
+    return pd.DataFrame(columns, index=data.index)
+
+def read_csv_with_schema(file_path, schema):
+    # Parse categoricals directly, numbers are parsed as float64 since the
+    # revenue columns mix 5410000.0 and 451830000 and are cast afterwards
+    dtype = {name: ('category' if value == 'category' else 'str') for name, value in schema.items() if value == 'category' or value.startswith('datetime64')}
+    return apply_schema(pd.read_csv(file_path, dtype=dtype), schema)
+
+def schema_key(schema):
+    return 'schema-' + hashlib.sha1(json.dumps(schema, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
 # Load CSV data into a DataFrame
-def load_csv(file_path):
+# The parsed data is kept as a columnar snapshot next to the CSV file, later
+# loads memory-map the snapshot until the CSV file (or the schema) changes.
+def load_csv(file_path, schema=None, use_snapshot=True):
     try:
-        return pd.read_csv(file_path)
+        if schema is None:
+            reader, reader_key = pd.read_csv, 'read_csv'
+        else:
+            reader, reader_key = lambda path: read_csv_with_schema(path, schema), schema_key(schema)
+
+        if use_snapshot:
+            return func_snapshot.load_snapshot(file_path, reader, reader_key)
+        return reader(file_path)
     except Exception as e:
         print(e)
 
 # Load Thailand domestic tourism
 def load_domestic_tourist_csv():
-    return load_csv(CSV_FILE_PATH_TH_DOMESTIC_TOUR)
+    return load_csv(CSV_FILE_PATH_TH_DOMESTIC_TOUR, SCHEMA_TH_DOMESTIC_TOUR)
 
 # Load Thailand domestic tourism original file
 def load_domestic_tourist_org_csv():
-    return load_csv(CSV_FILE_PATH_TH_DOMESTIC_TOUR_ORG)
+    return load_csv(CSV_FILE_PATH_TH_DOMESTIC_TOUR_ORG, SCHEMA_TH_DOMESTIC_TOUR_ORG)
 
 def billions_formatter(y, pos):
     return "{:,}B".format(int(y/1e9))
@@ -0,0 +1,232 @@
+import math
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+import func_cache
+import func_dataset
+import func_rollup
+import func_store
+
+# Compact, token-counted summary of the tourism data for LLM prompts.
+#
+# Instead of the truncated repr of a DataFrame, the prompt gets the sections
+# below, most important first: overview, yearly trend, regions, recovery
+# rates, top and bottom provinces, outlier months and the totals of every
+# province. Sections are added line by line until the token budget
+# (CONTEXT_MAX_TOKENS) is used up, so a small budget keeps the overview and
+# drops the long tail. Provinces named in the question get their own section
+# right after the overview.
+#
+# Tokens are counted with tiktoken when it is installed, otherwise estimated
+# at about four characters per token.
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+CONTEXT_MAX_TOKENS = int(os.getenv('CONTEXT_MAX_TOKENS', 1500))
+TOKEN_ENCODING = 'cl100k_base'
+CHARS_PER_TOKEN = 4
+TOP_PROVINCES = 5
+MAX_OUTLIERS = 10
+# Province months this many robust standard deviations away from the
+# province's typical month are outliers
+OUTLIER_SCORE = 3.5
+
+_ENCODINGS = []
+
+def count_tokens(text):
+    if tiktoken is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    if not _ENCODINGS:
+        _ENCODINGS.append(tiktoken.get_encoding(TOKEN_ENCODING))
+    return len(_ENCODINGS[0].encode(text))
+
+# Short number like 1.23M or 45.6B
+def compact(value):
+    if value is None or not np.isfinite(value):
+        return 'n/a'
+    for divisor, suffix in ((1e12, 'T'), (1e9, 'B'), (1e6, 'M'), (1e3, 'k')):
+        if abs(value) >= divisor:
+            return f'{value / divisor:.3g}{suffix}'
+    return f'{value:.3g}'
+
+def percent(value):
+    return 'n/a' if not np.isfinite(value) else f'{value:+.1f}%'
+
+# Rollup cube of any form of the data, DataFrames become a store once per frame
+def cube_of(data):
+    cube = func_rollup.as_rollup(data)
+    if cube is not None:
+        return cube
+    return func_rollup.as_rollup(func_dataset.cached_per_frame(_FRAME_STORES, data, frame_store))
+
+def frame_store(data):
+    if 'variable' in data.columns:
+        return func_store.TourismStore.from_long(data)
+    return func_store.TourismStore.from_wide(func_dataset.as_dataset(data).frame())
+
+_FRAME_STORES = {}
+
+# Names of a province column, some CSV files pad them with spaces
+def names_of(cube, column):
+    return cube.provinces[column].astype(str).str.strip().to_numpy()
+
+def overview_lines(cube, question=None):
+    totals = cube.sums.sum(axis=(1, 2))
+    total = dict(zip(cube.metrics, totals))
+    lines = [
+        f"Period: {cube.months[0]} to {cube.months[-1]} ({len(cube.months)} months), "
+        f"{len(cube.provinces)} provinces in {len(cube.regions)} regions",
+        f"Tourists: {compact(total.get('no_tourist_all'))} "
+        f"(Thai {compact(total.get('no_tourist_thai'))}, foreign {compact(total.get('no_tourist_foreign'))})",
+        f"Revenue (THB): {compact(total.get('revenue_all'))} "
+        f"(Thai {compact(total.get('revenue_thai'))}, foreign {compact(total.get('revenue_foreign'))})",
+    ]
+    if 'ratio_tourist_stay' in cube.metrics:
+        m = cube.metrics.index('ratio_tourist_stay')
+        lines.append(f"Average stay ratio: {cube.sums[m].sum() / max(cube.counts[m].sum(), 1):.3g}")
+    return lines
+
+def complete_years(cube):
+    months_per_year = pd.Series(cube.months.year).value_counts()
+    return [int(year) for year in cube.years if months_per_year.get(year, 0) == 12]
+
+# Change (%) of the tourists of year against the year before, over the
+# months of the year that both have, so a partial year is not compared with
+# a full one. NaN without common months.
+def year_change(cube, year):
+    monthly = cube.sums[cube.metrics.index('no_tourist_all')].sum(axis=1)
+    years, months = cube.months.year, cube.months.month
+    common = np.intersect1d(months[years == year], months[years == year - 1])
+    current = monthly[(years == year) & np.isin(months, common)].sum()
+    previous = monthly[(years == year - 1) & np.isin(months, common)].sum()
+    return current / previous * 100 - 100 if len(common) and previous else np.nan
+
+def yearly_lines(cube, question=None):
+    totals = cube.year_totals(['no_tourist_all', 'revenue_all'])
+    months_per_year = pd.Series(cube.months.year).value_counts()
+    lines = ["year | tourists | revenue | tourists vs same months of previous year"]
+    for i, year in enumerate(cube.years):
+        partial = '' if months_per_year.get(year, 0) == 12 else f' ({months_per_year.get(year, 0)} months)'
+        lines.append(f"{year}{partial} | {compact(totals[0][i])} | {compact(totals[1][i])} | {percent(year_change(cube, year))}")
+    return lines
+
+def region_lines(cube, question=None):
+    totals = cube.region_totals(['no_tourist_all', 'revenue_all'])
+    lines = ["region | tourists | revenue | revenue per tourist"]
+    for r in np.argsort(-totals[1]):
+        per_tourist = totals[1][r] / totals[0][r] if totals[0][r] else np.nan
+        lines.append(f"{cube.regions[r]} | {compact(totals[0][r])} | {compact(totals[1][r])} | {compact(per_tourist)}")
+    return lines
+
+def recovery_lines(cube, question=None):
+    years = complete_years(cube)
+    if len(years) < 2:
+        return []
+    base_year, year = years[0], years[-1]
+    tourists = cube.recovery_rates('no_tourist_all', base_year, year)
+    revenue = cube.recovery_rates('revenue_all', base_year, year)
+    lines = [f"region | tourists {year} as % of {base_year} | revenue {year} as % of {base_year}"]
+    for region in tourists.sort_values(ascending=False).index:
+        lines.append(f"{region} | {tourists[region]:.0f}% | {revenue[region]:.0f}%")
+    return lines
+
+def province_ranking_lines(cube, question=None):
+    totals = cube.province_totals(['no_tourist_all', 'revenue_all'])
+    names = names_of(cube, 'province_eng')
+    lines = []
+    for label, values in (('tourists', totals[0]), ('revenue', totals[1])):
+        order = np.argsort(-values, kind='stable')
+        top = ', '.join(f"{names[p]} {compact(values[p])}" for p in order[:TOP_PROVINCES])
+        bottom = ', '.join(f"{names[p]} {compact(values[p])}" for p in order[::-1][:TOP_PROVINCES])
+        lines += [f"Top {TOP_PROVINCES} by {label}: {top}", f"Bottom {TOP_PROVINCES} by {label}: {bottom}"]
+    return lines
+
+# Province months far from the province's median month (median absolute
+# deviation), largest scores first
+def outlier_lines(cube, question=None):
+    monthly = cube.sums[cube.metrics.index('no_tourist_all')]
+    median = np.median(monthly, axis=0)
+    mad = np.median(np.abs(monthly - median), axis=0) * 1.4826
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scores = np.where(mad > 0, (monthly - median) / mad, 0.0)
+    months, provinces = np.nonzero(np.abs(scores) >= OUTLIER_SCORE)
+    if len(months) == 0:
+        return []
+    order = np.argsort(-np.abs(scores[months, provinces]), kind='stable')[:MAX_OUTLIERS]
+    names = names_of(cube, 'province_eng')
+    lines = ["province | month | tourists | typical month"]
+    for i in order:
+        m, p = months[i], provinces[i]
+        lines.append(f"{names[p]} | {cube.months[m]} | {compact(monthly[m, p])} | {compact(median[p])}")
+    return lines
+
+# Provinces named in the question with their yearly tourists and revenue
+def question_lines(cube, question=None):
+    if not question:
+        return []
+    names = names_of(cube, 'province_eng')
+    text = question.lower()
+    asked = [p for p, name in enumerate(names) if re.search(r'\b' + re.escape(name.lower()) + r'\b', text)]
+    if not asked:
+        return []
+    regions = names_of(cube, 'region_eng')
+    metrics = cube.metric_indexer(['no_tourist_all', 'revenue_all'])
+    lines = ["province | region | year | tourists | revenue"]
+    for p in asked:
+        for y, year in enumerate(cube.years):
+            tourists, revenue = cube.year_sums[metrics, y, p]
+            lines.append(f"{names[p]} | {regions[p]} | {year} | {compact(tourists)} | {compact(revenue)}")
+    return lines
+
+def province_lines(cube, question=None):
+    totals = cube.province_totals(['no_tourist_all', 'revenue_all'])
+    names = names_of(cube, 'province_eng')
+    regions = names_of(cube, 'region_eng')
+    lines = ["province | region | tourists | revenue"]
+    for p in np.argsort(-totals[0], kind='stable'):
+        lines.append(f"{names[p]} | {regions[p]} | {compact(totals[0][p])} | {compact(totals[1][p])}")
+    return lines
+
+SECTIONS = [
+    ("Overview", overview_lines),
+    ("Provinces in the question", question_lines),
+    ("Yearly totals", yearly_lines),
+    ("Regions", region_lines),
+    ("Recovery", recovery_lines),
+    ("Province rankings", province_ranking_lines),
+    ("Outlier months (tourists)", outlier_lines),
+    ("All provinces", province_lines),
+]
+
+# Summary of data in at most max_tokens tokens, sections that do not fit are
+# cut line by line
+@func_cache.memoize
+def build_context(data, max_tokens=CONTEXT_MAX_TOKENS, question=None):
+    cube = cube_of(data)
+    parts, used = [], 0
+    for title, build in SECTIONS:
+        lines = build(cube, question)
+        if not lines:
+            continue
+        header = f"## {title}"
+        cost = count_tokens(header + '\n')
+        if used + cost >= max_tokens:
+            break
+        section = []
+        for line in lines:
+            line_cost = count_tokens(line + '\n')
+            if used + cost + line_cost > max_tokens:
+                break
+            section.append(line)
+            cost += line_cost
+        if not section:
+            break
+        parts.append('\n'.join([header] + section))
+        used += cost
+    return '\n\n'.join(parts)
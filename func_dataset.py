@@ -0,0 +1,72 @@
+import weakref
+
+import pandas as pd
+
+import func_store
+
+# Read-only shared view of a tourism DataFrame with lazily derived columns.
+#
+# The pages used to parse the date column and add a year column to the frame
+# they were given, which changes the caller's (cached, shared) frame. The
+# dataset parses the date once and derives year, month and quarter on first
+# use. frame() hands out new DataFrames that reference these columns; with
+# copy on write a page that modifies its frame copies only what it touches and
+# never changes the shared columns.
+
+DERIVED_COLUMNS = ['year', 'month', 'quarter']
+
+class TourismDataset:
+
+    def __init__(self, data):
+        # Shallow copy so later changes to the caller's frame are not seen here
+        self.data = data.copy(deep=False)
+        self.date_column = 'travel_date' if 'travel_date' in data.columns else 'date'
+        self._columns = {}
+
+    @property
+    def columns(self):
+        return list(self.data.columns) + DERIVED_COLUMNS
+
+    # Source column, the parsed date column or a derived column, computed once
+    def column(self, name):
+        column = self._columns.get(name)
+        if column is None:
+            column = self._build_column(name)
+            self._columns[name] = column
+        return column
+
+    def _build_column(self, name):
+        if name == self.date_column:
+            dates = self.data[name]
+            return dates if dates.dtype.kind == 'M' else pd.to_datetime(dates)
+        if name in DERIVED_COLUMNS:
+            return getattr(self.column(self.date_column).dt, name).rename(name)
+        return self.data[name]
+
+    # DataFrame of the given columns (default: the source columns) plus the
+    # given derived columns, e.g. frame(['year', 'no_tourist_all'])
+    def frame(self, columns=None, derived=()):
+        names = list(self.data.columns if columns is None else columns) + list(derived)
+        return pd.DataFrame({name: self.column(name) for name in names}, copy=False)
+
+_FRAME_CACHE = {}
+
+# Per frame cache of objects built from a DataFrame, e.g. a database or a
+# dataset. The entry lives as long as the frame, which is expected not to
+# change in place while it is in use (like a Streamlit cached frame).
+def cached_per_frame(cache, data, build):
+    entry = cache.get(id(data))
+    if entry is None or entry[0]() is not data:
+        key = id(data)
+        entry = (weakref.ref(data, lambda ref: cache.pop(key, None)), build(data))
+        cache[key] = entry
+    return entry[1]
+
+# Return the shared dataset of data. The tourism store has one dataset per
+# version (over its wide view), a DataFrame one per frame object.
+def as_dataset(data):
+    if isinstance(data, TourismDataset):
+        return data
+    if isinstance(data, func_store.TourismStore):
+        return data.derived('dataset', lambda store: TourismDataset(store.wide_view()))
+    return cached_per_frame(_FRAME_CACHE, data, TourismDataset)
@@ -0,0 +1,125 @@
+import os
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+import func_figure
+
+# Downsampling of long time series before they are plotted.
+#
+# A line chart never needs more points than its axes are wide in pixels.
+# plot_line() keeps the points that preserve the visual shape of the series:
+#   - 'lttb': largest triangle three buckets, one point per pixel column
+#   - 'minmax': the lowest and highest point of every pixel column, so spikes
+#     are never lost
+# The line is re-sampled whenever the x limits change (zoom-aware mode), so a
+# zoomed range shows full detail of the visible points only. Pages pass the
+# range picked with zoom_range() as x_range to the draw functions.
+
+DOWNSAMPLE_METHOD = os.getenv('DOWNSAMPLE_METHOD', 'lttb')
+# Series shorter than this get no zoom slider
+ZOOM_MIN_POINTS = 1000
+
+# Indices of threshold points of (x, y) picked by largest triangle three
+# buckets. x must be sorted.
+def lttb(x, y, threshold):
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # Bucket i covers bounds[i]:bounds[i + 1], the first and last points are
+    # always kept
+    every = (n - 2) / (threshold - 2)
+    bounds = np.floor(np.arange(threshold - 1) * every).astype(np.int64) + 1
+    bounds[-1] = n - 1
+    counts = np.diff(bounds)
+    mean_x = np.append(np.add.reduceat(x[:-1], bounds[:-1]) / counts, x[-1])
+    mean_y = np.append(np.add.reduceat(y[:-1], bounds[:-1]) / counts, y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = bounds[i], bounds[i + 1]
+        # Triangle between the last selected point, a candidate and the mean
+        # of the next bucket
+        area = np.abs((x[a] - mean_x[i + 1]) * (y[start:end] - y[a])
+                      - (x[a] - x[start:end]) * (mean_y[i + 1] - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+# Indices of the lowest and highest point in each of buckets equal x ranges,
+# plus the first and last point. x must be sorted.
+def minmax(x, y, buckets):
+    n = len(x)
+    if n <= 2 * buckets or buckets < 1:
+        return np.arange(n)
+
+    span = x[-1] - x[0]
+    bucket = np.zeros(n, dtype=np.int64) if span == 0 else np.minimum(((x - x[0]) / span * buckets).astype(np.int64), buckets - 1)
+    # Sorted by bucket then y, the first row of a bucket is its minimum and
+    # the last its maximum
+    order = np.lexsort((y, bucket))
+    starts = np.flatnonzero(np.r_[True, bucket[order][1:] != bucket[order][:-1]])
+    ends = np.r_[starts[1:], n] - 1
+    return np.unique(np.concatenate([[0, n - 1], order[starts], order[ends]]))
+
+# Indices of at most about max_points points of (x, y) to plot, limited to the
+# points in x_range (and one neighbour on each side so the line reaches the
+# edges of the axes)
+def sample_indices(x, y, max_points, method=DOWNSAMPLE_METHOD, x_range=None):
+    rows = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    if x_range is not None:
+        lo, hi = np.searchsorted(x[rows], x_range[0], 'left'), np.searchsorted(x[rows], x_range[1], 'right')
+        rows = rows[max(lo - 1, 0):hi + 1]
+    if method == 'lttb':
+        picked = lttb(x[rows], y[rows], max_points)
+    elif method == 'minmax':
+        picked = minmax(x[rows], y[rows], max(max_points // 2, 1))
+    elif method is None:
+        picked = np.arange(len(rows))
+    else:
+        raise ValueError(f"Unknown downsampling method: {method}")
+    return rows[picked]
+
+# Width of the axes in pixels of the rendered image
+def pixel_width(ax, dpi=None):
+    dpi = func_figure.SAVEFIG_OPTIONS['dpi'] if dpi is None else dpi
+    return max(int(ax.get_position().width * ax.figure.get_figwidth() * dpi), 3)
+
+# Plot y against x (sorted by x) with ax.plot, downsampled to the pixel width
+# of the axes. The line is re-sampled from the full series whenever the x
+# limits of the axes change.
+def plot_line(ax, x, y, method=DOWNSAMPLE_METHOD, **kwargs):
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    # Positions in axis units (dates become matplotlib date numbers)
+    x_units = np.asarray(ax.convert_xunits(x), dtype=np.float64) if len(x) else np.empty(0)
+    picked = sample_indices(x_units, y, pixel_width(ax), method)
+    line, = ax.plot(x[picked], y[picked], **kwargs)
+
+    def resample(ax):
+        picked = sample_indices(x_units, y, pixel_width(ax), method, x_range=sorted(ax.get_xlim()))
+        line.set_data(x[picked], y[picked])
+        ax.relim(visible_only=True)
+        ax.autoscale_view(scalex=False)
+
+    if len(x) > pixel_width(ax):
+        ax.callbacks.connect('xlim_changed', resample)
+    return line
+
+# Range slider over the x values of a long series, None when the series is
+# short enough to be shown whole
+def zoom_range(label, values, key=None, min_points=ZOOM_MIN_POINTS):
+    values = pd.Series(values)
+    if len(values) < min_points:
+        return None
+    lo, hi = values.min(), values.max()
+    if isinstance(lo, pd.Timestamp):
+        picked = st.slider(label, min_value=lo.to_pydatetime(), max_value=hi.to_pydatetime(),
+                           value=(lo.to_pydatetime(), hi.to_pydatetime()), key=key)
+        return tuple(pd.Timestamp(value) for value in picked)
+    picked = st.slider(label, min_value=lo.item(), max_value=hi.item(), value=(lo.item(), hi.item()), key=key)
+    return tuple(picked)
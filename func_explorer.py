@@ -0,0 +1,186 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+import func_store
+
+# Server side explorer of the long format dataset.
+#
+# The long view of the tourism store has one row per metric x date x
+# province cell, row m * dates * provinces + d * provinces + p. A filter on
+# variable, province, region and date range is therefore a set of positions
+# on each axis, looked up in the indexes of the explorer (metric and province
+# names, provinces per region, the sorted date axis) without scanning rows.
+# A page is computed from the axis positions of its rows only, so the page
+# size, not the dataset size, decides what is built and sent to the browser.
+# Sorting by a key column orders its axis, sorting by value orders the
+# selected cells once per filter (kept in a small LRU).
+
+PAGE_SIZES = [25, 50, 100, 250]
+SORT_COLUMNS = ['date', 'province_thai', 'province_eng', 'region_thai', 'region_eng', 'variable', 'value']
+MAX_VALUE_ORDERS = 8
+
+# Axis positions of the selected rows
+class Selection:
+
+    def __init__(self, metric_codes, date_codes, province_codes):
+        self.metric_codes = metric_codes
+        self.date_codes = date_codes
+        self.province_codes = province_codes
+
+    def __len__(self):
+        return len(self.metric_codes) * len(self.date_codes) * len(self.province_codes)
+
+    def key(self):
+        return tuple(codes.tobytes() for codes in (self.metric_codes, self.date_codes, self.province_codes))
+
+class DatasetExplorer:
+
+    def __init__(self, store):
+        self.store = store
+        self.metric_index = pd.Index(store.metrics)
+        self.province_index = store.provinces['province_eng'].cat.categories
+        self.region_provinces = {str(region): np.asarray(codes, dtype=np.int64) for region, codes in
+                                 store.provinces.groupby('region_eng', observed=True).indices.items()}
+        self.value_orders = OrderedDict()
+
+    @property
+    def columns(self):
+        return ['date'] + func_store.PROVINCE_COLUMNS + ['variable', 'value']
+
+    # Rows matching every given filter, None means no filter on that column.
+    # start and end bound the date, both included.
+    def select(self, variables=None, provinces=None, regions=None, start=None, end=None):
+        store = self.store
+        metric_codes = np.arange(len(store.metrics))
+        if variables is not None:
+            metric_codes = np.sort(self.metric_index.get_indexer(list(variables)))
+            metric_codes = metric_codes[metric_codes >= 0]
+
+        province_codes = np.arange(len(store.provinces))
+        if provinces is not None:
+            province_codes = np.intersect1d(province_codes, self.province_index.get_indexer(list(provinces)))
+        if regions is not None:
+            in_regions = [self.region_provinces.get(str(region), np.array([], dtype=np.int64)) for region in regions]
+            province_codes = np.intersect1d(province_codes, np.concatenate(in_regions) if in_regions else [])
+
+        first = 0 if start is None else store.dates.searchsorted(pd.Timestamp(start), side='left')
+        last = len(store.dates) if end is None else store.dates.searchsorted(pd.Timestamp(end), side='right')
+        date_codes = np.arange(first, max(first, last))
+        return Selection(metric_codes.astype(np.int64), date_codes.astype(np.int64), province_codes.astype(np.int64))
+
+    # Axis positions ordered by a key column
+    def _axis_order(self, column, selection, ascending):
+        if column == 'date':
+            axis, codes, keys = 1, selection.date_codes, selection.date_codes
+        elif column == 'variable':
+            axis, codes, keys = 0, selection.metric_codes, selection.metric_codes
+        else:
+            axis, codes = 2, selection.province_codes
+            keys = self.store.provinces[column].cat.codes.to_numpy()[codes]
+        order = np.argsort(keys if ascending else -keys.astype(np.int64), kind='stable')
+        return axis, codes[order]
+
+    # Value column positions of the selection in long view order, sorted by
+    # value (missing values last like sort_values)
+    def _value_order(self, selection, ascending):
+        key = (self.store.version, selection.key(), ascending)
+        order = self.value_orders.get(key)
+        if order is None:
+            values = self.store.values[np.ix_(selection.metric_codes, selection.date_codes, selection.province_codes)].reshape(-1)
+            order = np.argsort(values if ascending else -values, kind='stable')
+            self.value_orders[key] = order
+            while len(self.value_orders) > MAX_VALUE_ORDERS:
+                self.value_orders.popitem(last=False)
+        else:
+            self.value_orders.move_to_end(key)
+        return order
+
+    # Axis positions (metric, date, province) of rows [first, last) of the
+    # sorted selection
+    def _page_codes(self, selection, first, last, sort, ascending):
+        rows = np.arange(first, last)
+        axes = [selection.metric_codes, selection.date_codes, selection.province_codes]
+        if sort == 'value':
+            rows = self._value_order(selection, ascending)[first:last]
+            m, d, p = np.unravel_index(rows, [len(codes) for codes in axes])
+            return axes[0][m], axes[1][d], axes[2][p]
+
+        # The sort axis is outermost, the others keep the long view order
+        order = [0, 1, 2]
+        if sort is not None:
+            axis, axes[axis] = self._axis_order(sort, selection, ascending)
+            order = [axis] + [other for other in order if other != axis]
+        positions = np.unravel_index(rows, [len(axes[axis]) for axis in order])
+        codes = [None] * 3
+        for axis, position in zip(order, positions):
+            codes[axis] = axes[axis][position]
+        return tuple(codes)
+
+    # One page of the selection as a DataFrame indexed by the row number in
+    # the long view, with only the given columns
+    def page(self, selection, number, page_size, columns=None, sort=None, ascending=True):
+        store = self.store
+        first = min(number * page_size, len(selection))
+        last = min(first + page_size, len(selection))
+        m, d, p = self._page_codes(selection, first, last, sort, ascending)
+
+        columns = self.columns if columns is None else [column for column in self.columns if column in columns]
+        n_dates, n_provinces = len(store.dates), len(store.provinces)
+        data = pd.DataFrame(index=pd.Index((m * n_dates + d) * n_provinces + p, name='row'))
+        for column in columns:
+            if column == 'date':
+                data[column] = store.dates[d]
+            elif column == 'variable':
+                data[column] = pd.Categorical.from_codes(m, categories=store.metrics)
+            elif column == 'value':
+                data[column] = store.values[m, d, p]
+            else:
+                data[column] = store.provinces[column].to_numpy()[p]
+        return data
+
+# The explorer of the tourism store, built once per store version
+def as_explorer(store):
+    return store.derived('explorer', DatasetExplorer)
+
+# Dataset page: filters, sort and column choice, then only the rows of the
+# current page are built and sent
+def explore_dataset(store):
+    explorer = as_explorer(store)
+    provinces = store.provinces
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        regions = st.multiselect("Region", sorted(provinces['region_eng'].astype(str).unique()), key='dataset_regions')
+    with col2:
+        province_options = provinces if not regions else provinces[provinces['region_eng'].astype(str).isin(regions)]
+        selected_provinces = st.multiselect("Province", sorted(province_options['province_eng'].astype(str)), key='dataset_provinces')
+    with col3:
+        variables = st.multiselect("Variable", store.metrics, key='dataset_variables')
+
+    first_date, last_date = store.dates.min().date(), store.dates.max().date()
+    date_range = st.date_input("Date range", value=(first_date, last_date), min_value=first_date, max_value=last_date, key='dataset_dates')
+    start, end = (date_range + (None, None))[:2] if isinstance(date_range, tuple) else (date_range, None)
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        columns = st.multiselect("Columns", explorer.columns, default=explorer.columns, key='dataset_columns')
+    with col2:
+        sort = st.selectbox("Sort by", [None] + SORT_COLUMNS, format_func=lambda column: 'row' if column is None else column, key='dataset_sort')
+        ascending = st.toggle("Ascending", value=True, key='dataset_ascending')
+    with col3:
+        page_size = st.selectbox("Rows per page", PAGE_SIZES, key='dataset_page_size')
+
+    selection = explorer.select(variables=variables or None, provinces=selected_provinces or None,
+                                regions=regions or None, start=start, end=end)
+    pages = max(-(-len(selection) // page_size), 1)
+    # The page number starts over at 1 when the filters or the page size change
+    page_key = hashlib.sha1(repr(selection.key() + (page_size,)).encode()).hexdigest()[:16]
+    number = st.number_input("Page", min_value=1, max_value=pages, value=1, step=1, key=f'dataset_page_{page_key}') - 1
+
+    st.dataframe(explorer.page(selection, number, page_size, columns=columns, sort=sort, ascending=ascending))
+    st.caption(f"Rows {min(number * page_size + 1, len(selection)):,}–{min((number + 1) * page_size, len(selection)):,} "
+               f"of {len(selection):,} (page {number + 1} of {pages:,})")
@@ -0,0 +1,112 @@
+import gzip
+import hashlib
+import json
+import os
+
+import plotly
+import plotly.io as pio
+from plotly.offline import get_plotlyjs
+
+# Lightweight HTML export of plotly charts.
+#
+# write_html() inlines the whole plotly.js bundle (several MB) into every
+# file. Here plotly.js is written once per plotly version as a shared asset
+# that the chart pages reference, or all charts go into one report page. With
+# compress the files are also written gzip compressed next to the plain ones
+# (for a web server with precompressed static files, e.g. nginx gzip_static,
+# the plain files still open from disk), and a chart is only written again when
+# the hash of its spec changes, which is kept in a manifest next to the files.
+
+MANIFEST_FILE_NAME = 'charts.json'
+PLOTLYJS_FILE_NAME = f'plotly-{plotly.__version__}.min.js'
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_manifest(directory, manifest):
+    # Write to a temp file first so readers never see a half written manifest
+    tmp_path = os.path.join(directory, f'{MANIFEST_FILE_NAME}.{os.getpid()}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, os.path.join(directory, MANIFEST_FILE_NAME))
+
+def output_path(directory, file_name, compress=False):
+    return os.path.join(directory, file_name + ('.gz' if compress else ''))
+
+# Write text to path, and gzip compressed to path.gz when compress is set,
+# returns the paths written
+def write_outputs(path, text, compress):
+    write_text(path, text, False)
+    if not compress:
+        return [path]
+    write_text(path + '.gz', text, True)
+    return [path, path + '.gz']
+
+def write_text(path, text, compress):
+    data = text.encode('utf-8')
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    if compress:
+        # mtime=0 keeps the bytes identical for identical content
+        with gzip.GzipFile(tmp_path, 'wb', compresslevel=9, mtime=0) as f:
+            f.write(data)
+    else:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+    os.replace(tmp_path, path)
+
+# Write the shared plotly.js asset unless it is already there, return the
+# paths that were written
+def write_plotlyjs(directory, compress):
+    path = output_path(directory, PLOTLYJS_FILE_NAME)
+    if os.path.exists(path) and (not compress or os.path.exists(path + '.gz')):
+        return []
+    return write_outputs(path, get_plotlyjs(), compress)
+
+def spec_hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+    return digest.hexdigest()
+
+# Export plotly figures given as {name: figure} into directory.
+# mode 'shared': one <name>.html per chart, all loading the shared plotly.js
+# mode 'report': a single <report_name>.html with every chart
+# Returns the paths that were written, charts whose spec did not change are
+# skipped.
+def export_figures(figures, directory='export', mode='shared', compress=False, report_name='report'):
+    if mode not in ('shared', 'report'):
+        raise ValueError(f"Unknown export mode: {mode}")
+
+    os.makedirs(directory, exist_ok=True)
+    manifest = read_manifest(directory)
+    written = write_plotlyjs(directory, compress)
+
+    specs = {name: figure.to_json() for name, figure in figures.items()}
+    options = f'{mode}:{compress}:{PLOTLYJS_FILE_NAME}'
+
+    if mode == 'shared':
+        for name, figure in figures.items():
+            path = output_path(directory, f'{name}.html')
+            key = spec_hash(options, specs[name])
+            if manifest.get(os.path.basename(path)) == key and os.path.exists(path):
+                continue
+            html = pio.to_html(figure, include_plotlyjs=PLOTLYJS_FILE_NAME, full_html=True, div_id=name)
+            written += write_outputs(path, html, compress)
+            manifest[os.path.basename(path)] = key
+    else:
+        path = output_path(directory, f'{report_name}.html')
+        key = spec_hash(options, *(name + specs[name] for name in figures))
+        if manifest.get(os.path.basename(path)) != key or not os.path.exists(path):
+            charts = [pio.to_html(figure, include_plotlyjs=False, full_html=False, div_id=name) for name, figure in figures.items()]
+            html = ('<html>\n<head><meta charset="utf-8" />'
+                    f'<script src="{PLOTLYJS_FILE_NAME}"></script></head>\n<body>\n'
+                    + '\n'.join(charts) + '\n</body>\n</html>\n')
+            written += write_outputs(path, html, compress)
+            manifest[os.path.basename(path)] = key
+
+    write_manifest(directory, manifest)
+    return written
@@ -0,0 +1,61 @@
+import hashlib
+import io
+import os
+
+import streamlit as st
+
+import func_cache
+import func_common
+
+# Cache of rendered matplotlib figures.
+#
+# A page passes a draw function, the data it plots and the plot parameters to
+# show(). The figure is drawn and rasterised only when that combination (and
+# the matplotlib theme) has not been rendered before, the PNG or SVG bytes are
+# kept in a byte-budgeted LRU (with an optional disk tier, see func_cache) and
+# served with st.image. Figures are closed right after rendering so pyplot
+# does not keep every figure of every rerun.
+
+# pyplot is only needed to draw a figure that is not cached
+matplotlib = func_common.lazy_import('matplotlib')
+plt = func_common.lazy_import('matplotlib.pyplot')
+
+# Same output as st.pyplot
+SAVEFIG_OPTIONS = {'bbox_inches': 'tight', 'dpi': 200}
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+FIGURE_CACHE = func_cache.ResultCache(
+    max_bytes=int(os.getenv('FIGURE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)),
+    directory=os.getenv('FIGURE_CACHE_DIR') or None,
+)
+
+# Hash of the matplotlib settings a figure depends on (style, seaborn theme)
+def theme_key():
+    digest = hashlib.sha256(matplotlib.__version__.encode())
+    digest.update(repr(sorted((name, repr(value)) for name, value in matplotlib.rcParams.items())).encode())
+    return digest.hexdigest()
+
+# Rendered bytes of draw(*inputs, **params), which must return the figure
+def render(draw, *inputs, format='png', **params):
+    key = func_cache.call_key(draw, inputs + (format, theme_key()), params)
+    if key is not None:
+        found, image = FIGURE_CACHE.get(key)
+        if found:
+            return image
+
+    fig = draw(*inputs, **params)
+    try:
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format=format, **SAVEFIG_OPTIONS)
+        image = buffer.getvalue()
+    finally:
+        plt.close(fig)
+
+    if key is not None:
+        FIGURE_CACHE.put(key, image)
+    return image
+
+# Render (or take from the cache) and display a figure
+def show(draw, *inputs, format='png', **params):
+    image = render(draw, *inputs, format=format, **params)
+    st.image(image.decode('utf-8') if format == 'svg' else image, width='stretch')
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+# Code -> label dictionaries for the display columns.
+#
+# A source column is turned into categorical codes once (free when it already
+# is a categorical), every label table is looked up for the categories only,
+# and each display column is then one indexed take of the codes. The cost of
+# the string work depends on the size of the vocabulary, not of the frame.
+
+class Labels:
+
+    # mapping: source value -> label, values not in mapping get default, or
+    # keep their own value when default is None
+    def __init__(self, mapping, default=None):
+        self.mapping = dict(mapping)
+        self.default = default
+
+    def get(self, value):
+        if value in self.mapping:
+            return self.mapping[value]
+        return value if self.default is None else self.default
+
+    # Label of every category plus one for missing values (code -1)
+    def lookup(self, categories):
+        missing = self.get(np.nan)
+        labels = [self.get(value) for value in categories] + [missing]
+        return np.array(labels, dtype=object if pd.isna(missing) else None)
+
+REGION_LABELS = Labels({
+    'central': 'Central',
+    'east': 'East',
+    'east_northeast': 'Northeast',
+    'north': 'North',
+    'south': 'South',
+})
+
+# Sort order of the variables in the regional tables
+ORDER_TYPES = Labels({'revenue_all': 3, 'revenue_thai': 1}, default=2)
+
+TOURIST_VARIABLE_LABELS = Labels({
+    'no_tourist_all': 'All tourists',
+    'no_tourist_thai': 'Thai tourists',
+}, default='Foreign tourists')
+
+REVENUE_VARIABLE_LABELS = Labels({
+    'revenue_all': 'Revenue from all tourists',
+    'revenue_thai': 'Revenue from Thai tourists',
+}, default='Revenue from foreign tourists')
+
+PROVINCE_VARIABLE_LABELS = Labels({'no_tourist_all': 'Tourist numbers'}, default='Revenue')
+
+METRIC_LABELS = Labels({
+    'no_tourist_all': 'Tourist numbers',
+    'no_tourist_foreign': 'Foreign tourist numbers',
+    'no_tourist_thai': 'Thai tourist numbers',
+    'no_tourist_stay': 'Tourists staying overnight',
+    'ratio_tourist_stay': 'Occupancy rate',
+    'revenue_all': 'Revenue',
+    'revenue_foreign': 'Revenue from foreign tourists',
+    'revenue_thai': 'Revenue from Thai tourists',
+    'revenue_per_tourist': 'Revenue per tourist',
+    'revenue_per_foreign_tourist': 'Revenue per foreign tourist',
+    'revenue_per_thai_tourist': 'Revenue per Thai tourist',
+})
+
+# Labels between two name columns of the provinces, e.g.
+# name_labels(store.provinces, 'province_thai', 'province_eng')
+def name_labels(data, source, target):
+    names = data[[source, target]].drop_duplicates(source)
+    return Labels(zip(names[source].astype(object), names[target].astype(object)))
+
+# Categorical codes and categories of a column
+def codes_of(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories
+    return pd.factorize(values, use_na_sentinel=True)
+
+# Label arrays of a source column, one per label table
+def label_arrays(values, **tables):
+    codes, categories = codes_of(values)
+    return {name: labels.lookup(categories)[codes] for name, labels in tables.items()}
+
+# Add the display columns of one source column to data, e.g.
+# attach(data, 'variable', order_type=ORDER_TYPES, display_variable=TOURIST_VARIABLE_LABELS)
+def attach(data, column, **tables):
+    for name, labels in label_arrays(data[column], **tables).items():
+        data[name] = labels
+    return data
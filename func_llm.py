@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import unicodedata
+
+import func_cache
+import func_common
+import func_context
+import func_llmclient
+
+# Calls to the LLM providers (OpenAI, Gemini) with a response cache.
+#
+# A response is cached under the provider, model, call parameters, the
+# normalised prompt (Unicode NFC, whitespace runs collapsed, so re-indented
+# prompt templates hit the same entry) and the fingerprint of the dataset
+# the prompt was built from. A changed dataset has a new fingerprint, so its
+# prompts miss and the old answers age out of the LRU. Responses live in an
+# in-memory LRU and, with LLM_CACHE_DIR set, in pickle files that expire
+# after LLM_CACHE_TTL seconds. cache_stats() reports hits and the hit rate.
+#
+# stream_openai() and stream_gemini() yield the answer in chunks as they
+# arrive (for st.write_stream). A stream that is cut off, because the session
+# navigated away (Streamlit stops the script and the generator is closed) or
+# the cancel event was set, keeps its partial text. The next identical
+# request shows it at once and asks the model to continue from there, within
+# what is left of max_tokens. A resumed answer is stitched from two replies,
+# so it is not cached as a response, its partial entry is dropped once it
+# completes.
+#
+# Requests go through func_llmclient, so answers and streams get its
+# deadline, retries and cancellation, and the pooled clients and rate limits
+# of func_llmpool. With LLM_HEDGE=1 the pages ask both providers through
+# stream_first() and show the first one to answer.
+
+OPENAI_MODEL = 'gpt-3.5-turbo'
+GEMINI_MODEL = 'gemini-1.5-flash'
+DEFAULT_TTL = 7 * 24 * 3600
+CONTINUE_PROMPT = "Continue your previous answer exactly where it stopped, without repeating any of it."
+LLM_HEDGE = os.getenv('LLM_HEDGE', '0') == '1'
+
+RESPONSE_CACHE = func_cache.ResultCache(
+    max_bytes=int(os.getenv('LLM_CACHE_MAX_BYTES', 16 * 1024 * 1024)),
+    directory=os.getenv('LLM_CACHE_DIR') or None,
+    ttl=float(os.getenv('LLM_CACHE_TTL', DEFAULT_TTL)),
+)
+
+# Text of streams that were cut off, under the key of their request
+PARTIAL_CACHE = func_cache.ResultCache(
+    max_bytes=int(os.getenv('LLM_CACHE_MAX_BYTES', 16 * 1024 * 1024)) // 4,
+    directory=os.path.join(RESPONSE_CACHE.directory, 'partial') if RESPONSE_CACHE.directory else None,
+    ttl=RESPONSE_CACHE.ttl,
+)
+
+def normalise_prompt(text):
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+# Key of a call, None when the dataset cannot be fingerprinted
+def response_key(provider, model, messages, params, dataset=None):
+    dataset_key = None
+    if dataset is not None:
+        dataset_key = func_cache.fingerprint(dataset)
+        if dataset_key is None:
+            return None
+    parts = {
+        'provider': provider,
+        'model': model,
+        'messages': [[message['role'], normalise_prompt(message['content'])] for message in messages],
+        'params': {name: repr(value) for name, value in params.items()},
+        'dataset': dataset_key,
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+# Response text of call(), from the cache when the same request was answered
+# before. Errors are not cached.
+def cached_response(provider, model, messages, params, dataset, call):
+    key = response_key(provider, model, messages, params, dataset)
+    if key is None:
+        with RESPONSE_CACHE.lock:
+            RESPONSE_CACHE.bypasses += 1
+        return call()
+
+    found, text = RESPONSE_CACHE.get(key)
+    if not found:
+        text = call()
+        RESPONSE_CACHE.put(key, text)
+    return text
+
+def cache_stats():
+    return RESPONSE_CACHE.stats()
+
+# Chat completion text of the messages. dataset is the data the prompt was
+# built from, it keys the cache. Setting the cancel event (threading.Event)
+# abandons the request with func_llmclient.Cancelled.
+def chat_openai(messages, model=OPENAI_MODEL, dataset=None, cancel=None, **params):
+    def call():
+        return func_llmclient.run(func_llmclient.openai_chat(messages, model, **params), cancel)
+    return cached_response('openai', model, messages, params, dataset, call)
+
+# Answer of Gemini to the prompt
+def chat_gemini(prompt, model=GEMINI_MODEL, dataset=None, cancel=None):
+    def call():
+        return func_llmclient.run(func_llmclient.gemini_chat(prompt, model), cancel)
+    return cached_response('gemini', model, [{'role': 'user', 'content': prompt}], {}, dataset, call)
+
+# Answer of the first provider that succeeds, the next provider is asked when
+# the previous one has not answered after func_llmclient.HEDGE_DELAY seconds
+def chat_first(prompt, providers=('openai', 'gemini'), dataset=None, cancel=None):
+    def call():
+        return func_llmclient.run(func_llmclient.ask_first(prompt, providers), cancel)
+    return cached_response('first', ','.join(providers), [{'role': 'user', 'content': prompt}], {}, dataset, call)
+
+# Chunks of a response. open_stream(partial) returns a generator of text
+# chunks, continuing partial when it is not None.
+def stream_response(provider, model, messages, params, dataset, open_stream, cancel=None):
+    key = response_key(provider, model, messages, params, dataset)
+    partial = None
+    if key is not None:
+        found, text = RESPONSE_CACHE.get(key)
+        if found:
+            yield text
+            return
+        found, partial = PARTIAL_CACHE.get(key)
+        if not found:
+            partial = None
+
+    received = []
+    if partial is not None:
+        received.append(partial)
+        yield partial
+
+    stream = open_stream(partial)
+    complete = False
+    try:
+        for text in stream:
+            if cancel is not None and cancel.is_set():
+                break
+            if text:
+                received.append(text)
+                yield text
+        else:
+            complete = True
+    except func_llmclient.Cancelled:
+        pass
+    finally:
+        stream.close()
+        if key is not None:
+            text = ''.join(received)
+            if complete:
+                if partial is None:
+                    RESPONSE_CACHE.put(key, text)
+                PARTIAL_CACHE.delete(key)
+            elif text:
+                PARTIAL_CACHE.put(key, text)
+
+# params of the continuation of partial, max_tokens is what the partial left
+# of the token budget. None when nothing is left.
+def continuation_params(params, partial):
+    if params.get('max_tokens') is None:
+        return params
+    left = params['max_tokens'] - func_context.count_tokens(partial)
+    return dict(params, max_tokens=left) if left > 0 else None
+
+# Opener (see func_llmclient.stream) of an OpenAI answer to messages, None
+# when the partial answer used up max_tokens
+def openai_opener(model, messages, params, partial=None):
+    if partial is not None:
+        messages = messages + [{'role': 'assistant', 'content': partial}, {'role': 'user', 'content': CONTINUE_PROMPT}]
+        params = continuation_params(params, partial)
+        if params is None:
+            return None
+    return 'openai', model, lambda deadline: func_llmclient.openai_stream(messages, model, deadline.remaining(), **params)
+
+# Opener of a Gemini answer to prompt. The OpenAI parameters max_tokens and
+# temperature are passed on as generation config, the others do not apply.
+def gemini_opener(model, prompt, params, partial=None):
+    contents = prompt
+    if partial is not None:
+        contents = [{'role': 'user', 'parts': [prompt]}, {'role': 'model', 'parts': [partial]},
+                    {'role': 'user', 'parts': [CONTINUE_PROMPT]}]
+        params = continuation_params(params, partial)
+        if params is None:
+            return None
+    config = {'max_output_tokens': params.get('max_tokens'), 'temperature': params.get('temperature')}
+    config = {name: value for name, value in config.items() if value is not None} or None
+    return 'gemini', model, lambda deadline: func_llmclient.gemini_stream(contents, model, deadline.remaining(), config)
+
+# Chunks of the streams of openers, hedged when there are several
+def open_chunks(openers, cancel):
+    openers = [opener for opener in openers if opener is not None]
+    if not openers:
+        return (text for text in ())
+    return func_llmclient.stream(openers, cancel)
+
+# Streaming chat_openai(), a generator of text chunks. Setting the cancel
+# event (threading.Event) stops the stream after the current chunk.
+def stream_openai(messages, model=OPENAI_MODEL, dataset=None, cancel=None, **params):
+    def open_stream(partial):
+        return open_chunks([openai_opener(model, messages, params, partial)], cancel)
+    return stream_response('openai', model, messages, params, dataset, open_stream, cancel)
+
+# Streaming chat_gemini(), a generator of text chunks
+def stream_gemini(prompt, model=GEMINI_MODEL, dataset=None, cancel=None, **params):
+    def open_stream(partial):
+        return open_chunks([gemini_opener(model, prompt, params, partial)], cancel)
+    return stream_response('gemini', model, [{'role': 'user', 'content': prompt}], params, dataset, open_stream, cancel)
+
+# Streamed answer of the first provider to send a chunk, the next provider is
+# asked when the previous one has not after func_llmclient.HEDGE_DELAY seconds
+def stream_first(prompt, providers=('openai', 'gemini'), dataset=None, cancel=None, **params):
+    messages = [{'role': 'user', 'content': prompt}]
+
+    def open_stream(partial):
+        openers = {
+            'openai': lambda: openai_opener(OPENAI_MODEL, messages, params, partial),
+            'gemini': lambda: gemini_opener(GEMINI_MODEL, prompt, params, partial),
+        }
+        return open_chunks([openers[name]() for name in providers], cancel)
+    return stream_response('first', ','.join(providers), messages, params, dataset, open_stream, cancel)
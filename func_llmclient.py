@@ -0,0 +1,301 @@
+import asyncio
+import concurrent.futures
+import os
+import queue
+import random
+import time
+
+import func_common
+import func_llmpool
+
+# asyncio client layer of the LLM providers.
+#
+# Every request has a deadline (LLM_TIMEOUT seconds for all attempts
+# together) that is enforced with asyncio.wait_for, so a hung provider call
+# is cancelled instead of blocking the page. Timeouts, connection errors,
+# 429 and 5xx responses are retried with exponential backoff and full jitter
+# while the deadline allows. hedged() starts the same question on several
+# providers, each one HEDGE_DELAY seconds after the previous, and returns the
+# first successful answer, the slower requests are cancelled.
+#
+# stream() gives the same to streamed answers: the stream is opened again with
+# backoff until its first chunk arrives (or, hedged, the first stream that
+# produces one wins) and the whole stream ends at the deadline.
+#
+# Requests run on the shared event loop and clients of func_llmpool, within
+# its rate and concurrency limits. OPENAI_API_BASE and GEMINI_API_ENDPOINT
+# point the clients at another server, e.g. the local stand-in in
+# example/llm_standin.py.
+
+openai = func_common.lazy_import('openai')
+api_exceptions = func_common.lazy_import('google.api_core.exceptions')
+
+OPENAI_MODEL = 'gpt-3.5-turbo'
+GEMINI_MODEL = 'gemini-1.5-flash'
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', 60))
+LLM_ATTEMPT_TIMEOUT = float(os.getenv('LLM_ATTEMPT_TIMEOUT', 30))
+LLM_RETRIES = int(os.getenv('LLM_RETRIES', 3))
+BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', 0.5))
+BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', 8))
+HEDGE_DELAY = float(os.getenv('LLM_HEDGE_DELAY', 2))
+CANCEL_POLL_SECONDS = 0.05
+
+class DeadlineExceeded(Exception):
+    pass
+
+class Cancelled(Exception):
+    pass
+
+class Deadline:
+
+    def __init__(self, timeout=None):
+        self.expires = time.monotonic() + (LLM_TIMEOUT if timeout is None else timeout)
+
+    def remaining(self):
+        return max(self.expires - time.monotonic(), 0.0)
+
+def as_deadline(deadline):
+    return deadline if isinstance(deadline, Deadline) else Deadline(deadline)
+
+# Errors worth another attempt: timeouts, dropped connections, rate limits
+# and server errors
+def retryable(error):
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    if isinstance(error, (openai.error.Timeout, openai.error.APIConnectionError, openai.error.RateLimitError,
+                          openai.error.ServiceUnavailableError)):
+        return True
+    if isinstance(error, openai.error.APIError):
+        return (error.http_status or 500) >= 500
+    if isinstance(error, api_exceptions.GoogleAPICallError):
+        return isinstance(error, (api_exceptions.TooManyRequests, api_exceptions.ResourceExhausted,
+                                  api_exceptions.ServerError, api_exceptions.DeadlineExceeded))
+    return False
+
+# Exponential backoff with full jitter
+def backoff_delay(attempt):
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+# Await attempt(timeout) until it succeeds, a non retryable error or the
+# deadline. Each attempt gets at most LLM_ATTEMPT_TIMEOUT seconds. With limit,
+# a (provider, model) tuple, every attempt first waits for a rate limit token
+# within the deadline, so the wait does not count against the attempt.
+async def with_retries(attempt, deadline=None, retries=LLM_RETRIES, limit=None):
+    deadline = as_deadline(deadline)
+    for number in range(retries + 1):
+        if limit is not None:
+            await func_llmpool.take_token(*limit, deadline.remaining())
+        timeout = min(LLM_ATTEMPT_TIMEOUT, deadline.remaining())
+        if timeout <= 0:
+            raise DeadlineExceeded("LLM request deadline exceeded")
+        try:
+            return await asyncio.wait_for(attempt(timeout), timeout)
+        except Exception as error:
+            if number == retries or not retryable(error):
+                raise
+            delay = backoff_delay(number)
+            if delay >= deadline.remaining():
+                raise DeadlineExceeded("LLM request deadline exceeded") from error
+            await asyncio.sleep(delay)
+
+async def openai_chat(messages, model=OPENAI_MODEL, deadline=None, **params):
+    deadline = as_deadline(deadline)
+
+    async def attempt(timeout):
+        response = await openai.ChatCompletion.acreate(model=model, messages=messages, request_timeout=timeout, **params)
+        return response['choices'][0]['message']['content']
+    async with func_llmpool.slot('openai', model, deadline.remaining()):
+        return await with_retries(attempt, deadline, limit=('openai', model))
+
+# The asynchronous Gemini client speaks gRPC, a REST endpoint (the stand-in
+# server) is called with the REST client in a worker thread
+async def gemini_chat(prompt, model=GEMINI_MODEL, deadline=None):
+    deadline = as_deadline(deadline)
+
+    async def attempt(timeout):
+        client = func_llmpool.gemini_model(model)
+        if func_llmpool.GEMINI_API_ENDPOINT:
+            response = await asyncio.to_thread(client.generate_content, prompt, request_options={'timeout': timeout})
+        else:
+            response = await client.generate_content_async(prompt, request_options={'timeout': timeout})
+        return response.text
+    async with func_llmpool.slot('gemini', model, deadline.remaining()):
+        return await with_retries(attempt, deadline, limit=('gemini', model))
+
+# Text of a Gemini chunk, chunks without text (e.g. only safety ratings) are
+# empty
+def chunk_text(chunk):
+    try:
+        return chunk.text
+    except ValueError:
+        return ''
+
+# Async iterators of the text chunks of a streamed answer, without rate
+# limits (see limited_stream)
+async def openai_stream(messages, model=OPENAI_MODEL, timeout=None, **params):
+    timeout = LLM_TIMEOUT if timeout is None else timeout
+    response = await openai.ChatCompletion.acreate(model=model, messages=messages, stream=True, request_timeout=timeout, **params)
+    try:
+        async for chunk in response:
+            yield chunk['choices'][0]['delta'].get('content') or ''
+    finally:
+        await response.aclose()
+
+async def gemini_stream(contents, model=GEMINI_MODEL, timeout=None, generation_config=None):
+    timeout = LLM_TIMEOUT if timeout is None else timeout
+    client = func_llmpool.gemini_model(model)
+    options = {'request_options': {'timeout': timeout}, 'generation_config': generation_config}
+    if func_llmpool.GEMINI_API_ENDPOINT:
+        # REST client: every chunk is read in a worker thread
+        chunks = iter(await asyncio.to_thread(client.generate_content, contents, stream=True, **options))
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                break
+            yield chunk_text(chunk)
+    else:
+        response = await client.generate_content_async(contents, stream=True, **options)
+        async for chunk in response:
+            yield chunk_text(chunk)
+
+# (iterator, first chunk) of an async iterator, which is closed when there is
+# no first chunk
+async def started(iterator):
+    try:
+        return iterator, await iterator.__anext__()
+    except StopAsyncIteration:
+        return iterator, ''
+    except BaseException:
+        await iterator.aclose()
+        raise
+
+# Text chunks of the stream of opener, a (provider, model, open_stream) tuple.
+# open_stream(deadline) is called again with retries until a first chunk
+# arrives, each time with a rate limit token. The concurrency slot is held
+# until the stream ends or is closed.
+async def limited_stream(opener, deadline=None):
+    provider, model, open_stream = opener
+    deadline = as_deadline(deadline)
+    async with func_llmpool.slot(provider, model, deadline.remaining()):
+        iterator, first = await with_retries(lambda timeout: started(open_stream(deadline)), deadline,
+                                             limit=(provider, model))
+        try:
+            yield first
+            async for text in iterator:
+                yield text
+        finally:
+            await iterator.aclose()
+
+# (iterator, first chunk) of the stream of opener
+async def first_chunk(opener, deadline=None):
+    return await started(limited_stream(opener, deadline))
+
+PROVIDERS = {
+    'openai': lambda prompt, deadline: openai_chat([{'role': 'user', 'content': prompt}], deadline=deadline),
+    'gemini': lambda prompt, deadline: gemini_chat(prompt, deadline=deadline),
+}
+
+# Result of the first request that succeeds. requests are functions returning
+# a coroutine, request i starts i * delay seconds after the first one or as
+# soon as every earlier one has failed. The others are cancelled.
+# discard(result) is awaited for results that finished together with the
+# returned one.
+async def hedged(requests, delay=None, discard=None):
+    delay = HEDGE_DELAY if delay is None else delay
+    pending, errors = set(), []
+    waiting = list(requests)
+    try:
+        while waiting or pending:
+            if waiting:
+                pending.add(asyncio.ensure_future(waiting.pop(0)()))
+            done, pending = await asyncio.wait(pending, timeout=delay if waiting else None,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            results = [task.result() for task in done if task.exception() is None]
+            errors += [task.exception() for task in done if task.exception() is not None]
+            if results:
+                if discard is not None:
+                    for result in results[1:]:
+                        await discard(result)
+                return results[0]
+        raise errors[-1]
+    finally:
+        for task in pending:
+            task.cancel()
+
+# Answer of the first provider that succeeds, within one deadline
+async def ask_first(prompt, providers=('openai', 'gemini'), deadline=None, delay=None):
+    deadline = as_deadline(deadline)
+    return await hedged([lambda name=name: PROVIDERS[name](prompt, deadline) for name in providers], delay)
+
+async def _close_stream(result):
+    await result[0].aclose()
+
+# (iterator, first chunk) of the first of the streams to produce a chunk
+async def first_of_streams(openers, deadline=None, delay=None):
+    deadline = as_deadline(deadline)
+    requests = [lambda opener=opener: first_chunk(opener, deadline) for opener in openers]
+    return await hedged(requests, delay, discard=_close_stream)
+
+# Text chunks of a streamed answer for synchronous code (st.write_stream).
+# openers are (provider, model, open_stream) tuples, open_stream a function
+# of the Deadline returning an async iterator of chunks, e.g.
+# ('openai', model, lambda deadline: openai_stream(messages, model, deadline.remaining())),
+# several openers are hedged. Raises DeadlineExceeded when the stream is not
+# finished at the deadline and Cancelled when the cancel event is set while
+# waiting for a chunk. Closing the generator cancels the stream.
+def stream(openers, cancel=None, deadline=None, delay=None):
+    deadline = as_deadline(deadline)
+    chunks = queue.Queue()
+
+    async def produce():
+        iterator = None
+        try:
+            if len(openers) == 1:
+                iterator, first = await first_chunk(openers[0], deadline)
+            else:
+                iterator, first = await first_of_streams(openers, deadline, delay)
+            chunks.put(('chunk', first))
+            async for text in iterator:
+                chunks.put(('chunk', text))
+            chunks.put(('end', None))
+        except Exception as error:
+            chunks.put(('error', error))
+        finally:
+            if iterator is not None:
+                await iterator.aclose()
+
+    future = func_llmpool.submit(produce())
+    try:
+        while True:
+            remaining = deadline.remaining()
+            if remaining <= 0:
+                raise DeadlineExceeded("LLM stream deadline exceeded")
+            try:
+                kind, value = chunks.get(timeout=remaining if cancel is None else min(remaining, CANCEL_POLL_SECONDS))
+            except queue.Empty:
+                if cancel is not None and cancel.is_set():
+                    raise Cancelled("LLM stream cancelled")
+                continue
+            if kind == 'end':
+                return
+            if kind == 'error':
+                raise value
+            yield value
+    finally:
+        future.cancel()
+
+# Run a coroutine on the shared event loop from synchronous code (the
+# Streamlit script thread). When the cancel event (threading.Event) is set
+# the coroutine is cancelled. Streamlit cannot interrupt this wait when the
+# script is stopped or rerun, the deadline of the request bounds it.
+def run(coroutine, cancel=None):
+    future = func_llmpool.submit(coroutine)
+    try:
+        while True:
+            try:
+                return future.result(timeout=None if cancel is None else CANCEL_POLL_SECONDS)
+            except concurrent.futures.TimeoutError:
+                if cancel.is_set():
+                    raise Cancelled("LLM request cancelled")
+    finally:
+        future.cancel()
@@ -0,0 +1,177 @@
+import asyncio
+import atexit
+import contextlib
+import hashlib
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+import func_common
+
+# Process-wide clients of the LLM providers, shared by every Streamlit session.
+#
+# configure() loads .env and sets the API keys once per process instead of
+# on every rerun. Requests keep their HTTP connections alive in shared pools:
+# an aiohttp session on one event loop thread that runs every call of
+# func_llmclient, and one GenerativeModel per Gemini model.
+#
+# Every request holds one of the LLM_MAX_CONCURRENCY slots of its provider
+# and every attempt of it takes a token from the bucket of its provider, model
+# and API key (OPENAI_RPM / GEMINI_RPM requests per minute, bursts of
+# LLM_BURST), so many sessions opening the AI pages together queue here
+# instead of running into 429 responses. Both are waited for within the
+# deadline of the request, before the timeout of an attempt starts.
+
+openai = func_common.lazy_import('openai')
+genai = func_common.lazy_import('google.generativeai')
+aiohttp = func_common.lazy_import('aiohttp')
+
+OPENAI_API_BASE = os.getenv('OPENAI_API_BASE') or None
+GEMINI_API_ENDPOINT = os.getenv('GEMINI_API_ENDPOINT') or None
+REQUESTS_PER_MINUTE = {
+    'openai': float(os.getenv('OPENAI_RPM', 500)),
+    'gemini': float(os.getenv('GEMINI_RPM', 15)),
+}
+LLM_BURST = int(os.getenv('LLM_BURST', 5))
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 8))
+KEEPALIVE_SECONDS = 60
+SLOT_POLL_SECONDS = 0.01
+
+_LOCK = threading.RLock()
+_STATE = {'configured': False, 'loop': None}
+_AIO_SESSIONS = []
+_MODELS = {}
+_BUCKETS = {}
+_SLOTS = {}
+
+class RateLimited(Exception):
+    pass
+
+# Load .env and configure both providers, once per process
+def configure():
+    if _STATE['configured']:
+        return
+    with _LOCK:
+        if _STATE['configured']:
+            return
+        load_dotenv()
+        openai.api_key = os.getenv('OPENAI_API_KEY')
+        if OPENAI_API_BASE:
+            openai.api_base = OPENAI_API_BASE
+
+        # A REST endpoint (e.g. the stand-in server) instead of Google's gRPC one
+        options = {'transport': 'rest', 'client_options': {'api_endpoint': GEMINI_API_ENDPOINT}} if GEMINI_API_ENDPOINT else {}
+        genai.configure(api_key=os.getenv('GEMINI_API_KEY'), **options)
+        _STATE['configured'] = True
+
+# The event loop thread of the asynchronous requests
+def event_loop():
+    with _LOCK:
+        if _STATE['loop'] is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='llm-client-loop', daemon=True).start()
+            _STATE['loop'] = loop
+    return _STATE['loop']
+
+# The aiohttp session of the event loop thread, only called on that thread
+def aio_session():
+    if not _AIO_SESSIONS or _AIO_SESSIONS[0].closed:
+        connector = aiohttp.TCPConnector(limit=2 * LLM_MAX_CONCURRENCY, keepalive_timeout=KEEPALIVE_SECONDS)
+        _AIO_SESSIONS[:] = [aiohttp.ClientSession(connector=connector)]
+    return _AIO_SESSIONS[0]
+
+# Run a coroutine on the event loop thread with the pooled clients, returns a
+# concurrent.futures.Future
+def submit(coroutine):
+    configure()
+
+    async def pooled():
+        openai.aiosession.set(aio_session())
+        return await coroutine
+    return asyncio.run_coroutine_threadsafe(pooled(), event_loop())
+
+@atexit.register
+def _close():
+    if _STATE['loop'] is not None and _AIO_SESSIONS:
+        with contextlib.suppress(Exception):
+            asyncio.run_coroutine_threadsafe(_AIO_SESSIONS[0].close(), _STATE['loop']).result(1)
+
+# The shared GenerativeModel of a Gemini model
+def gemini_model(name):
+    configure()
+    with _LOCK:
+        model = _MODELS.get(name)
+        if model is None:
+            model = _MODELS[name] = genai.GenerativeModel(name)
+    return model
+
+class TokenBucket:
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Take a token, returns the seconds to wait before using it, or None (and
+    # takes nothing) when that would be longer than max_wait
+    def reserve(self, max_wait=None):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(1 - self.tokens, 0) / self.rate
+            if max_wait is not None and wait > max_wait:
+                return None
+            self.tokens -= 1
+            return wait
+
+# Bucket of a provider, model and API key
+def bucket(provider, model):
+    key_hash = hashlib.sha256((api_key(provider) or '').encode('utf-8')).hexdigest()[:16]
+    with _LOCK:
+        key = (provider, model, key_hash)
+        if key not in _BUCKETS:
+            _BUCKETS[key] = TokenBucket(REQUESTS_PER_MINUTE[provider] / 60, LLM_BURST)
+        return _BUCKETS[key]
+
+def api_key(provider):
+    return openai.api_key if provider == 'openai' else os.getenv('GEMINI_API_KEY')
+
+# Concurrency slots of a provider
+def slots(provider):
+    with _LOCK:
+        if provider not in _SLOTS:
+            _SLOTS[provider] = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+        return _SLOTS[provider]
+
+def _rate_limited(what, provider, model, timeout):
+    return RateLimited(f"No {provider} {model} {what} within {timeout:.1f}s")
+
+# Take a rate limit token within timeout seconds, in a coroutine. Every
+# attempt of a request takes one, outside its attempt timeout.
+async def take_token(provider, model, timeout):
+    configure()
+    wait = bucket(provider, model).reserve(timeout)
+    if wait is None:
+        raise _rate_limited('rate limit token', provider, model, timeout)
+    await asyncio.sleep(wait)
+
+# Hold a concurrency slot of provider, acquired within timeout seconds, in a
+# coroutine. A request holds it over all its attempts.
+@contextlib.asynccontextmanager
+async def slot(provider, model, timeout):
+    configure()
+    deadline = time.monotonic() + timeout
+    semaphore = slots(provider)
+    while not semaphore.acquire(blocking=False):
+        if time.monotonic() >= deadline:
+            raise _rate_limited('request slot', provider, model, timeout)
+        await asyncio.sleep(SLOT_POLL_SECONDS)
+    try:
+        yield
+    finally:
+        semaphore.release()
@@ -2,150 +2,175 @@ import numpy as np
 import streamlit as st
 import pandas as pd
 
+import func_cache
+import func_labels
+import func_query
+
+TOURIST_VARIABLES = ['no_tourist_all', 'no_tourist_foreign', 'no_tourist_thai']
+REVENUE_VARIABLES = ['revenue_all', 'revenue_foreign', 'revenue_thai']
+
+# The functions below take either the long DataFrame or the tourism store and
+# are lazy queries (func_query), the optimiser decides how they run: with
+# PREPROCESSING_BACKEND=sql as indexed SQL (func_sql), with the store from the
+# pre-aggregated rollup cube and the top-K ranking engine, otherwise as one
+# pandas filter and groupby.
+
+# Rows of the given variables
+def query_variables(data, variables):
+    return func_query.scan(data).filter('variable', variables).collect()
+
 def query_tourist_data(data):
-    query_data = data[(data["variable"] == "no_tourist_all") | (data["variable"] == "no_tourist_foreign") | (data["variable"] == "no_tourist_thai")]
+    query_data = query_variables(data, TOURIST_VARIABLES)
     return query_data
 
 def query_revenue_date(data):
-    query_data = data[(data["variable"] == "revenue_all") | (data["variable"] == "revenue_foreign") | (data["variable"] == "revenue_thai")]
+    query_data = query_variables(data, REVENUE_VARIABLES)
     return query_data
 
-def sum_value_by_region(data):
-    regional_data = data.groupby(['region_eng','variable']).agg({
-        'value': 'sum'
-    }).reset_index()
+# Query of the sum of value per key column and variable, optionally only for
+# the given variables
+def sum_value_query(data, key_column, variables=None):
+    query = func_query.scan(data)
+    if variables is not None:
+        query = query.filter('variable', variables)
+    return query.aggregate([key_column, 'variable'], {'value': 'sum'})
+
+@func_cache.memoize
+def sum_value_by_region(data, variables=None):
+    regional_data = sum_value_query(data, 'region_eng', variables).collect()
     return regional_data
 
-def sum_value_by_province(data):
-    regional_data = data.groupby(['province_eng','variable']).agg({
-        'value': 'sum'
-    }).reset_index()
+@func_cache.memoize
+def sum_value_by_province(data, variables=None):
+    regional_data = sum_value_query(data, 'province_eng', variables).collect()
     return regional_data
 
 # Preprocess data for regional aggregation
+@func_cache.memoize
 def sum_by_region(data):
-    regional_data = data.groupby('region_eng').agg({
+    regional_data = func_query.scan(data).aggregate(['region_eng'], {
         'no_tourist_all': 'sum',
         'no_tourist_foreign': 'sum',
         'no_tourist_thai': 'sum',
         'revenue_all': 'sum',
         'revenue_foreign': 'sum',
         'revenue_thai': 'sum'
-    }).reset_index()
+    }).collect()
     return regional_data
 
 def add_display_region_column(data):
     # Change region name to be display name
-    data["display_region"] = np.where(data['region_eng'] == "central","Central", data['region_eng'])
-    data["display_region"] = np.where(data['region_eng'] == "east","East", data['display_region'])
-    data["display_region"] = np.where(data['region_eng'] == "east_northeast","Northeast", data['display_region'])
-    data["display_region"] = np.where(data['region_eng'] == "north","North", data['display_region'])
-    data["display_region"] = np.where(data['region_eng'] == "south","South", data['display_region'])
-    return data
+    return func_labels.attach(data, 'region_eng', display_region=func_labels.REGION_LABELS)
 
 def add_order_type_column(data):
-    data["order_type"] = np.where(data['variable'] == "revenue_all", 3, np.where(data['variable'] == "revenue_thai", 1, 2))
-    return data
+    return func_labels.attach(data, 'variable', order_type=func_labels.ORDER_TYPES)
 
 def add_display_tourist_variable_column(data):
-    data["display_variable"] = np.where(data['variable'] == "no_tourist_all", 'All tourists', np.where(data['variable'] == "no_tourist_thai", 'Thai tourists', 'Foreign tourists'))
-    return data
+    return func_labels.attach(data, 'variable', display_variable=func_labels.TOURIST_VARIABLE_LABELS)
 
 def add_display_revenue_variable_column(data):
-    data["display_variable"] = np.where(data['variable'] == "revenue_all", 'Revenue from all tourists', np.where(data['variable'] == "revenue_thai", 'Revenue from Thai tourists', 'Revenue from foreign tourists'))
-    return data
-
+    return func_labels.attach(data, 'variable', display_variable=func_labels.REVENUE_VARIABLE_LABELS)
+
+# Regional display table of the given variables from grouped region totals
+# (sum_value_by_region output), ordered by region and order type. Only the
+# selected total rows are labelled and the table is built in one go, the index
+# is the row position the table had when it was grouped on its own.
+def region_display_table(regional_data, variables, display_labels):
+    selected = np.flatnonzero(regional_data['variable'].isin(variables).to_numpy())
+    region = regional_data['region_eng'].iloc[selected]
+    region_labels = func_labels.label_arrays(region, display_region=func_labels.REGION_LABELS)
+    variable_labels = func_labels.label_arrays(regional_data['variable'].iloc[selected],
+                                               order_type=func_labels.ORDER_TYPES, display_variable=display_labels)
+
+    # Stable sort by region then order type, like sort_values(["region_eng","order_type"])
+    if isinstance(region.dtype, pd.CategoricalDtype):
+        region_key = region.cat.codes.to_numpy()
+    else:
+        region_key = np.unique(region.to_numpy(), return_inverse=True)[1]
+    order = np.lexsort((variable_labels['order_type'], region_key))
+
+    return pd.DataFrame({
+        'display_region': region_labels['display_region'][order],
+        'display_variable': variable_labels['display_variable'][order],
+        'value': regional_data['value'].to_numpy()[selected][order],
+    }, index=order)
+
+# Tourist and revenue tables of the regional view from one grouped reduction
+# over all six variables
+@func_cache.memoize
+def sum_by_region_tourist_revenue(data):
+    regional_data = sum_value_by_region(data, TOURIST_VARIABLES + REVENUE_VARIABLES)
+    tourist_data = region_display_table(regional_data, TOURIST_VARIABLES, func_labels.TOURIST_VARIABLE_LABELS)
+    revenue_data = region_display_table(regional_data, REVENUE_VARIABLES, func_labels.REVENUE_VARIABLE_LABELS)
+    return tourist_data, revenue_data
+
+@func_cache.memoize
 def sum_by_region_tourist(data):
 
-    query_data = query_tourist_data(data)
-    regional_data = sum_value_by_region(query_data)
-
-    regional_data = add_order_type_column(regional_data)
-    regional_data = add_display_tourist_variable_column(regional_data)
-
-    # Change region name to be display name
-    regional_data = add_display_region_column(regional_data)
-
-    regional_data = regional_data.sort_values(["region_eng","order_type"])
-
-    # Drop unnenessary columns
-    regional_data.drop(['variable','order_type','region_eng'],axis='columns', inplace=True)
-    
-    # Reorder column
-    regional_data = regional_data.loc[:, ['display_region', 'display_variable', 'value']]
-
-    return regional_data
+    regional_data = sum_value_by_region(data, TOURIST_VARIABLES)
+    return region_display_table(regional_data, TOURIST_VARIABLES, func_labels.TOURIST_VARIABLE_LABELS)
 
+@func_cache.memoize
 def sum_by_region_revenue(data):
 
-    query_data = query_revenue_date(data)
-    regional_data = sum_value_by_region(query_data)
-
-    regional_data = add_order_type_column(regional_data)
-    # regional_data["display_variable"] = np.where(regional_data['variable'] == "revenue_all", 'Revenue from all tourists', np.where(regional_data['variable'] == "revenue_thai", 'Revenue from Thai tourists', 'Revenue from foreign tourists'))
-    regional_data = add_display_revenue_variable_column(regional_data)
-
-    # Change region name to be display name
-    regional_data = add_display_region_column(regional_data)
-
-    regional_data = regional_data.sort_values(["region_eng","order_type"])
-
-    # Drop unnenessary columns
-    regional_data.drop(['variable','order_type','region_eng'],axis='columns', inplace=True)
-    
-    # Reorder column
-    regional_data = regional_data.loc[:, ['display_region', 'display_variable', 'value']]
-    
-    return regional_data
+    regional_data = sum_value_by_region(data, REVENUE_VARIABLES)
+    return region_display_table(regional_data, REVENUE_VARIABLES, func_labels.REVENUE_VARIABLE_LABELS)
 
 def sum_by_province_tourist(data):
 
-    query_data = query_tourist_data(data)
-    province_data = sum_value_by_province(query_data)
+    province_data = sum_value_by_province(data, TOURIST_VARIABLES)
     return province_data
 
 def sum_by_province_revenue(data):
 
-    query_data = query_revenue_date(data)
-    province_data = sum_value_by_province(query_data)
+    province_data = sum_value_by_province(data, REVENUE_VARIABLES)
     return province_data
 
+# Top provinces of one variable, same frame as
+# sum_value_by_province(data, [variable]).nlargest(top, 'value')
+def top_variable_query(data, variable, top):
+    return sum_value_query(data, 'province_eng', [variable]).top_k('value', top)
+
+@func_cache.memoize
+def top_variable_by_province(data, variable, top):
+    return top_variable_query(data, variable, top).collect()
+
 def sum_by_province_top_tourist(data,top):
-    query_data = data[(data["variable"] == "no_tourist_all")]
-    province_data = sum_value_by_province(query_data)
-    province_data = province_data.nlargest(top, 'value')
+    province_data = top_variable_by_province(data, "no_tourist_all", top)
     return province_data
 
 def sum_by_province_top_revenue(data,top):
 
-    query_data = data[(data["variable"] == "revenue_all")]
-    province_data = sum_value_by_province(query_data)
-    province_data = province_data.nlargest(top, 'value')
+    province_data = top_variable_by_province(data, "revenue_all", top)
     return province_data
 
 def melted_tourist_revenue(merged_data,key_column):
     melted_data = pd.melt(merged_data, id_vars=[key_column], var_name='variable', value_name='value')
     return melted_data
 
-def merge_province_by_top_tourist(data,top):
+# Top provinces by tourists with their tourist and revenue totals in the long
+# format
+@func_cache.memoize
+def melt_province_by_top_tourist(data,top):
 
     # Manipulate no tourist all data frame with top records
-    tourist_data = data[(data["variable"] == "no_tourist_all")]
-    tourist_data = sum_value_by_province(tourist_data)
-    tourist_data = tourist_data.nlargest(top, 'value')
-    tourist_data = tourist_data.rename(columns={'value':'no_tourist_all'})
-    tourist_data = tourist_data.drop(columns=['variable'])
+    tourist_query = top_variable_query(data, "no_tourist_all", top)
+    tourist_query = tourist_query.rename({'value':'no_tourist_all'}).drop(['variable'])
+
+    # Manipulate tourist all data frame, the join prunes it to the top provinces
+    # before the revenue is aggregated
+    revenue_query = sum_value_query(data, 'province_eng', ["revenue_all"])
+    revenue_query = revenue_query.rename({'value':'revenue_all'}).drop(['variable'])
 
-    # Manipulate tourist all data frame all records
-    revenue_data = data[(data["variable"] == "revenue_all")]
-    revenue_data = sum_value_by_province(revenue_data)
-    revenue_data = revenue_data.rename(columns={'value':'revenue_all'})
-    revenue_data = revenue_data.drop(columns=['variable'])
+    merged_query = tourist_query.join(revenue_query, on='province_eng', how='inner')
+    melted_data = merged_query.melt(['province_eng'], var_name='variable', value_name='value').collect()
+    return melted_data
+
+def merge_province_by_top_tourist(data,top):
 
-    merged_data = pd.merge(tourist_data, revenue_data, on='province_eng', how='inner')
-    melted_data = melted_tourist_revenue(merged_data,'province_eng')
+    melted_data = melt_province_by_top_tourist(data,top)
 
     st.write(melted_data)
-    melted_data["display_variable"] = np.where(melted_data['variable'] == "no_tourist_all", 'Tourist numbers', 'Revenue')
+    melted_data = func_labels.attach(melted_data, 'variable', display_variable=func_labels.PROVINCE_VARIABLE_LABELS)
 
     return melted_data
\ No newline at end of file
@@ -0,0 +1,348 @@
+import pandas as pd
+
+import func_ranking
+import func_rollup
+import func_sql
+import func_store
+
+# Lazy query plans over the tourism data.
+#
+# A query is a tree of plan nodes that is only run by collect(), e.g.
+#
+#   scan(data).filter('variable', ['revenue_all']) \
+#       .aggregate(['province_eng', 'variable'], {'value': 'sum'}) \
+#       .top_k('value', 10).collect()
+#
+# Before running, the plan is optimised:
+#   - predicate pushdown: filters move below renames and joins (on the join
+#     key), consecutive filters become one mask
+#   - join-side pruning: the bounded side of an inner join (e.g. a top-k) runs
+#     first and its keys filter the other side before it is aggregated
+#   - operator fusion: scan, filter and sum aggregate run as one grouped
+#     reduction (answered by the rollup cube, the SQL backend or one pandas
+#     groupby), a top-k over it by the ranking engine, consecutive renames and
+#     drops are one projection
+# The source can be the long DataFrame, the tourism store or a rollup cube.
+# Aggregates of metric columns (wide format) on a store use its wide view.
+
+class Scan:
+
+    def __init__(self, source):
+        self.source = source
+
+    def __str__(self):
+        return f"Scan({type(self.source).__name__})"
+
+# Keep the rows whose column is in the given values, for every column.
+# Filters created by join pruning only drop rows the join would drop, so they
+# may also move below an aggregate on the same key.
+class Filter:
+
+    def __init__(self, child, predicates, prune=False):
+        self.child = child
+        self.predicates = predicates
+        self.prune = prune
+
+    def __str__(self):
+        return f"Filter({', '.join(self.predicates)}{', prune' if self.prune else ''})"
+
+class Aggregate:
+
+    def __init__(self, child, keys, aggregations):
+        self.child = child
+        self.keys = list(keys)
+        self.aggregations = dict(aggregations)
+
+    def __str__(self):
+        return f"Aggregate({self.keys}, {self.aggregations})"
+
+class TopK:
+
+    def __init__(self, child, column, k):
+        self.child = child
+        self.column = column
+        self.k = k
+
+    def __str__(self):
+        return f"TopK({self.column}, {self.k})"
+
+# Drop columns, then rename the remaining ones
+class Project:
+
+    def __init__(self, child, drop=(), rename=None):
+        self.child = child
+        self.drop = list(drop)
+        self.rename = dict(rename or {})
+
+    def __str__(self):
+        return f"Project(drop={self.drop}, rename={self.rename})"
+
+class Join:
+
+    def __init__(self, left, right, on, how):
+        self.left = left
+        self.right = right
+        self.on = on
+        self.how = how
+
+    def __str__(self):
+        return f"Join({self.on}, {self.how})"
+
+class Melt:
+
+    def __init__(self, child, id_vars, var_name, value_name):
+        self.child = child
+        self.id_vars = list(id_vars)
+        self.var_name = var_name
+        self.value_name = value_name
+
+    def __str__(self):
+        return f"Melt({self.id_vars})"
+
+class Query:
+
+    def __init__(self, plan):
+        self.plan = plan
+
+    def filter(self, column, values):
+        return Query(Filter(self.plan, {column: list(values)}))
+
+    # Grouped reduction like groupby(keys).agg(aggregations).reset_index()
+    def aggregate(self, keys, aggregations):
+        return Query(Aggregate(self.plan, keys, aggregations))
+
+    # Rows with the k largest values of column, like nlargest(k, column)
+    def top_k(self, column, k):
+        return Query(TopK(self.plan, column, k))
+
+    def rename(self, columns):
+        return Query(Project(self.plan, rename=columns))
+
+    def drop(self, columns):
+        return Query(Project(self.plan, drop=columns))
+
+    def join(self, other, on, how='inner'):
+        return Query(Join(self.plan, other.plan, on, how))
+
+    def melt(self, id_vars, var_name='variable', value_name='value'):
+        return Query(Melt(self.plan, id_vars, var_name, value_name))
+
+    def optimised(self):
+        return optimise(self.plan)
+
+    # Optimised plan as an indented tree
+    def explain(self):
+        return '\n'.join(plan_lines(self.optimised(), 0))
+
+    def collect(self):
+        return execute(self.optimised())
+
+def scan(data):
+    return Query(Scan(data))
+
+def children(node):
+    if isinstance(node, Join):
+        return [node.left, node.right]
+    if isinstance(node, Scan):
+        return []
+    return [node.child]
+
+def plan_lines(node, depth):
+    lines = ['  ' * depth + str(node)]
+    for child in children(node):
+        lines += plan_lines(child, depth + 1)
+    return lines
+
+# Optimiser
+
+def optimise(node):
+    if isinstance(node, Filter):
+        return push_filter(node.predicates, node.prune, optimise(node.child))
+    if isinstance(node, Project):
+        child = optimise(node.child)
+        if isinstance(child, Project):
+            return compose_projects(child, node)
+        return Project(child, node.drop, node.rename)
+    if isinstance(node, Aggregate):
+        return Aggregate(optimise(node.child), node.keys, node.aggregations)
+    if isinstance(node, TopK):
+        return TopK(optimise(node.child), node.column, node.k)
+    if isinstance(node, Join):
+        return Join(optimise(node.left), optimise(node.right), node.on, node.how)
+    if isinstance(node, Melt):
+        return Melt(optimise(node.child), node.id_vars, node.var_name, node.value_name)
+    return node
+
+# Place a filter over an optimised child as deep as it can go
+def push_filter(predicates, prune, child):
+    if isinstance(child, Filter):
+        # Fuse into one filter, a column filtered twice keeps the common values
+        merged = dict(child.predicates)
+        for column, values in predicates.items():
+            if column in merged:
+                values = [value for value in merged[column] if value in set(values)]
+            merged[column] = values
+        return push_filter(merged, prune and child.prune, child.child)
+
+    if isinstance(child, Project):
+        source_names = {new: old for old, new in child.rename.items()}
+        mapped = {source_names.get(column, column): values for column, values in predicates.items()}
+        return Project(push_filter(mapped, prune, child.child), child.drop, child.rename)
+
+    if isinstance(child, Join) and child.on in predicates:
+        key_predicate = {child.on: predicates[child.on]}
+        rest = {column: values for column, values in predicates.items() if column != child.on}
+        join = Join(push_filter(key_predicate, prune, child.left), push_filter(key_predicate, prune, child.right), child.on, child.how)
+        return Filter(join, rest, prune) if rest else join
+
+    if isinstance(child, Aggregate) and prune and set(predicates) <= set(child.keys):
+        return Aggregate(push_filter(predicates, prune, child.child), child.keys, child.aggregations)
+
+    return Filter(child, predicates, prune)
+
+def compose_projects(first, second):
+    source_names = {new: old for old, new in first.rename.items()}
+    drop = first.drop + [source_names.get(column, column) for column in second.drop]
+    rename = {}
+    for old, new in first.rename.items():
+        if new not in second.drop:
+            rename[old] = second.rename.get(new, new)
+    for old, new in second.rename.items():
+        if old not in source_names:
+            rename[old] = new
+    return Project(first.child, drop, rename)
+
+# Execution
+
+# Unwrap Scan or Filter(Scan) into (source, predicates)
+def scan_predicates(node):
+    if isinstance(node, Filter) and isinstance(node.child, Scan):
+        return node.child.source, node.predicates
+    if isinstance(node, Scan):
+        return node.source, {}
+    return None, None
+
+def apply_predicates(data, predicates):
+    mask = None
+    for column, values in predicates.items():
+        column_mask = data[column].isin(values)
+        mask = column_mask if mask is None else mask & column_mask
+    return data if mask is None else data[mask]
+
+def execute(node):
+    if isinstance(node, Scan):
+        return rows_of(node.source)
+    if isinstance(node, Filter):
+        source, predicates = scan_predicates(node)
+        if source is not None:
+            return execute_filtered_scan(source, predicates)
+        return apply_predicates(execute(node.child), node.predicates)
+    if isinstance(node, Aggregate):
+        return execute_aggregate(node)
+    if isinstance(node, TopK):
+        return execute_top_k(node)
+    if isinstance(node, Project):
+        return execute(node.child).drop(columns=node.drop).rename(columns=node.rename)
+    if isinstance(node, Join):
+        return execute_join(node)
+    if isinstance(node, Melt):
+        return pd.melt(execute(node.child), id_vars=node.id_vars, var_name=node.var_name, value_name=node.value_name)
+    raise ValueError(f"Unknown plan node: {node}")
+
+# Rows of a source as a DataFrame. A store gives its wide view when the
+# columns include metric columns, its long view otherwise.
+def rows_of(source, columns=()):
+    if isinstance(source, func_store.TourismStore):
+        if set(columns) & set(source.metrics):
+            return source.wide_view()
+        return source.long_view()
+    if isinstance(source, pd.DataFrame):
+        return source
+    raise ValueError(f"{type(source).__name__} has no rows, only aggregates can be queried")
+
+def execute_filtered_scan(source, predicates):
+    backend = func_sql.as_sql(source)
+    if backend is not None and 'variable' in predicates:
+        rest = {column: values for column, values in predicates.items() if column != 'variable'}
+        return apply_predicates(backend.query(predicates['variable']), rest)
+    return apply_predicates(rows_of(source), predicates)
+
+# Key column of a fused sum aggregate over Scan or Filter(Scan), or None
+def fused_sum_key(node):
+    source, predicates = scan_predicates(node.child)
+    if source is None or node.aggregations != {'value': 'sum'} or len(node.keys) != 2 or node.keys[1] != 'variable':
+        return None
+    key = node.keys[0]
+    if key not in ('region_eng', 'province_eng') or not set(predicates) <= {'variable', key}:
+        return None
+    return key
+
+def execute_aggregate(node):
+    key = fused_sum_key(node)
+    if key is None:
+        source, predicates = scan_predicates(node.child)
+        columns = set(node.keys) | set(node.aggregations) | set(predicates or {})
+        if isinstance(source, func_store.TourismStore) and columns & set(source.metrics):
+            # Aggregates of metric columns run on the wide view of the store
+            data = apply_predicates(rows_of(source, columns), predicates)
+        else:
+            data = execute(node.child)
+        return data.groupby(node.keys, observed=True).agg(node.aggregations).reset_index()
+
+    source, predicates = scan_predicates(node.child)
+    variables = predicates.get('variable')
+    keys = predicates.get(key)
+
+    backend = func_sql.as_sql(source)
+    if backend is not None:
+        return backend.sum_value_by(key, variables, keys)
+
+    cube = func_rollup.as_rollup(source)
+    if cube is not None:
+        sum_value_by = cube.sum_value_by_region if key == 'region_eng' else cube.sum_value_by_province
+        data = sum_value_by(variables if variables is not None else cube.metrics)
+        if keys is not None:
+            data = data[data[key].isin(keys)].reset_index(drop=True)
+        return data
+
+    data = apply_predicates(rows_of(source), predicates)
+    return data.groupby(node.keys, observed=True).agg(node.aggregations).reset_index()
+
+def execute_top_k(node):
+    child = node.child
+    if isinstance(child, Aggregate) and node.column == 'value' and fused_sum_key(child) == 'province_eng':
+        source, predicates = scan_predicates(child.child)
+        variables = predicates.get('variable', [])
+        if len(variables) == 1 and 'province_eng' not in predicates:
+            variable = variables[0]
+            backend = func_sql.as_sql(source)
+            if backend is not None:
+                return backend.top_value_by_province(variable, node.k)
+
+            ranking = func_ranking.as_ranking(source)
+            if ranking is not None:
+                data = ranking.top_k(variable, node.k).rename(columns={variable: 'value'})
+                data.insert(1, 'variable', pd.Categorical([variable] * len(data), categories=ranking.index.metrics))
+                return data
+
+    return execute(child).nlargest(node.k, node.column)
+
+# Bounded plans (with a top-k) run first, their keys prune the other side
+def bounded(node):
+    return isinstance(node, TopK) or any(bounded(child) for child in children(node))
+
+def execute_join(node):
+    left, right = node.left, node.right
+    if node.how == 'inner' and bounded(right) and not bounded(left):
+        right_data = execute(right)
+        left_data = execute(optimise_pruned(left, node.on, right_data))
+    else:
+        left_data = execute(left)
+        if node.how in ('inner', 'left'):
+            right = optimise_pruned(right, node.on, left_data)
+        right_data = execute(right)
+    return pd.merge(left_data, right_data, on=node.on, how=node.how)
+
+def optimise_pruned(node, on, other_data):
+    keys = pd.unique(other_data[on].to_numpy()).tolist()
+    return push_filter({on: keys}, True, node)
@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+import func_rollup
+import func_store
+import func_timeindex
+
+# Top-K province ranking over the prefix-sum index.
+#
+# Province totals of any metric and time window come from the prefix-sum
+# index in O(provinces), the top K are then picked with a partial selection
+# (np.argpartition) instead of sorting every province. Derived metrics are
+# ratios of two window totals, e.g. revenue per tourist.
+
+DERIVED_METRICS = {
+    'revenue_per_tourist': ('revenue_all', 'no_tourist_all'),
+    'revenue_per_foreign_tourist': ('revenue_foreign', 'no_tourist_foreign'),
+    'revenue_per_thai_tourist': ('revenue_thai', 'no_tourist_thai'),
+}
+
+# Positions of the k largest values, largest first. Ties keep the lower
+# position first like DataFrame.nlargest(keep='first'), NaN never ranks.
+def top_k_positions(values, k):
+    values = np.where(np.isnan(values), -np.inf, values)
+    valid = np.count_nonzero(values > -np.inf)
+    k = min(k, valid)
+    if k <= 0:
+        return np.array([], dtype=np.intp)
+
+    # Every value tied with the k-th largest is a candidate so the tie break
+    # does not depend on the order argpartition leaves them in
+    threshold = values[np.argpartition(values, len(values) - k)[len(values) - k]]
+    candidates = np.flatnonzero(values >= threshold)
+    order = np.lexsort((candidates, -values[candidates]))
+    return candidates[order[:k]]
+
+class RankingEngine:
+
+    def __init__(self, index):
+        self.index = index
+        self.provinces = index.provinces
+
+    # The engine keeps no totals of its own, it stays valid as long as the
+    # prefix-sum index it reads was updated with the batch
+    def update(self, store, batch):
+        return store.current('prefix_index') is self.index
+
+    @property
+    def metrics(self):
+        return self.index.metrics + list(DERIVED_METRICS)
+
+    # Totals per province of a metric over a window -> array (provinces,)
+    def totals(self, metric, start=None, end=None):
+        if metric in DERIVED_METRICS:
+            numerator, denominator = self.index.range_sum(list(DERIVED_METRICS[metric]), start, end)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return np.where(denominator != 0, numerator / denominator, np.nan)
+        return self.index.range_sum([metric], start, end)[0]
+
+    # Top k provinces of a metric over a window, same frame as
+    # groupby('province_eng')[metric].sum().nlargest(k).reset_index()
+    # but indexed by province position like nlargest on the grouped frame
+    def top_k(self, metric, k, start=None, end=None):
+        totals = self.totals(metric, start, end)
+        positions = top_k_positions(totals, k)
+        return pd.DataFrame({
+            'province_eng': self.provinces['province_eng'].iloc[positions],
+            metric: totals[positions],
+        }, index=positions)
+
+    # Top k provinces of the window of `months` months that ends with `end`
+    # (default: the latest month in the data)
+    def rolling_top_k(self, metric, k, months=12, end=None):
+        end = pd.Period(self.index.dates.max(), freq='M') if end is None else pd.Period(func_rollup.period_end(end), freq='M')
+        return self.top_k(metric, k, end - (months - 1), end)
+
+    # One leaderboard per month: rank, province and value of the top k over
+    # the `months` months ending with that month. All window totals come from
+    # two slices of the prefix sums.
+    def rolling_leaderboards(self, metric, k, months=12):
+        index = self.index
+        periods = index.dates.to_period('M')
+        ends = periods.unique()[months - 1:]
+        if len(ends) == 0:
+            return pd.DataFrame(columns=['month', 'rank', 'province_eng', metric])
+
+        first = index.dates.searchsorted((ends - (months - 1)).start_time, side='left')
+        last = index.dates.searchsorted(ends.end_time, side='right')
+        if metric in DERIVED_METRICS:
+            rows = index.metric_indexer(list(DERIVED_METRICS[metric]))
+            windows = index.sums[rows][:, last, :] - index.sums[rows][:, first, :]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                windows = np.where(windows[1] != 0, windows[0] / windows[1], np.nan)
+        else:
+            row = index.metric_indexer([metric])[0]
+            windows = index.sums[row, last, :] - index.sums[row, first, :]
+
+        frames = []
+        for end, totals in zip(ends, windows):
+            positions = top_k_positions(totals, k)
+            frames.append(pd.DataFrame({
+                'month': str(end),
+                'rank': np.arange(1, len(positions) + 1),
+                'province_eng': self.provinces['province_eng'].iloc[positions].to_numpy(),
+                metric: totals[positions],
+            }))
+        return pd.concat(frames, ignore_index=True)
+
+# Return the ranking engine of the tourism store, built once per store
+# version, or None when data is a plain DataFrame
+def as_ranking(data):
+    if isinstance(data, RankingEngine):
+        return data
+    if isinstance(data, func_store.TourismStore):
+        return data.derived('ranking', lambda store: RankingEngine(func_timeindex.as_time_index(store)))
+    return None
@@ -0,0 +1,274 @@
+import numpy as np
+import pandas as pd
+
+import func_store
+
+# Pre-aggregated rollup cube of the tourism data.
+#
+# The cube keeps the sum and the count of every metric per month and province
+# (metric x month x province). Region totals are a small reduction over the
+# province axis and year or period totals a small reduction over the month
+# axis, so page aggregations no longer scan the row level data. Its size only
+# grows with the number of months, not with the number of rows per month.
+
+# Periods are given as a year (2022), a string pandas understands ('2022-07',
+# '2022Q3', '2022-07-15'), a Timestamp or a Period
+def as_period(value):
+    if isinstance(value, pd.Period):
+        return value
+    if isinstance(value, (int, np.integer)):
+        return pd.Period(year=int(value), freq='Y')
+    if isinstance(value, str):
+        return pd.Period(value)
+    return pd.Period(pd.Timestamp(value), freq='D')
+
+def period_start(value):
+    return as_period(value).start_time
+
+def period_end(value):
+    return as_period(value).end_time
+
+class RollupCube:
+
+    def __init__(self, provinces, months, metrics, sums, counts):
+        self.provinces = provinces.reset_index(drop=True)
+        self.months = pd.PeriodIndex(months, freq='M')
+        self.metrics = list(metrics)
+        self._sums = sums
+        self._counts = counts
+
+        # Yearly totals are kept next to the monthly ones so the yearly sums
+        # and recovery rates do not reduce the month axis on every query
+        years = self.months.year
+        self.years = np.unique(years)
+        year_codes = np.searchsorted(self.years, years)
+        self._year_sums = np.zeros((len(self.metrics), len(self.years), len(self.provinces)))
+        np.add.at(self._year_sums, (slice(None), year_codes), self.sums)
+
+    # Used part of the month buffers (metric x month x province)
+    @property
+    def sums(self):
+        return self._sums[:, :len(self.months), :]
+
+    @property
+    def counts(self):
+        return self._counts[:, :len(self.months), :]
+
+    @property
+    def year_sums(self):
+        return self._year_sums[:, :len(self.years), :]
+
+    # Cube without any data, filled with add_cells() e.g. by streaming ingestion
+    @classmethod
+    def empty(cls, metrics=()):
+        provinces = pd.DataFrame({name: pd.Categorical([]) for name in func_store.PROVINCE_COLUMNS})
+        shape = (len(metrics), 0, 0)
+        return cls(provinces, pd.PeriodIndex([], freq='M'), metrics, np.zeros(shape), np.zeros(shape, dtype=np.int64))
+
+    # Build the cube from a store, the dates of a store are sorted so every
+    # month is a contiguous run along the date axis
+    @classmethod
+    def from_store(cls, store):
+        periods = store.dates.to_period('M')
+        months, starts = np.unique(periods.asi8, return_index=True)
+        values = store.values
+        present = ~np.isnan(values)
+        if len(starts):
+            sums = np.add.reduceat(np.where(present, values, 0.0), starts, axis=1)
+            counts = np.add.reduceat(present.astype(np.int64), starts, axis=1)
+        else:
+            sums = np.zeros((len(store.metrics), 0, len(store.provinces)))
+            counts = np.zeros(sums.shape, dtype=np.int64)
+        return cls(store.provinces, pd.PeriodIndex.from_ordinals(months, freq='M'), store.metrics, sums, counts)
+
+    # Fold the cells of a store batch into the cube, the cost depends only on
+    # the size of the batch
+    def update(self, store, batch):
+        periods = store.dates[batch.date_codes].to_period('M')
+        return self.add(batch.metric_codes, periods, batch.province_codes, *batch.deltas())
+
+    # Add sums and counts of cells given by metric position, month and
+    # province position
+    def add(self, metric_codes, periods, province_codes, sums, counts):
+        periods = pd.PeriodIndex(periods, freq='M')
+        new_months = pd.PeriodIndex(periods.unique(), freq='M').difference(self.months).sort_values()
+        if len(new_months) and len(self.months) and new_months[0] < self.months[-1]:
+            # Months before the last one shift the month axis, only the cube
+            # (not the row level data) is copied
+            self._reindex_months(self.months.append(new_months).sort_values())
+        elif len(new_months):
+            needed = len(self.months) + len(new_months)
+            self._sums = func_store.grow_axis(self._sums, len(self.months), needed, 1, 0.0)
+            self._counts = func_store.grow_axis(self._counts, len(self.months), needed, 1, 0)
+            self.months = self.months.append(new_months)
+
+            new_years = np.setdiff1d(np.unique(new_months.year), self.years)
+            if len(new_years):
+                self._year_sums = func_store.grow_axis(self._year_sums, len(self.years), len(self.years) + len(new_years), 1, 0.0)
+                self.years = np.concatenate([self.years, new_years])
+
+        month_codes = self.months.get_indexer(periods)
+        year_codes = np.searchsorted(self.years, periods.year)
+        np.add.at(self._sums, (metric_codes, month_codes, province_codes), sums)
+        np.add.at(self._counts, (metric_codes, month_codes, province_codes), counts)
+        np.add.at(self._year_sums, (metric_codes, year_codes, province_codes), sums)
+        return True
+
+    # Add row level values given by metric names, dates and a frame with the
+    # PROVINCE_COLUMNS of every row. Metrics and provinces the cube has not
+    # seen yet are added to its axes.
+    def add_cells(self, metrics, dates, provinces, values):
+        metrics = np.asarray(metrics, dtype=str)
+        self._ensure_metrics(pd.unique(metrics))
+        metric_codes = pd.Index(self.metrics).get_indexer(metrics)
+        province_codes = self._ensure_provinces(provinces)
+
+        values = np.asarray(values, dtype=np.float64)
+        present = ~np.isnan(values)
+        periods = pd.DatetimeIndex(dates).to_period('M')
+        return self.add(metric_codes, periods, province_codes, np.where(present, values, 0.0), present.astype(np.int64))
+
+    def _ensure_metrics(self, metrics):
+        new_metrics = [metric for metric in metrics if metric not in self.metrics]
+        if new_metrics:
+            self.metrics += new_metrics
+            self._sums, self._counts, self._year_sums = [
+                np.concatenate([array, np.zeros((len(new_metrics),) + array.shape[1:], dtype=array.dtype)], axis=0)
+                for array in (self._sums, self._counts, self._year_sums)]
+
+    def _ensure_provinces(self, provinces):
+        names = provinces['province_eng'].astype(str).to_numpy()
+        known = pd.Index(self.provinces['province_eng'].astype(str))
+        unique_names, first_rows = np.unique(names, return_index=True)
+        new_rows = first_rows[known.get_indexer(unique_names) < 0]
+        if len(new_rows):
+            combined = pd.concat([self.provinces.astype(str), provinces.iloc[new_rows][func_store.PROVINCE_COLUMNS].astype(str)], ignore_index=True)
+            self.provinces = pd.DataFrame({name: pd.Categorical(combined[name], categories=sorted(combined[name].unique()))
+                                           for name in func_store.PROVINCE_COLUMNS})
+            self._sums, self._counts, self._year_sums = [
+                np.concatenate([array, np.zeros(array.shape[:2] + (len(new_rows),), dtype=array.dtype)], axis=2)
+                for array in (self._sums, self._counts, self._year_sums)]
+            known = pd.Index(self.provinces['province_eng'].astype(str))
+        return known.get_indexer(names)
+
+    def _reindex_months(self, months):
+        positions = months.get_indexer(self.months)
+        shape = (len(self.metrics), len(months), len(self.provinces))
+        sums, counts = np.zeros(shape), np.zeros(shape, dtype=np.int64)
+        sums[:, positions, :] = self.sums
+        counts[:, positions, :] = self.counts
+
+        years = np.unique(months.year)
+        year_sums = np.zeros((len(self.metrics), len(years), len(self.provinces)))
+        year_sums[:, np.searchsorted(years, self.years), :] = self.year_sums
+        self.months, self.years = months, years
+        self._sums, self._counts, self._year_sums = sums, counts, year_sums
+
+    @property
+    def regions(self):
+        return self.provinces['region_eng'].cat.categories
+
+    def metric_indexer(self, metrics):
+        return [self.metrics.index(metric) for metric in metrics]
+
+    # Month positions between start and end (inclusive), see as_period
+    def month_slice(self, start=None, end=None):
+        first = 0 if start is None else self.months.searchsorted(pd.Period(period_start(start), freq='M'), side='left')
+        last = len(self.months) if end is None else self.months.searchsorted(pd.Period(period_end(end), freq='M'), side='right')
+        return slice(first, last)
+
+    # Totals per metric and province -> array (metrics, provinces)
+    def province_totals(self, metrics, start=None, end=None):
+        return self.sums[self.metric_indexer(metrics), self.month_slice(start, end), :].sum(axis=1)
+
+    # Totals per metric and region -> array (metrics, regions)
+    def region_totals(self, metrics, start=None, end=None):
+        return self.province_totals(metrics, start, end) @ self.region_matrix()
+
+    # Totals per metric and year -> array (metrics, years)
+    def year_totals(self, metrics):
+        return self.year_sums[self.metric_indexer(metrics)].sum(axis=2)
+
+    # Totals per metric, year and region -> array (metrics, years, regions)
+    def year_region_totals(self, metrics):
+        return self.year_sums[self.metric_indexer(metrics)] @ self.region_matrix()
+
+    # Position of a year on the year axis, ValueError when it has no data
+    def year_index(self, year):
+        matches = np.flatnonzero(self.years == year)
+        if len(matches) == 0:
+            raise ValueError(f"No data for year {year}, years are {self.years.tolist()}")
+        return int(matches[0])
+
+    # Recovery rate (%) of a metric per region, year against base_year
+    def recovery_rates(self, metric, base_year, year):
+        totals = self.year_region_totals([metric])[0]
+        base = totals[self.year_index(base_year)]
+        current = totals[self.year_index(year)]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rates = np.where(base != 0, current / base * 100, np.nan)
+        return pd.Series(rates, index=self.regions.rename('region_eng'), name='Recovery Rate')
+
+    # One-hot province -> region matrix (provinces, regions)
+    def region_matrix(self):
+        codes = self.provinces['region_eng'].cat.codes.to_numpy()
+        matrix = np.zeros((len(codes), len(self.regions)))
+        matrix[np.arange(len(codes)), codes] = 1.0
+        return matrix
+
+    # Same frame as data.groupby(['region_eng','variable']).agg({'value':'sum'}).reset_index()
+    def sum_value_by_region(self, variables, start=None, end=None):
+        totals = self.region_totals(variables, start, end)
+        return self._long_frame('region_eng', self.provinces['region_eng'].dtype, np.arange(len(self.regions)), variables, totals)
+
+    # Same frame as data.groupby(['province_eng','variable']).agg({'value':'sum'}).reset_index()
+    def sum_value_by_province(self, variables, start=None, end=None):
+        totals = self.province_totals(variables, start, end)
+        return self._long_frame('province_eng', self.provinces['province_eng'].dtype, self.provinces['province_eng'].cat.codes.to_numpy(), variables, totals)
+
+    def _long_frame(self, key_column, key_dtype, key_codes, variables, totals):
+        # Rows sorted by key then variable name like a sorted groupby
+        order = np.argsort(key_codes, kind='stable')
+        variable_order = np.argsort(variables, kind='stable')
+        n_keys, n_variables = len(order), len(variables)
+        return pd.DataFrame({
+            key_column: pd.Categorical.from_codes(np.repeat(key_codes[order], n_variables), dtype=key_dtype),
+            'variable': pd.Categorical(np.tile(np.asarray(variables)[variable_order], n_keys), categories=sorted(self.metrics)),
+            'value': totals[variable_order][:, order].T.reshape(-1),
+        })
+
+    # Same frame as data.groupby('year').agg({metric: 'sum', ...}).reset_index()
+    def sum_by_year(self, metrics):
+        totals = self.year_totals(metrics)
+        data = pd.DataFrame({'year': self.years.astype(np.int32)})
+        for i, metric in enumerate(metrics):
+            data[metric] = totals[i]
+        return data
+
+    # Same frame as data.groupby('province_eng').agg({metric: 'sum', ...}).reset_index()
+    def sum_by_province(self, metrics, start=None, end=None):
+        totals = self.province_totals(metrics, start, end)
+        order = np.argsort(self.provinces['province_eng'].cat.codes.to_numpy(), kind='stable')
+        data = pd.DataFrame({'province_eng': self.provinces['province_eng'].iloc[order].reset_index(drop=True)})
+        for i, metric in enumerate(metrics):
+            data[metric] = totals[i][order]
+        return data
+
+    # Same frame as data.groupby(['year','region_eng'])[metric].sum().reset_index()
+    def sum_by_year_region(self, metric):
+        totals = self.year_region_totals([metric])[0]
+        n_years, n_regions = totals.shape
+        return pd.DataFrame({
+            'year': np.repeat(self.years.astype(np.int32), n_regions),
+            'region_eng': pd.Categorical.from_codes(np.tile(np.arange(n_regions), n_years), dtype=self.provinces['region_eng'].dtype),
+            metric: totals.reshape(-1),
+        })
+
+# Return the rollup cube behind data, built once per store version, or None
+# when data is a plain DataFrame
+def as_rollup(data):
+    if isinstance(data, RollupCube):
+        return data
+    if isinstance(data, func_store.TourismStore):
+        return data.derived('rollup', RollupCube.from_store)
+    return None
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# Typed columnar snapshots of the source CSV files.
+#
+# The first load of a CSV writes every column as a plain .npy file under
+# data/.snapshot/<file name>/<content hash>/ and later loads memory-map those
+# files instead of parsing the CSV again. Text columns are stored as integer
+# codes plus a fixed-width unicode category array so they can be mapped too.
+# A snapshot is reused while the source size and mtime are unchanged; when the
+# mtime moves the content hash decides whether the snapshot is still valid.
+
+SNAPSHOT_DIR_NAME = '.snapshot'
+SNAPSHOT_FORMAT_VERSION = 1
+META_FILE_NAME = 'meta.json'
+HASH_CHUNK_SIZE = 1 << 20
+
+def snapshot_root(file_path):
+    return os.path.join(os.path.dirname(os.path.abspath(file_path)), SNAPSHOT_DIR_NAME, os.path.basename(file_path))
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def read_meta(root):
+    try:
+        with open(os.path.join(root, META_FILE_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_meta(root, meta):
+    # Write to a temp file first so readers never see a half written meta file
+    tmp_path = os.path.join(root, f'{META_FILE_NAME}.{os.getpid()}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=1)
+    os.replace(tmp_path, os.path.join(root, META_FILE_NAME))
+
+def source_stat(file_path):
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+# Return the meta of a snapshot that still matches the source file or None
+def fresh_meta(file_path, root, reader_key):
+    meta = read_meta(root)
+    if meta is None or meta.get('format') != SNAPSHOT_FORMAT_VERSION or meta.get('reader') != reader_key:
+        return None, None
+
+    stat = source_stat(file_path)
+    if meta['source'] == stat:
+        return meta, None
+
+    # mtime or size changed, only the content hash can tell if the data did
+    sha256 = file_sha256(file_path)
+    if meta['sha256'] != sha256:
+        return None, sha256
+
+    meta['source'] = stat
+    try:
+        write_meta(root, meta)
+    except OSError:
+        pass
+    return meta, sha256
+
+def write_column(column_dir, index, series):
+    if isinstance(series.dtype, pd.CategoricalDtype) or not (series.dtype.kind in 'biufcmM'):
+        categorical = series.astype('category')
+        categories = np.asarray(categorical.cat.categories, dtype=str)
+        np.save(os.path.join(column_dir, f'{index}.codes.npy'), np.asarray(categorical.cat.codes))
+        np.save(os.path.join(column_dir, f'{index}.categories.npy'), categories)
+        return {'name': series.name, 'kind': 'categorical', 'dtype': str(series.dtype),
+                'ordered': bool(getattr(series.dtype, 'ordered', False))}
+
+    np.save(os.path.join(column_dir, f'{index}.npy'), series.to_numpy())
+    return {'name': series.name, 'kind': 'array', 'dtype': str(series.dtype)}
+
+def read_column(column_dir, index, column):
+    if column['kind'] == 'categorical':
+        codes = np.load(os.path.join(column_dir, f'{index}.codes.npy'), mmap_mode='r').view(np.ndarray)
+        categories = np.load(os.path.join(column_dir, f'{index}.categories.npy'))
+        values = pd.Categorical.from_codes(codes, categories=categories, ordered=column['ordered'])
+        if column['dtype'] != 'category':
+            values = pd.Series(values).astype(column['dtype']).array
+        return values
+
+    # A plain ndarray view keeps the mapping without leaking np.memmap into pandas
+    return np.load(os.path.join(column_dir, f'{index}.npy'), mmap_mode='r').view(np.ndarray)
+
+def write_snapshot(data, file_path, root, reader_key, sha256):
+    column_dir = os.path.join(root, sha256[:16])
+    tmp_dir = f'{column_dir}.{os.getpid()}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    columns = [write_column(tmp_dir, index, data[name]) for index, name in enumerate(data.columns)]
+
+    shutil.rmtree(column_dir, ignore_errors=True)
+    os.replace(tmp_dir, column_dir)
+
+    write_meta(root, {
+        'format': SNAPSHOT_FORMAT_VERSION,
+        'reader': reader_key,
+        'source': source_stat(file_path),
+        'sha256': sha256,
+        'rows': len(data),
+        'columns': columns,
+    })
+
+    # Remove snapshots of older versions of the source file
+    for entry in os.listdir(root):
+        path = os.path.join(root, entry)
+        if os.path.isdir(path) and path != column_dir and not entry.endswith('.tmp'):
+            shutil.rmtree(path, ignore_errors=True)
+
+def read_snapshot(root, meta):
+    column_dir = os.path.join(root, meta['sha256'][:16])
+    columns = {column['name']: read_column(column_dir, index, column) for index, column in enumerate(meta['columns'])}
+    return pd.DataFrame(columns, copy=False)
+
+# Load a CSV file through its snapshot, parsing it with reader only when the
+# snapshot is missing or stale. reader_key identifies how the file is parsed so
+# a change of reader (e.g. a new schema) also invalidates the snapshot.
+def load_snapshot(file_path, reader, reader_key='read_csv'):
+    root = snapshot_root(file_path)
+    meta, sha256 = fresh_meta(file_path, root, reader_key)
+    if meta is not None:
+        try:
+            return read_snapshot(root, meta)
+        except (OSError, ValueError, KeyError):
+            pass
+
+    data = reader(file_path)
+    try:
+        os.makedirs(root, exist_ok=True)
+        write_snapshot(data, file_path, root, reader_key, sha256 or file_sha256(file_path))
+    except OSError as e:
+        # A read only data directory just means no snapshot
+        print(e)
+    return data
+
+# Remove the snapshot of a CSV file so the next load parses it again
+def clear_snapshot(file_path):
+    shutil.rmtree(snapshot_root(file_path), ignore_errors=True)
@@ -0,0 +1,145 @@
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+import func_common
+import func_dataset
+import func_store
+
+# Embedded SQL execution backend for the func_preprocessing API.
+#
+# The long (variable/value) tourism data is loaded once into an in-memory
+# SQLite table with an index on (variable, region_eng, province_eng, date) and
+# one on (variable, province_eng), so filtering on variable is an index seek
+# instead of a boolean mask over the whole frame. One database is shared by all
+# Streamlit sessions of the process. Results come back as DataFrames with the
+# same columns, dtypes, row order and index as the pandas path.
+#
+# Select the backend with PREPROCESSING_BACKEND=sql (see func_common).
+
+TABLE_NAME = 'tourism'
+LONG_COLUMNS = ['date', 'province_thai', 'province_eng', 'region_thai', 'region_eng', 'variable', 'value']
+
+class SqlBackend:
+
+    def __init__(self, data):
+        missing = [name for name in LONG_COLUMNS if name not in data.columns]
+        if missing:
+            raise ValueError(f"Missing columns: {missing}")
+
+        self.index = data.index
+        self.dtypes = data.dtypes.to_dict()
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(':memory:', check_same_thread=False)
+        self._load(data)
+
+    @classmethod
+    def from_store(cls, store):
+        return cls(store.long_view())
+
+    def _load(self, data):
+        # Dates are stored as int64 nanoseconds, names as text
+        columns = {'row': np.arange(len(data), dtype=np.int64)}
+        for name in LONG_COLUMNS:
+            values = data[name]
+            if values.dtype.kind == 'M':
+                columns[name] = values.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+            elif values.dtype.kind in 'iuf':
+                columns[name] = values.to_numpy()
+            else:
+                columns[name] = values.astype(str).to_numpy(dtype=object)
+
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute(f"CREATE TABLE {TABLE_NAME} (row INTEGER PRIMARY KEY, date, province_thai TEXT, province_eng TEXT, "
+                           "region_thai TEXT, region_eng TEXT, variable TEXT, value REAL)")
+            cursor.executemany(f"INSERT INTO {TABLE_NAME} VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                               zip(*(columns[name].tolist() for name in ['row'] + LONG_COLUMNS)))
+            cursor.execute(f"CREATE INDEX {TABLE_NAME}_variable_region ON {TABLE_NAME} (variable, region_eng, province_eng, date)")
+            cursor.execute(f"CREATE INDEX {TABLE_NAME}_variable_province ON {TABLE_NAME} (variable, province_eng)")
+            self.connection.commit()
+
+    def execute(self, sql, params=()):
+        with self.lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    # Cast result columns back to the dtypes of the source frame
+    def _frame(self, rows, columns):
+        data = pd.DataFrame.from_records(rows, columns=columns)
+        for name in columns:
+            dtype = self.dtypes.get(name)
+            if dtype is None:
+                continue
+            if dtype.kind == 'M':
+                data[name] = pd.to_datetime(data[name].to_numpy(dtype=np.int64)).astype(dtype)
+            elif isinstance(dtype, pd.CategoricalDtype):
+                data[name] = pd.Categorical(data[name], dtype=dtype)
+            else:
+                data[name] = data[name].astype(dtype)
+        return data
+
+    @staticmethod
+    def _in_clause(variables):
+        return ', '.join('?' * len(variables))
+
+    # Rows of the given variables, like data[data['variable'].isin(variables)]
+    def query(self, variables):
+        rows = self.execute(f"SELECT row, {', '.join(LONG_COLUMNS)} FROM {TABLE_NAME} "
+                            f"WHERE variable IN ({self._in_clause(variables)}) ORDER BY row", list(variables))
+        data = self._frame([row[1:] for row in rows], LONG_COLUMNS)
+        data.index = self.index[[row[0] for row in rows]]
+        return data
+
+    # Sum of value per key column and variable, like
+    # data.groupby([key_column, 'variable']).agg({'value': 'sum'}).reset_index()
+    # optionally only for the given variables and key values
+    def sum_value_by(self, key_column, variables=None, keys=None):
+        conditions, params = [], []
+        if variables is not None:
+            conditions.append(f"variable IN ({self._in_clause(variables)})")
+            params += list(variables)
+        if keys is not None:
+            conditions.append(f"{key_column} IN ({self._in_clause(keys)})")
+            params += [str(key) for key in keys]
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        rows = self.execute(f"SELECT {key_column}, variable, TOTAL(value) FROM {TABLE_NAME} {where} "
+                            f"GROUP BY {key_column}, variable ORDER BY {key_column}, variable", params)
+        return self._frame(rows, [key_column, 'variable', 'value'])
+
+    def sum_value_by_region(self, variables=None):
+        return self.sum_value_by('region_eng', variables)
+
+    def sum_value_by_province(self, variables=None):
+        return self.sum_value_by('province_eng', variables)
+
+    # Top provinces of one variable, like
+    # sum_value_by_province(variable).nlargest(top, 'value') including the
+    # index labels (position of the province in the grouped result)
+    def top_value_by_province(self, variable, top):
+        rows = self.execute(f"SELECT position, province_eng, variable, value FROM ("
+                            f"SELECT province_eng, variable, TOTAL(value) AS value, "
+                            f"ROW_NUMBER() OVER (ORDER BY province_eng) - 1 AS position "
+                            f"FROM {TABLE_NAME} WHERE variable = ? GROUP BY province_eng, variable) "
+                            f"ORDER BY value DESC, position LIMIT ?", [variable, int(top)])
+        data = self._frame([row[1:] for row in rows], ['province_eng', 'variable', 'value'])
+        data.index = [row[0] for row in rows]
+        return data
+
+_FRAME_BACKENDS = {}
+
+# Return the SQL backend of data when the sql backend is configured, or None.
+# Stores get one database per version, DataFrames one per frame object (the
+# frame is expected not to change while it is in use, like a Streamlit cache).
+def as_sql(data):
+    if func_common.PREPROCESSING_BACKEND != 'sql':
+        return None
+    if isinstance(data, SqlBackend):
+        return data
+    if isinstance(data, func_store.TourismStore):
+        return data.derived('sql', SqlBackend.from_store)
+    if not isinstance(data, pd.DataFrame) or 'variable' not in data.columns:
+        return None
+
+    return func_dataset.cached_per_frame(_FRAME_BACKENDS, data, SqlBackend)
@@ -0,0 +1,323 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import func_common
+
+# Canonical in-memory store of the Thailand domestic tourism data.
+#
+# Every fact is kept once in a single float64 array with the axes
+# metric x date x province. Because the metric axis is the outermost one:
+#   - the long view (variable/value) uses values.reshape(-1) as value column
+#   - the wide view (one column per metric) uses values.reshape(M, -1).T
+# and both are views of the same memory, so the two never disagree.
+# Missing facts are NaN, which pandas sums skip like absent rows.
+#
+# New months are added with append(). The values live in a buffer with spare
+# room along the date axis, so appending copies only the new batch, and the
+# derived aggregates (rollup cube, prefix-sum index, ...) are updated from the
+# batch instead of being rebuilt. Rows that replace known months are kept as
+# pending corrections and written into a copy of the buffer on the next read
+# of the values, so views taken before the append never change and the append
+# itself costs only the batch; the copy is made once per read after
+# corrections, not per correction. While the buffer has spare room the long
+# view has to copy the value column, the wide view stays a view.
+
+PROVINCE_COLUMNS = ['province_thai', 'province_eng', 'region_thai', 'region_eng']
+# Bound of the date axis in the keys of pending corrections
+MAX_DATES = 2 ** 31
+METRIC_COLUMNS = ['no_tourist_all', 'no_tourist_foreign', 'no_tourist_stay', 'no_tourist_thai',
+                  'ratio_tourist_stay', 'revenue_all', 'revenue_foreign', 'revenue_thai']
+
+# Return buffer with room for `needed` entries along axis, growing the
+# capacity geometrically so repeated appends copy each entry O(1) times
+def grow_axis(buffer, used, needed, axis, fill):
+    if needed <= buffer.shape[axis]:
+        return buffer
+
+    shape = list(buffer.shape)
+    shape[axis] = max(needed, 2 * buffer.shape[axis], 8)
+    grown = np.full(shape, fill, dtype=buffer.dtype)
+    index = [slice(None)] * buffer.ndim
+    index[axis] = slice(0, used)
+    grown[tuple(index)] = buffer[tuple(index)]
+    return grown
+
+# Cells changed by an append: metric, date and province positions of every
+# cell with its previous (NaN when absent) and new value. first_new_date is
+# the number of dates before the append, so date positions from there on are
+# new dates at the end of the axis.
+class StoreBatch:
+
+    def __init__(self, metric_codes, date_codes, province_codes, old_values, new_values, first_new_date):
+        self.metric_codes = metric_codes
+        self.date_codes = date_codes
+        self.province_codes = province_codes
+        self.old_values = old_values
+        self.new_values = new_values
+        self.first_new_date = first_new_date
+
+    @property
+    def appends_only(self):
+        return bool((self.date_codes >= self.first_new_date).all())
+
+    # Change of the sums and of the number of present values per cell
+    def deltas(self):
+        old_present = ~np.isnan(self.old_values)
+        new_present = ~np.isnan(self.new_values)
+        sums = np.where(new_present, self.new_values, 0.0) - np.where(old_present, self.old_values, 0.0)
+        counts = new_present.astype(np.int64) - old_present.astype(np.int64)
+        return sums, counts
+
+class TourismStore:
+
+    def __init__(self, provinces, dates, metrics, values):
+        # provinces: one row per province with the PROVINCE_COLUMNS categoricals
+        # dates: sorted DatetimeIndex, metrics: list of metric names
+        self.provinces = provinces.reset_index(drop=True)
+        self.dates = pd.DatetimeIndex(dates)
+        self.metrics = list(metrics)
+        self._buffer = values
+        # (cell keys, values) of corrections not yet written into the buffer
+        self._pending = None
+        self.version = 0
+        self._derived = {}
+
+    # Read only view of the used part of the buffer (metric x date x province)
+    @property
+    def values(self):
+        self._apply_pending()
+        values = self._buffer[:, :len(self.dates), :]
+        values.flags.writeable = False
+        return values
+
+    # Aggregates derived from the values (rollups, indexes, ...) are built on
+    # first use and rebuilt only when the version of the store changes
+    def derived(self, name, build):
+        entry = self._derived.get(name)
+        if entry is None or entry[0] != self.version:
+            entry = (self.version, build(self))
+            self._derived[name] = entry
+        return entry[1]
+
+    # Add a batch of rows in the long (variable/value) or wide format. New
+    # dates after the last one are appended, rows for known dates replace the
+    # previous values. Derived aggregates that implement update(store, batch)
+    # are updated from the batch, the others are rebuilt on next use.
+    def append(self, rows):
+        metric_codes, dates, province_codes, new_values = self._validate_rows(rows)
+
+        new_dates = pd.DatetimeIndex(dates.unique()).difference(self.dates).sort_values()
+        first_new_date = len(self.dates)
+        buffer = self._buffer
+        if len(new_dates) and len(self.dates) and new_dates[0] < self.dates[-1]:
+            # Dates in the middle of the axis shift every later date
+            self._insert_dates(new_dates)
+            first_new_date = 0
+        elif len(new_dates):
+            self._buffer = grow_axis(self._buffer, len(self.dates), len(self.dates) + len(new_dates), 1, np.nan)
+            self.dates = self.dates.append(new_dates)
+
+        # A new buffer (inserted or grown dates) is not seen by any view yet
+        if self._buffer is not buffer:
+            self._apply_pending(copy=False)
+
+        date_codes = self.dates.get_indexer(dates)
+        old_values = self._cell_values(metric_codes, date_codes, province_codes)
+        if first_new_date == 0:
+            old_values[:] = np.nan
+        # Replaced cells are visible to views taken before the append, they
+        # wait for the next read of the values (copy on write)
+        known = (date_codes < first_new_date) & (self._buffer is buffer)
+        self._buffer[metric_codes[~known], date_codes[~known], province_codes[~known]] = new_values[~known]
+        if known.any():
+            self._add_pending(metric_codes[known], date_codes[known], province_codes[known], new_values[known])
+
+        batch = StoreBatch(metric_codes, date_codes, province_codes, old_values, new_values, first_new_date)
+        self.version += 1
+        for name, (version, derived) in list(self._derived.items()):
+            update = getattr(derived, 'update', None)
+            if first_new_date > 0 and version == self.version - 1 and update is not None and update(self, batch):
+                self._derived[name] = (self.version, derived)
+            else:
+                del self._derived[name]
+        return batch
+
+    # Derived aggregate `name` if it is current, without building it
+    def current(self, name):
+        entry = self._derived.get(name)
+        if entry is not None and entry[0] == self.version:
+            return entry[1]
+        return None
+
+    def _cell_keys(self, metric_codes, date_codes, province_codes):
+        return np.ravel_multi_index((metric_codes, date_codes, province_codes), (len(self.metrics), MAX_DATES, len(self.provinces)))
+
+    # Current values of cells, pending corrections included
+    def _cell_values(self, metric_codes, date_codes, province_codes):
+        values = self._buffer[metric_codes, date_codes, province_codes]
+        if self._pending is not None:
+            keys, pending = self._pending
+            found = pd.Index(keys).get_indexer(self._cell_keys(metric_codes, date_codes, province_codes))
+            values = np.where(found >= 0, pending[found], values)
+        return values
+
+    def _add_pending(self, metric_codes, date_codes, province_codes, values):
+        keys = self._cell_keys(metric_codes, date_codes, province_codes)
+        if self._pending is not None:
+            keys = np.concatenate([self._pending[0], keys])
+            values = np.concatenate([self._pending[1], values])
+        last = ~pd.Index(keys).duplicated(keep='last')
+        self._pending = (keys[last], values[last])
+
+    # Write the pending corrections into a copy of the buffer, or into the
+    # buffer itself when no view has seen it
+    def _apply_pending(self, copy=True):
+        if self._pending is None:
+            return
+        keys, values = self._pending
+        buffer = self._buffer.copy() if copy else self._buffer
+        buffer[np.unravel_index(keys, (len(self.metrics), MAX_DATES, len(self.provinces)))] = values
+        self._buffer = buffer
+        self._pending = None
+
+    def _insert_dates(self, new_dates):
+        dates = self.dates.append(new_dates).sort_values()
+        values = np.full((len(self.metrics), len(dates), len(self.provinces)), np.nan)
+        values[:, dates.get_indexer(self.dates), :] = self.values
+        self._buffer = values
+        self.dates = dates
+
+    # Validate rows against the CSV schema and return the store positions of
+    # every value, the last row wins when a cell appears twice
+    def _validate_rows(self, rows):
+        if 'variable' in rows.columns:
+            rows = func_common.apply_schema(rows, func_common.SCHEMA_TH_DOMESTIC_TOUR_ORG)
+            date_column = 'date'
+        else:
+            # Ratios stay float64 in the store, the id column is not kept
+            schema = {name: dtype for name, dtype in func_common.SCHEMA_TH_DOMESTIC_TOUR.items() if name in ['travel_date'] + PROVINCE_COLUMNS or name in rows.columns}
+            schema.pop('id', None)
+            schema['ratio_tourist_stay'] = 'float64'
+            rows = func_common.apply_schema(rows, schema)
+            metrics = [name for name in self.metrics if name in rows.columns]
+            rows = rows.melt(id_vars=['travel_date'] + PROVINCE_COLUMNS, value_vars=metrics, var_name='variable', value_name='value')
+            date_column = 'travel_date'
+
+        metric_codes = pd.Index(self.metrics).get_indexer(rows['variable'].astype(str))
+        if (metric_codes < 0).any():
+            raise ValueError(f"Unknown variables: {sorted(set(rows['variable'].astype(str)[metric_codes < 0]))}")
+
+        province_codes = self.provinces['province_eng'].cat.categories.get_indexer(rows['province_eng'].astype(str))
+        if (province_codes < 0).any():
+            raise ValueError(f"Unknown provinces: {sorted(set(rows['province_eng'].astype(str)[province_codes < 0]))}")
+
+        regions = self.provinces['region_eng'].astype(str).to_numpy()[province_codes]
+        if (regions != rows['region_eng'].astype(str).to_numpy()).any():
+            raise ValueError("Rows do not match the region of their province")
+
+        cells = pd.DataFrame({'m': metric_codes, 'd': rows[date_column].to_numpy(), 'p': province_codes})
+        last = ~cells.duplicated(keep='last').to_numpy()
+        return metric_codes[last], pd.DatetimeIndex(rows[date_column].to_numpy()[last]), province_codes[last], rows['value'].to_numpy(dtype=np.float64)[last]
+
+    @property
+    def shape(self):
+        return len(self.metrics), len(self.dates), len(self.provinces)
+
+    def metric_index(self, metric):
+        return self.metrics.index(metric)
+
+    def province_index(self, province_eng):
+        return self.provinces['province_eng'].cat.categories.get_loc(province_eng)
+
+    # Per row key columns of a view where rows run date-major, province-minor
+    def _key_columns(self, repeat_dates, tile_all):
+        n_dates, n_provinces = len(self.dates), len(self.provinces)
+        province_codes = np.tile(np.arange(n_provinces), n_dates * tile_all)
+        columns = {}
+        for name in PROVINCE_COLUMNS:
+            column = self.provinces[name]
+            columns[name] = pd.Categorical.from_codes(column.cat.codes.to_numpy()[province_codes], dtype=column.dtype)
+        dates = np.repeat(self.dates.to_numpy(), n_provinces)
+        return (np.tile(dates, tile_all) if repeat_dates else dates), columns
+
+    # Long format view with the columns of thailand_domestic_tourism_original.csv
+    def long_view(self):
+        n_metrics, n_dates, n_provinces = self.values.shape
+        dates, columns = self._key_columns(True, n_metrics)
+
+        data = pd.DataFrame({'value': self.values.reshape(-1)}, copy=False)
+        data.insert(0, 'variable', pd.Categorical.from_codes(np.repeat(np.arange(n_metrics, dtype=np.int8), n_dates * n_provinces), categories=self.metrics))
+        for name in reversed(PROVINCE_COLUMNS):
+            data.insert(0, name, columns[name])
+        data.insert(0, 'date', dates)
+        return data
+
+    # Wide format view with the columns of thailand_domestic_tourism.csv
+    def wide_view(self):
+        n_metrics = self.values.shape[0]
+        dates, columns = self._key_columns(False, 1)
+
+        data = pd.DataFrame(self.values.reshape(n_metrics, -1).T, columns=self.metrics, copy=False)
+        for name in reversed(PROVINCE_COLUMNS):
+            data.insert(0, name, columns[name])
+        data.insert(0, 'travel_date', dates)
+        return data
+
+    # Build a store from a DataFrame in the wide format
+    @classmethod
+    def from_wide(cls, data, date_column='travel_date'):
+        metrics = [name for name in METRIC_COLUMNS if name in data.columns]
+        provinces, dates, date_codes, province_codes = cls._axes(data, date_column)
+
+        values = np.full((len(metrics), len(dates), len(provinces)), np.nan)
+        for m, metric in enumerate(metrics):
+            values[m, date_codes, province_codes] = data[metric].to_numpy(dtype=np.float64)
+        return cls(provinces, dates, metrics, values)
+
+    # Build a store from a DataFrame in the long (variable/value) format
+    @classmethod
+    def from_long(cls, data, date_column='date'):
+        variable = data['variable'].astype('category')
+        metrics = [name for name in METRIC_COLUMNS if name in variable.cat.categories]
+        metrics += [name for name in variable.cat.categories if name not in metrics]
+        provinces, dates, date_codes, province_codes = cls._axes(data, date_column)
+
+        values = np.full((len(metrics), len(dates), len(provinces)), np.nan)
+        values[pd.Index(metrics).get_indexer(variable), date_codes, province_codes] = data['value'].to_numpy(dtype=np.float64)
+        return cls(provinces, dates, metrics, values)
+
+    # Date and province axes of a frame plus the axis position of every row
+    @staticmethod
+    def _axes(data, date_column):
+        dates = pd.to_datetime(data[date_column])
+        date_axis = pd.DatetimeIndex(dates.unique()).sort_values()
+
+        province = data['province_eng'].astype('category').cat.remove_unused_categories()
+        province_codes = province.cat.codes.to_numpy()
+        first_rows = np.unique(province_codes, return_index=True)[1]
+        provinces = pd.DataFrame({name: data[name].iloc[first_rows].astype('category').cat.remove_unused_categories()
+                                  for name in PROVINCE_COLUMNS})
+        return provinces, date_axis, date_axis.get_indexer(dates), province_codes
+
+_STORE_CACHE = {}
+
+# Load the store once per process and reload it only when the CSV file changes
+# The long original file is the source since its value column keeps the ratios
+# in float64, the wide schema narrows them to float32.
+def load_domestic_tourist_store(file_path=func_common.CSV_FILE_PATH_TH_DOMESTIC_TOUR_ORG):
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    store = _STORE_CACHE.get(key)
+    if store is None:
+        store = TourismStore.from_long(func_common.load_csv(file_path, func_common.SCHEMA_TH_DOMESTIC_TOUR_ORG))
+        _STORE_CACHE.clear()
+        _STORE_CACHE[key] = store
+    return store
+
+# Append a batch of new rows to the process wide store, see TourismStore.append
+def append_domestic_tourist_rows(rows):
+    store = load_domestic_tourist_store()
+    store.append(rows)
+    return store
@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import func_common
+import func_rollup
+import func_store
+
+# Bounded-memory streaming ingestion of large source files.
+#
+# The file is read chunk by chunk and every chunk is folded into a rollup
+# cube (metric x month x province sums and counts), then dropped. Peak memory
+# is one chunk plus the cube, whatever the number of rows in the file. The
+# cube answers the func_preprocessing sum_by_* functions and the insights and
+# forecast aggregations like the tourism store does.
+#
+# Both formats are accepted: the long (date, ..., variable, value) format of
+# thailand_domestic_tourism_original.csv and the wide format of
+# thailand_domestic_tourism.csv, where every numeric column is a metric.
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+def read_header(file_path):
+    return pd.read_csv(file_path, nrows=0).columns.tolist()
+
+# Split a long chunk into metric names, dates, province columns and values
+def long_chunk_cells(chunk):
+    chunk = func_common.apply_schema(chunk, func_common.SCHEMA_TH_DOMESTIC_TOUR_ORG)
+    return chunk['variable'].astype(str).to_numpy(), chunk['date'], chunk, chunk['value'].to_numpy(dtype=np.float64)
+
+def wide_chunk_cells(chunk):
+    key_columns = ['travel_date'] + func_store.PROVINCE_COLUMNS
+    metrics = [name for name in chunk.columns if name not in key_columns and name != 'id']
+    schema = {name: dtype for name, dtype in func_common.SCHEMA_TH_DOMESTIC_TOUR.items() if name in key_columns}
+    schema.update({name: 'float64' for name in metrics})
+    chunk = func_common.apply_schema(chunk, schema)
+
+    n_rows = len(chunk)
+    values = chunk[metrics].to_numpy(dtype=np.float64).T.reshape(-1)
+    row_positions = np.tile(np.arange(n_rows), len(metrics))
+    return (np.repeat(np.asarray(metrics, dtype=str), n_rows), chunk['travel_date'].iloc[row_positions],
+            chunk.iloc[row_positions], values)
+
+# Stream a CSV file into a rollup cube
+# progress(rows, fraction) is called after every chunk with the number of rows
+# read so far and the fraction of the file consumed
+def stream_rollup(file_path, chunksize=DEFAULT_CHUNK_SIZE, progress=None):
+    columns = read_header(file_path)
+    chunk_cells = long_chunk_cells if 'variable' in columns else wide_chunk_cells
+    dtype = {name: 'str' for name in ['date', 'travel_date'] + func_store.PROVINCE_COLUMNS + ['variable'] if name in columns}
+
+    cube = func_rollup.RollupCube.empty()
+    size = os.path.getsize(file_path)
+    rows = 0
+    with open(file_path, 'rb') as f:
+        for chunk in pd.read_csv(f, chunksize=chunksize, dtype=dtype):
+            metrics, dates, provinces, values = chunk_cells(chunk)
+            cube.add_cells(metrics, dates, provinces, values)
+            rows += len(chunk)
+            if progress is not None:
+                progress(rows, min(f.tell() / size, 1.0) if size else 1.0)
+    return cube
+
+# Progress callback that drives a Streamlit progress bar
+def streamlit_progress(label):
+    import streamlit as st
+    bar = st.progress(0.0, text=label)
+
+    def progress(rows, fraction):
+        bar.progress(fraction, text=f"{label} ({rows:,} rows)")
+    return progress
+
+# Stream the Thailand domestic tourism original file
+def stream_domestic_tourist_org_rollup(chunksize=DEFAULT_CHUNK_SIZE, progress=None):
+    return stream_rollup(func_common.CSV_FILE_PATH_TH_DOMESTIC_TOUR_ORG, chunksize, progress)
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+
+import func_rollup
+import func_store
+
+# Prefix-sum index over the date axis of the tourism store.
+#
+# sums[m, d, p] holds the total of metric m for province p over the first d
+# dates (sums[:, 0, :] is zero), counts the number of present values. The sum
+# of any date range is then sums[:, end] - sums[:, start] and its mean the
+# same difference of sums divided by the difference of counts, so a range
+# query costs the same no matter how long the range or the history is.
+# Appending dates at the end extends the prefix rows from the last one, a
+# change to an existing date shifts every later row so the index is rebuilt.
+
+class PrefixSumIndex:
+
+    def __init__(self, provinces, dates, metrics, sums, counts):
+        self.provinces = provinces.reset_index(drop=True)
+        self.dates = pd.DatetimeIndex(dates)
+        self.metrics = list(metrics)
+        self._sums = sums
+        self._counts = counts
+
+    # Used part of the prefix buffers (metric x date + 1 x province)
+    @property
+    def sums(self):
+        return self._sums[:, :len(self.dates) + 1, :]
+
+    @property
+    def counts(self):
+        return self._counts[:, :len(self.dates) + 1, :]
+
+    @classmethod
+    def from_store(cls, store):
+        values = store.values
+        present = ~np.isnan(values)
+        shape = (values.shape[0], values.shape[1] + 1, values.shape[2])
+
+        sums = np.zeros(shape)
+        np.cumsum(np.where(present, values, 0.0), axis=1, out=sums[:, 1:, :])
+        counts = np.zeros(shape, dtype=np.int64)
+        np.cumsum(present, axis=1, out=counts[:, 1:, :])
+        return cls(store.provinces, store.dates, store.metrics, sums, counts)
+
+    # Extend the index with the dates a store batch appended
+    def update(self, store, batch):
+        if not batch.appends_only:
+            return False
+
+        first, last = len(self.dates), len(store.dates)
+        values = store.values[:, first:, :]
+        present = ~np.isnan(values)
+        self._sums = func_store.grow_axis(self._sums, first + 1, last + 1, 1, 0.0)
+        self._counts = func_store.grow_axis(self._counts, first + 1, last + 1, 1, 0)
+        self._sums[:, first + 1:last + 1, :] = self._sums[:, first:first + 1, :] + np.cumsum(np.where(present, values, 0.0), axis=1)
+        self._counts[:, first + 1:last + 1, :] = self._counts[:, first:first + 1, :] + np.cumsum(present, axis=1)
+        self.dates = store.dates
+        return True
+
+    def metric_indexer(self, metrics):
+        return [self.metrics.index(metric) for metric in metrics]
+
+    # Prefix positions of a date range, start and end are inclusive periods
+    # (see func_rollup.as_period), e.g. range_sum(m, '2022Q3', '2022Q3')
+    def date_bounds(self, start=None, end=None):
+        first = 0 if start is None else self.dates.searchsorted(func_rollup.period_start(start), side='left')
+        last = len(self.dates) if end is None else self.dates.searchsorted(func_rollup.period_end(end), side='right')
+        return first, max(first, last)
+
+    # Sums per metric and province over the range -> array (metrics, provinces)
+    def range_sum(self, metrics, start=None, end=None):
+        first, last = self.date_bounds(start, end)
+        rows = self.metric_indexer(metrics)
+        return self.sums[rows, last, :] - self.sums[rows, first, :]
+
+    # Number of present values per metric and province over the range
+    def range_count(self, metrics, start=None, end=None):
+        first, last = self.date_bounds(start, end)
+        rows = self.metric_indexer(metrics)
+        return self.counts[rows, last, :] - self.counts[rows, first, :]
+
+    # Means per metric and province over the range, NaN when nothing is present
+    def range_mean(self, metrics, start=None, end=None):
+        counts = self.range_count(metrics, start, end)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, self.range_sum(metrics, start, end) / counts, np.nan)
+
+    # Sums per metric and region over the range -> array (metrics, regions)
+    def region_range_sum(self, metrics, start=None, end=None):
+        codes = self.provinces['region_eng'].cat.codes.to_numpy()
+        totals = self.range_sum(metrics, start, end)
+        return np.stack([np.bincount(codes, weights=row, minlength=len(self.provinces['region_eng'].cat.categories)) for row in totals])
+
+    # Compare the totals of one metric over two ranges, e.g.
+    # compare_ranges('no_tourist_all', ('2019Q3', '2019Q3'), ('2022Q3', '2022Q3'))
+    def compare_ranges(self, metric, base_range, compare_range, by='region_eng'):
+        if by == 'region_eng':
+            base = self.region_range_sum([metric], *base_range)[0]
+            compare = self.region_range_sum([metric], *compare_range)[0]
+            keys = self.provinces['region_eng'].cat.categories
+        else:
+            base = self.range_sum([metric], *base_range)[0]
+            compare = self.range_sum([metric], *compare_range)[0]
+            keys = self.provinces[by]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            change = np.where(base != 0, (compare - base) / base * 100, np.nan)
+        return pd.DataFrame({by: np.asarray(keys), 'base': base, 'compare': compare, 'change_pct': change})
+
+# Return the prefix-sum index of the tourism store, built once per store
+# version, or None when data is a plain DataFrame
+def as_time_index(data):
+    if isinstance(data, PrefixSumIndex):
+        return data
+    if isinstance(data, func_store.TourismStore):
+        return data.derived('prefix_index', PrefixSumIndex.from_store)
+    return None
@@ -1,7 +1,12 @@
-import matplotlib.pyplot as plt
 import streamlit as st
-import seaborn as sns
-import matplotlib.ticker as ticker
+
+import func_common
+import func_figure
+
+# Plotting libraries are loaded on the first figure that is not in the figure
+# cache
+plt = func_common.lazy_import('matplotlib.pyplot')
+func_chart = func_common.lazy_import('func_chart')
 
 def billions_formatter(y, pos):
     # return f'{int(y/1e9)}B'
@@ -26,86 +31,44 @@ def plot_region_distribution_bak(data,dataheader,graphheader,xlabel,ylabel,xform
     # Display visualizations
     st.subheader(graphheader)
 
+    func_figure.show(draw_region_bar, data, xlabel=xlabel, ylabel=ylabel, xformat=xformat)
+
+def draw_region_bar(data,xlabel,ylabel,xformat = "million"):
+
     fig, axes = plt.subplots()
-    bar = sns.barplot(x='display_region', y='value', hue = "display_variable",data=data, ax=axes,palette="tab10")
-
-    bar.set(xlabel = xlabel, ylabel = ylabel)
-
-    if (xformat == "billion"):
-        plt.gca().yaxis.set_major_formatter(ticker.FuncFormatter(billions_formatter))
-        # Add labels to the bars with formatted numbers
-        for bar in axes.patches:
-            axes.text(
-                bar.get_x() + bar.get_width() / 2, # X-coordinate (center of the bar)
-                bar.get_height(),                  # Y-coordinate (top of the bar)
-                f'{int(bar.get_height()/1e9)}B',   # Format the number with commas
-                ha='center', va='bottom',          # Align the text
-                fontsize=7                         # Set font size for the label
-            )
-
-    else:
-        plt.gca().yaxis.set_major_formatter(ticker.FuncFormatter(millions_formatter))
-
-        # Add labels to the bars with formatted numbers
-        for bar in axes.patches:
-            axes.text(
-                bar.get_x() + bar.get_width() / 2, # X-coordinate (center of the bar)
-                bar.get_height(),                  # Y-coordinate (top of the bar)
-                f'{int(bar.get_height()/1e6)}M',   # Format the number with commas
-                ha='center', va='bottom',          # Align the text
-                fontsize=7                         # Set font size for the label
-            )
-
-    plt.legend(title='Legend')
 
-    plt.tight_layout()
-    st.pyplot(fig)
+    # Bars, bar labels and y axis ticks formatted in millions or billions
+    func_chart.bar_chart(axes, data, 'display_region', 'value', hue='display_variable', palette="tab10", unit=xformat)
+    axes.set(xlabel = xlabel, ylabel = ylabel)
+    axes.legend(title='Legend')
+
+    fig.tight_layout()
+    return fig
 
 # Plot function for tourists and revenue distribution by region
 def plot_region_distribution(data_tourist,data_revenue):
+    func_figure.show(draw_region_distribution, data_tourist, data_revenue)
 
-    fig, axes = plt.subplots(1, 2, figsize=(16, 6))
+def draw_region_distribution(data_tourist,data_revenue):
 
-    # bar = sns.barplot(x='display_region', y='value', hue = "display_variable",data=data, ax=axes,palette="tab10")
+    fig, axes = plt.subplots(1, 2, figsize=(16, 6))
 
-    # Plot total tourists by region
-    sns.barplot(x='display_region', y='value', hue = "display_variable",data=data_tourist, ax=axes[0], palette='tab10')
+    # Plot total tourists by region, bars labelled in millions
+    func_chart.bar_chart(axes[0], data_tourist, 'display_region', 'value', hue="display_variable", palette='tab10', unit='million')
     axes[0].set_title('Regional Distribution by Tourists')
     axes[0].set_ylabel('Total Tourists (Million)')
     axes[0].set_xlabel('Region')
     axes[0].legend(title="Legend")
-    axes[0].yaxis.set_major_formatter(ticker.FuncFormatter(millions_formatter))
-
-    # Add labels to the bars with formatted numbers
-    for bar in axes[0].patches:
-        axes[0].text(
-            bar.get_x() + bar.get_width() / 2, # X-coordinate (center of the bar)
-            bar.get_height(),                  # Y-coordinate (top of the bar)
-            f'{int(bar.get_height()/1e6)}M',   # Format the number with commas
-            ha='center', va='bottom',          # Align the text
-            fontsize=7                         # Set font size for the label
-        )
-
-    # Plot total revenue by region
-    sns.barplot(x='display_region', y='value', hue = "display_variable", data=data_revenue, ax=axes[1], palette='pastel')
+
+    # Plot total revenue by region, bars labelled in billions
+    func_chart.bar_chart(axes[1], data_revenue, 'display_region', 'value', hue="display_variable", palette='pastel', unit='billion')
     axes[1].set_title('Regional Distribution by Revenue')
     axes[1].set_ylabel('Total Revenue (Billion Baht)')
     axes[1].set_xlabel('Region')
     axes[1].legend(title="Legend")
-    axes[1].yaxis.set_major_formatter(ticker.FuncFormatter(billions_formatter))
-
-    # Add labels to the bars with formatted numbers
-    for bar in axes[1].patches:
-        axes[1].text(
-            bar.get_x() + bar.get_width() / 2,          # X-coordinate (center of the bar)
-            bar.get_height(),                           # Y-coordinate (top of the bar)
-            "{:,}B".format(int(bar.get_height()/1e9)),  # Format the number with commas
-            ha='center', va='bottom',                   # Align the text
-            fontsize=7                                  # Set font size for the label
-        )
 
     plt.tight_layout()
-    st.pyplot(fig)
+    return fig
 
 # Plot function for tourists and revenue distribution by province
 def plot_province_distribution(data_tourist,data_revenue):
@@ -118,49 +81,26 @@ def plot_province_distribution(data_tourist,data_revenue):
         
         st.write(data_tourist)
 
-        # Create a bar plot using Seaborn
-        fig, ax = plt.subplots(figsize=(12, 6))
-        sns.barplot(x='province_eng', y='value', data=data_tourist, ax=ax,color="blue")
-        ax.set_xticklabels(ax.get_xticklabels(), rotation=45, ha='right')
-        ax.set_ylabel('Tourist Numbers')
-        ax.set_title('Top 10 Provinces by Tourist Numbers')
-        ax.yaxis.set_major_formatter(ticker.FuncFormatter(millions_formatter))
-
-        # Add labels to the bars with formatted numbers
-        for bar in ax.patches:
-            ax.text(
-                bar.get_x() + bar.get_width() / 2, # X-coordinate (center of the bar)
-                bar.get_height(),                  # Y-coordinate (top of the bar)
-                f'{int(bar.get_height()/1e6)}M',   # Format the number with commas
-                ha='center', va='bottom',          # Align the text
-                fontsize=7                         # Set font size for the label
-            )
-        
         # Display the plot
-        st.pyplot(fig)
+        func_figure.show(draw_province_bar, data_tourist, color="blue", ylabel='Tourist Numbers',
+                         title='Top 10 Provinces by Tourist Numbers', xformat="million")
 
     with tab2:
         st.header("Top 10 Provinces by Revenue")
 
         st.write(data_revenue)
         
-        # Create a bar plot using Seaborn
-        fig, ax = plt.subplots(figsize=(12, 6))
-        sns.barplot(x='province_eng', y='value', data=data_revenue, ax=ax,color="green")
-        ax.set_xticklabels(ax.get_xticklabels(), rotation=45, ha='right')
-        ax.set_ylabel('Revenue')
-        ax.set_title('Top 10 Provinces by Revenue')
-        ax.yaxis.set_major_formatter(ticker.FuncFormatter(billions_formatter))
-
-        # Add labels to the bars with formatted numbers
-        for bar in ax.patches:
-            ax.text(
-                bar.get_x() + bar.get_width() / 2,          # X-coordinate (center of the bar)
-                bar.get_height(),                           # Y-coordinate (top of the bar)
-                "{:,}B".format(int(bar.get_height()/1e9)),  # Format the number with commas
-                ha='center', va='bottom',                   # Align the text
-                fontsize=7                                  # Set font size for the label
-            )
-        
         # Display the plot
-        st.pyplot(fig)
\ No newline at end of file
+        func_figure.show(draw_province_bar, data_revenue, color="green", ylabel='Revenue',
+                         title='Top 10 Provinces by Revenue', xformat="billion")
+
+def draw_province_bar(data,color,ylabel,title,xformat = "million"):
+
+    # Bars, bar labels and y axis ticks formatted in millions or billions
+    fig, ax = plt.subplots(figsize=(12, 6))
+    func_chart.bar_chart(ax, data, 'province_eng', 'value', color=color, unit=xformat)
+    ax.set_xticklabels(ax.get_xticklabels(), rotation=45, ha='right')
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+
+    return fig
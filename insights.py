@@ -1,74 +1,161 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import matplotlib.ticker as ticker
 
+import func_cache
 import func_common
+import func_figure
+import func_dataset
+import func_downsample
+import func_ranking
+import func_rollup
+import func_timeindex
 
-def preprocessing_data(data):
-    data['travel_date'] = pd.to_datetime(data['travel_date'])
-    data['year'] = data['travel_date'].dt.year
-    return data
+# Plotting libraries are loaded on the first figure that is not in the figure
+# cache
+plt = func_common.lazy_import('matplotlib.pyplot')
+func_chart = func_common.lazy_import('func_chart')
 
-def insights_covid(data):
-    st.title("Covid Analysis Insights (2019-2023)")
+# The aggregations below take the wide DataFrame, the tourism store or a
+# rollup cube (e.g. from func_stream), with the store or a cube they are small
+# reductions of the rollup cube. The DataFrame is never modified, the year
+# column comes from its shared dataset (func_dataset)
 
-    data = preprocessing_data(data)
+@func_cache.memoize
+def sum_by_year(data):
+    cube = func_rollup.as_rollup(data)
+    if cube is not None:
+        return cube.sum_by_year(['no_tourist_all', 'revenue_all'])
 
-    # Aggregate data by year
-    yearly_data = data.groupby('year').agg({
+    data = func_dataset.as_dataset(data).frame(['year', 'no_tourist_all', 'revenue_all'])
+    return data.groupby('year').agg({
         'no_tourist_all': 'sum',
         'revenue_all': 'sum'
     }).reset_index()
 
+@func_cache.memoize
+def get_latest_year(data):
+    cube = func_rollup.as_rollup(data)
+    if cube is not None:
+        return cube.years.max()
+    return func_dataset.as_dataset(data).column('year').max()
+
+@func_cache.memoize
+def top_provinces_by_tourist(data, year, top):
+    ranking = func_ranking.as_ranking(data)
+    if ranking is not None:
+        return ranking.top_k('no_tourist_all', top, year, year).reset_index(drop=True)
+
+    cube = func_rollup.as_rollup(data)
+    if cube is not None:
+        return cube.sum_by_province(['no_tourist_all'], year, year).nlargest(top, 'no_tourist_all').reset_index(drop=True)
+
+    data = func_dataset.as_dataset(data).frame(['year', 'province_eng', 'no_tourist_all'])
+    return data[data['year'] == year].groupby('province_eng', observed=True)['no_tourist_all'].sum().nlargest(top).reset_index()
+
+@func_cache.memoize
+def sum_by_year_region(data):
+    cube = func_rollup.as_rollup(data)
+    if cube is not None:
+        return cube.sum_by_year_region('no_tourist_all')
+
+    data = func_dataset.as_dataset(data).frame(['year', 'region_eng', 'no_tourist_all'])
+    return data.groupby(['year', 'region_eng'], observed=True)['no_tourist_all'].sum().reset_index()
+
+# Compare any two month ranges, every slider move is two prefix-sum lookups
+def compare_periods(index):
+    st.header("Period Comparison")
+    months = [str(month) for month in index.dates.to_period('M').unique()]
+
+    def default_range(first, last):
+        if first in months and last in months:
+            return (first, last)
+        return (months[0], months[-1])
+
+    col_base, col_compare = st.columns(2)
+    base_range = col_base.select_slider("Base period", options=months, value=default_range('2019-07', '2019-09'))
+    compare_range = col_compare.select_slider("Compare period", options=months, value=default_range('2022-07', '2022-09'))
+    metric = st.selectbox("Metric", ['no_tourist_all', 'revenue_all'])
+
+    comparison = index.compare_ranges(metric, base_range, compare_range)
+    st.write(comparison.rename(columns={
+        'base': f"{base_range[0]} - {base_range[1]}",
+        'compare': f"{compare_range[0]} - {compare_range[1]}",
+        'change_pct': 'Change (%)'
+    }))
+
+# Recovery rate of the tourist numbers per region, year against base_year
+@func_cache.memoize
+def recovery_rates(data, base_year, year):
+    cube = func_rollup.as_rollup(data)
+    if cube is not None:
+        recovery_data = cube.recovery_rates('no_tourist_all', base_year, year).reset_index()
+    else:
+        recovery_data = sum_by_year_region(data)
+        recovery_data = recovery_data.pivot(index='region_eng', columns='year', values='no_tourist_all').reset_index()
+        recovery_data['Recovery Rate'] = recovery_data[year] / recovery_data[base_year] * 100
+    return recovery_data.sort_values('Recovery Rate', ascending=False)
+
+# Figures of insights_covid, rendered through the figure cache (func_figure)
+def draw_yearly_trend(yearly_data, column, title, ylabel, unit, x_range=None):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    func_chart.line_chart(ax, yearly_data, 'year', column, unit=unit, x_range=x_range)
+    ax.set_title(title)
+    ax.set_ylabel(ylabel)
+    return fig
+
+def draw_top_provinces(top_provinces, year):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    func_chart.bar_chart(ax, top_provinces, 'province_eng', 'no_tourist_all', unit='million', label_bars=False)
+    ax.set_xticklabels(ax.get_xticklabels(), rotation=45, ha='right')
+    ax.set_title(f"Top 10 Provinces by Tourist Numbers in {year}")
+    ax.set_ylabel("Number of Tourists")
+    return fig
+
+def draw_recovery_rates(recovery_data, base_year, year):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    func_chart.bar_chart(ax, recovery_data, 'region_eng', 'Recovery Rate')
+    ax.set_xticklabels(ax.get_xticklabels(), rotation=45, ha='right')
+    ax.set_title(f"Tourism Recovery Rate by Region ({base_year} vs {year})")
+    ax.set_ylabel("Recovery Rate (%)")
+    ax.axhline(y=100, color='r', linestyle='--')
+    return fig
+
+def insights_covid(data):
+    st.title("Covid Analysis Insights (2019-2023)")
+
+    # Aggregate data by year
+    yearly_data = sum_by_year(data)
+
     # Visualizations
     st.header("Overall Trends")
 
-    # Tourist Numbers Trend
-    fig, ax = plt.subplots(figsize=(10, 6))
-    sns.lineplot(data=yearly_data, x='year', y='no_tourist_all', marker='o')
-    ax.set_title("Total Tourist Numbers by Year")
-    ax.set_ylabel("Number of Tourists (M:Million)")
-    ax.yaxis.set_major_formatter(ticker.FuncFormatter(func_common.millions_formatter))
+    # Zoom into a range of a long series (no slider for a few years)
+    x_range = func_downsample.zoom_range("Years", yearly_data['year'], key='insights_trend_range')
 
-    st.pyplot(fig)
+    # Tourist Numbers Trend
+    func_figure.show(draw_yearly_trend, yearly_data, column='no_tourist_all', title="Total Tourist Numbers by Year",
+                     ylabel="Number of Tourists (M:Million)", unit='million', x_range=x_range)
 
     # Revenue Trend
-    fig, ax = plt.subplots(figsize=(10, 6))
-    sns.lineplot(data=yearly_data, x='year', y='revenue_all', marker='o')
-    ax.set_title("Total Revenue by Year")
-    ax.set_ylabel("Revenue (Thai Baht)")
-    ax.yaxis.set_major_formatter(ticker.FuncFormatter(func_common.billions_formatter))
-    st.pyplot(fig)
+    func_figure.show(draw_yearly_trend, yearly_data, column='revenue_all', title="Total Revenue by Year",
+                     ylabel="Revenue (Thai Baht)", unit='billion', x_range=x_range)
 
     # Top 10 Provinces by Tourist Numbers in the Latest Year
     st.header("Top 10 Provinces by Tourist Numbers (Latest Year)")
-    latest_year = data['year'].max()
-    top_provinces = data[data['year'] == latest_year].groupby('province_eng')['no_tourist_all'].sum().nlargest(10).reset_index()
-    fig, ax = plt.subplots(figsize=(10, 6))
-    sns.barplot(data=top_provinces, x='province_eng', y='no_tourist_all')
-    ax.set_xticklabels(ax.get_xticklabels(), rotation=45, ha='right')
-    ax.set_title(f"Top 10 Provinces by Tourist Numbers in {latest_year}")
-    ax.set_ylabel("Number of Tourists")
-    ax.yaxis.set_major_formatter(ticker.FuncFormatter(func_common.millions_formatter))
-    st.pyplot(fig)
+    latest_year = get_latest_year(data)
+    top_provinces = top_provinces_by_tourist(data, latest_year, 10)
+    func_figure.show(draw_top_provinces, top_provinces, year=latest_year)
 
     # Recovery Rate Analysis
     st.header("Recovery Rate Analysis")
     base_year = 2019
-    recovery_data = data.groupby(['year', 'region_eng'])['no_tourist_all'].sum().reset_index()
-    recovery_data = recovery_data.pivot(index='region_eng', columns='year', values='no_tourist_all').reset_index()
-    recovery_data['Recovery Rate'] = recovery_data[latest_year] / recovery_data[base_year] * 100
-    recovery_data = recovery_data.sort_values('Recovery Rate', ascending=False)
+    recovery_data = recovery_rates(data, base_year, latest_year)
+    func_figure.show(draw_recovery_rates, recovery_data, base_year=base_year, year=latest_year)
 
-    fig, ax = plt.subplots(figsize=(10, 6))
-    sns.barplot(data=recovery_data, x='region_eng', y='Recovery Rate')
-    ax.set_xticklabels(ax.get_xticklabels(), rotation=45, ha='right')
-    ax.set_title(f"Tourism Recovery Rate by Region ({base_year} vs {latest_year})")
-    ax.set_ylabel("Recovery Rate (%)")
-    ax.axhline(y=100, color='r', linestyle='--')
-    st.pyplot(fig)
+    # Arbitrary date ranges need the prefix-sum index of the tourism store
+    index = func_timeindex.as_time_index(data)
+    if index is not None:
+        compare_periods(index)
 
     # Insights and Observations
     st.header("Key Insights")
@@ -1,52 +1,60 @@
+import importlib
+
 import streamlit as st
-from annotated_text import annotated_text
 
 import func_common
-import exploratory
-import forecast
-import insights
-import aiintegration
+import func_explorer
+import func_store
+
+# Pages are imported when they are opened, so a session that only looks at
+# the dataset never loads seaborn, statsmodels or openai
+PAGES = {
+    "Regional Distribution": ('exploratory', 'visualize_region'),
+    "Top Performing Provinces": ('exploratory', 'visualize_top_province'),
+    "Covid Analysis Insights (2019-2023)": ('insights', 'insights_covid'),
+    "Covid Recovery: Tourism Trends and Forecast": ('forecast', 'forecast_covid'),
+    "OpenAI Integration": ('aiintegration', 'integrate_openai'),
+}
+
+annotated_text = func_common.lazy_import('annotated_text')
+
+def show_page(page, data):
+    module_name, function_name = PAGES[page]
+    getattr(importlib.import_module(module_name), function_name)(data)
 
 # Main function to run the analysis and get insights from Gemini API
 def main():
 
-    # Load the CSV file
-    data = func_common.load_domestic_tourist_org_csv()
-    data_cleansing = func_common.load_domestic_tourist_csv()
+    # Load the data once into the canonical store, the pages aggregate from
+    # its rollup cube
+    store = func_store.load_domestic_tourist_store()
 
     with st.sidebar:
         st.title("Menu")
-        page = st.radio("", ["Dataset", "Regional Distribution", 
-                             "Top Performing Provinces","Covid Analysis Insights (2019-2023)", 
-                             "Covid Recovery: Tourism Trends and Forecast",
-                             "OpenAI Integration"])
+        page = st.radio("", ["Dataset"] + list(PAGES))
 
     match page:
         case "Dataset":
             # Set up the Streamlit app
             st.title('Thailand Domestic Tourism 2019-2022')
-            st.write(data)
+            # Filtered, sorted and paginated on the server, only the
+            # visible page is sent
+            func_explorer.explore_dataset(store)
             st.subheader("Insight")
-            annotated_text(
+            annotated_text.annotated_text(
                 ("Foreign vs. Domestic Tourists ","Dataset"), 
                 "The presence of separate columns for foreign and Thai tourists indicates the importance of both markets to Thailand's tourism indoustry.")
             
         case "Regional Distribution":
             st.title('Regional Distribution')
-            exploratory.visualize_region(data)
+            show_page(page, store)
 
         case "Top Performing Provinces":
             st.title('Top Performing Provinces')
-            exploratory.visualize_top_province(data)
-
-        case "Covid Analysis Insights (2019-2023)":
-            insights.insights_covid(data_cleansing)
-
-        case "Covid Recovery: Tourism Trends and Forecast":
-            forecast.forecast_covid(data_cleansing)
+            show_page(page, store)
 
-        case "OpenAI Integration":
-            aiintegration.integrate_openai(data_cleansing)
+        case _:
+            show_page(page, store)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,16 @@
+import func_cache
+import func_context
+
+# The key of a memoized function changes with the module constants of the
+# functions it calls, so disk entries of edited code are never used
+def test_code_fingerprint_covers_callee_constants(monkeypatch):
+    before = func_cache.code_fingerprint(func_context.build_context)
+    monkeypatch.setattr(func_context, 'TOP_PROVINCES', func_context.TOP_PROVINCES + 1)
+    monkeypatch.delitem(func_cache._CODE_FINGERPRINTS, func_context.build_context)
+    assert func_cache.code_fingerprint(func_context.build_context) != before
+
+def test_code_fingerprint_is_stable():
+    func_cache._CODE_FINGERPRINTS.pop(func_context.build_context, None)
+    first = func_cache.code_fingerprint(func_context.build_context)
+    func_cache._CODE_FINGERPRINTS.pop(func_context.build_context, None)
+    assert func_cache.code_fingerprint(func_context.build_context) == first
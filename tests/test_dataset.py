@@ -0,0 +1,18 @@
+import numpy as np
+import pandas as pd
+
+import func_common
+import func_dataset
+
+# Frames of a dataset reference its columns instead of copying them
+def test_frame_shares_dataset_columns():
+    dataset = func_dataset.as_dataset(pd.read_csv(func_common.CSV_FILE_PATH_TH_DOMESTIC_TOUR))
+    frame = dataset.frame(['no_tourist_all'], derived=['year'])
+
+    for name in ['no_tourist_all', 'year']:
+        assert np.shares_memory(frame[name].to_numpy(), dataset.column(name).to_numpy())
+
+    # Changing the frame copies the column and leaves the dataset alone
+    before = dataset.column('no_tourist_all').copy()
+    frame.loc[0, 'no_tourist_all'] = -1
+    assert dataset.column('no_tourist_all').equals(before)
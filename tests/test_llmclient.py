@@ -0,0 +1,148 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+import uuid
+
+import openai
+import pytest
+
+import func_llm
+import func_llmclient
+import func_llmpool
+
+# The client layer against the local stand-in server (example/llm_standin.py)
+
+STANDIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'example', 'llm_standin.py')
+ANSWER = "Stand-in answer: tourism in Thailand recovered strongly after 2021."
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+class Standin:
+
+    def __init__(self, *args):
+        self.port = free_port()
+        self.url = f'http://localhost:{self.port}'
+        self.process = subprocess.Popen([sys.executable, STANDIN, '--port', str(self.port), '--delay', '0.05', *args],
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for _ in range(100):
+            try:
+                self.requests()
+                return
+            except OSError:
+                time.sleep(0.1)
+        self.process.kill()
+        raise RuntimeError("Stand-in server did not start")
+
+    def requests(self):
+        with urllib.request.urlopen(f'{self.url}/standin/stats', timeout=1) as response:
+            return json.load(response)['requests']
+
+    def stop(self):
+        self.process.kill()
+        self.process.wait()
+
+@pytest.fixture
+def standin():
+    servers = []
+
+    def start(*args):
+        servers.append(Standin(*args))
+        return servers[-1]
+    yield start
+    for server in servers:
+        server.stop()
+
+# Point OpenAI at openai_server and Gemini at gemini_server, with short
+# timeouts and no rate limit waits
+@pytest.fixture
+def clients(monkeypatch):
+    def use(openai_server, gemini_server=None):
+        monkeypatch.setenv('OPENAI_API_KEY', 'test')
+        monkeypatch.setenv('GEMINI_API_KEY', 'test')
+        monkeypatch.setattr(func_llmpool, 'GEMINI_API_ENDPOINT', (gemini_server or openai_server).url)
+        monkeypatch.setitem(func_llmpool._STATE, 'configured', False)
+        monkeypatch.setattr(func_llmpool, '_MODELS', {})
+        monkeypatch.setattr(func_llmpool, '_BUCKETS', {})
+        monkeypatch.setitem(func_llmpool.REQUESTS_PER_MINUTE, 'gemini', 6000)
+        func_llmpool.configure()
+        monkeypatch.setattr(openai, 'api_base', f'{openai_server.url}/v1')
+        monkeypatch.setattr(func_llmclient, 'LLM_TIMEOUT', 3)
+        monkeypatch.setattr(func_llmclient, 'LLM_ATTEMPT_TIMEOUT', 1)
+        monkeypatch.setattr(func_llmclient, 'BACKOFF_BASE', 0.05)
+        monkeypatch.setattr(func_llmclient, 'HEDGE_DELAY', 0.3)
+    return use
+
+def unique_prompt():
+    return f"Question {uuid.uuid4()}"
+
+def test_answer(standin, clients):
+    clients(standin())
+    messages = [{'role': 'user', 'content': unique_prompt()}]
+    assert func_llmclient.run(func_llmclient.openai_chat(messages)) == ANSWER
+    assert func_llmclient.run(func_llmclient.gemini_chat(unique_prompt())) == ANSWER
+
+def test_deadline_bounds_hung_call(standin, clients):
+    server = standin('--hang-rate', '1')
+    clients(server)
+    started = time.monotonic()
+    with pytest.raises(func_llmclient.DeadlineExceeded):
+        func_llmclient.run(func_llmclient.openai_chat([{'role': 'user', 'content': unique_prompt()}]))
+    assert time.monotonic() - started < func_llmclient.LLM_TIMEOUT + 0.5
+    # Every attempt timed out and was retried
+    assert server.requests() > 1
+
+def test_server_errors_are_retried(standin, clients):
+    server = standin('--fail-first', '2')
+    clients(server)
+    assert func_llmclient.run(func_llmclient.openai_chat([{'role': 'user', 'content': unique_prompt()}])) == ANSWER
+    assert server.requests() == 3
+
+def test_hedge_takes_first_success(standin, clients):
+    clients(standin('--hang-rate', '1'), standin())
+    started = time.monotonic()
+    assert func_llmclient.run(func_llmclient.ask_first(unique_prompt())) == ANSWER
+    assert time.monotonic() - started < func_llmclient.LLM_TIMEOUT / 2
+
+def test_streams(standin, clients):
+    clients(standin())
+    assert ''.join(func_llm.stream_openai([{'role': 'user', 'content': unique_prompt()}])).strip() == ANSWER
+    assert ''.join(func_llm.stream_gemini(unique_prompt())) == ANSWER
+
+def test_stream_deadline_bounds_hung_stream(standin, clients):
+    clients(standin('--hang-rate', '1'))
+    started = time.monotonic()
+    with pytest.raises(func_llmclient.DeadlineExceeded):
+        ''.join(func_llm.stream_openai([{'role': 'user', 'content': unique_prompt()}]))
+    assert time.monotonic() - started < func_llmclient.LLM_TIMEOUT + 0.5
+
+def test_stream_retried_until_first_chunk(standin, clients):
+    server = standin('--fail-first', '2')
+    clients(server)
+    assert ''.join(func_llm.stream_openai([{'role': 'user', 'content': unique_prompt()}])).strip() == ANSWER
+    assert server.requests() == 3
+
+def test_hedged_stream_takes_first_provider(standin, clients):
+    clients(standin('--hang-rate', '1'), standin())
+    started = time.monotonic()
+    assert ''.join(func_llm.stream_first(unique_prompt())) == ANSWER
+    assert time.monotonic() - started < func_llmclient.LLM_TIMEOUT / 2
+
+def test_rate_limit_wait_outside_attempt_timeout(standin, clients, monkeypatch):
+    server = standin()
+    clients(server)
+    # One token, the next one 1.5s later: longer than an attempt, within the deadline
+    monkeypatch.setattr(func_llmpool, 'LLM_BURST', 1)
+    monkeypatch.setitem(func_llmpool.REQUESTS_PER_MINUTE, 'gemini', 40)
+    assert func_llmclient.run(func_llmclient.gemini_chat(unique_prompt())) == ANSWER
+    started = time.monotonic()
+    assert func_llmclient.run(func_llmclient.gemini_chat(unique_prompt())) == ANSWER
+    assert time.monotonic() - started > func_llmclient.LLM_ATTEMPT_TIMEOUT
+    # Neither request timed out and took another token on retry
+    assert server.requests() == 2
@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+
+import func_common
+import func_dataset
+import func_preprocessing
+import func_store
+
+# Aggregates of the wide metric columns give the same result on the store as
+# on the wide CSV frame
+def test_sum_by_region_of_store_matches_frame():
+    store = func_store.load_domestic_tourist_store()
+    frame = func_dataset.as_dataset(pd.read_csv(func_common.CSV_FILE_PATH_TH_DOMESTIC_TOUR)).frame()
+
+    from_store = func_preprocessing.sum_by_region(store)
+    from_frame = func_preprocessing.sum_by_region(frame)
+
+    assert list(from_store.columns) == list(from_frame.columns)
+    assert (from_store['region_eng'].astype(str) == from_frame['region_eng'].astype(str)).all()
+    np.testing.assert_allclose(from_store.drop(columns='region_eng').to_numpy(np.float64),
+                               from_frame.drop(columns='region_eng').to_numpy(np.float64))
@@ -0,0 +1,35 @@
+import numpy as np
+
+import func_common
+import func_store
+
+def load_store():
+    return func_store.TourismStore.from_long(func_common.load_csv(func_common.CSV_FILE_PATH_TH_DOMESTIC_TOUR_ORG, func_common.SCHEMA_TH_DOMESTIC_TOUR_ORG))
+
+# Rows of the last month in the long format, with every value increased by delta
+def last_month(store, delta):
+    rows = store.long_view()
+    rows = rows[rows['date'] == store.dates[-1]].copy()
+    rows['value'] = rows['value'] + delta
+    return rows
+
+# Corrections of known months leave earlier views alone and do not copy the
+# buffer in append, only on the next read of the values
+def test_correction_copies_on_read():
+    store = load_store()
+    view = store.wide_view()
+    before = view['no_tourist_all'].to_numpy().copy()
+    expected = store.values.copy()
+    expected[:, -1, :] += 3
+    first, second = last_month(store, 1), last_month(store, 3)
+    buffer = store._buffer
+
+    store.append(first)
+    batch = store.append(second)
+    assert store._buffer is buffer
+    # The second correction sees the first one as previous value
+    np.testing.assert_allclose(batch.new_values - batch.old_values, 2)
+
+    np.testing.assert_allclose(store.values, expected)
+    np.testing.assert_array_equal(view['no_tourist_all'].to_numpy(), before)
+    assert not np.shares_memory(store.values, view['no_tourist_all'].to_numpy())